@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -75,6 +76,9 @@ if 'PYTHONANYWHERE_DOMAIN' in os.environ:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Base de tests en archivo: la base en memoria no admite varias
+            # conexiones y los tests concurrentes se saltearían
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
 else:
@@ -89,6 +93,62 @@ else:
         }
     }
 
+# Caché compartida entre workers (ej. Redis o Memcached en producción).
+# Sin configurar, Django usa memoria local por proceso.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Segundos que vive en caché la lista de cuotas pendientes de cada alumno
+CUOTAS_PENDIENTES_CACHE_TIMEOUT = int(os.getenv('CUOTAS_PENDIENTES_CACHE_TIMEOUT', '300'))
+# Con la caché local por proceso (LocMemCache) la lista no se cachea, porque
+# la invalidación no llegaría a los otros workers. True la usa igual (un solo proceso).
+CUOTAS_PENDIENTES_CACHE_LOCAL = os.getenv('CUOTAS_PENDIENTES_CACHE_LOCAL', 'False') == 'True'
+
+# Cada cuántos segundos un worker revisa si cambió la versión de los catálogos
+CATALOGOS_INTERVALO_VERIFICACION = int(os.getenv('CATALOGOS_INTERVALO_VERIFICACION', '5'))
+
+# Segundos que una request espera a otra con la misma idempotency_key
+IDEMPOTENCIA_ESPERA_MAXIMA = int(os.getenv('IDEMPOTENCIA_ESPERA_MAXIMA', '5'))
+
+# Secretos compartidos con cada pasarela para firmar los webhooks (HMAC-SHA256)
+WEBHOOK_SECRETOS = {
+    'Pago Fácil': os.getenv('WEBHOOK_SECRETO_PAGO_FACIL', ''),
+    'Macro Click': os.getenv('WEBHOOK_SECRETO_MACRO_CLICK', ''),
+}
+
+# Registro de auditoría (SystemLog): se escribe en segundo plano, por lotes
+SYSTEMLOG_ASINCRONICO = os.getenv('SYSTEMLOG_ASINCRONICO', 'True') == 'True'
+SYSTEMLOG_TAMANIO_LOTE = int(os.getenv('SYSTEMLOG_TAMANIO_LOTE', '100'))
+SYSTEMLOG_INTERVALO = float(os.getenv('SYSTEMLOG_INTERVALO', '1.0'))
+SYSTEMLOG_CAPACIDAD = int(os.getenv('SYSTEMLOG_CAPACIDAD', '10000'))
+
+# Caché en disco de los PDF de cupones (ver cupones/pdf_cache.py)
+PDF_CACHE_DIR = os.getenv('PDF_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'cupones_pdf_cache'))
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+# Cada cuántos segundos se recorre el directorio aunque no se haya pasado el máximo
+PDF_CACHE_INTERVALO_DESALOJO = float(os.getenv('PDF_CACHE_INTERVALO_DESALOJO', '300'))
+# Segundos que el navegador puede reutilizar el PDF sin revalidar (luego usa el ETag)
+PDF_CACHE_MAX_AGE = int(os.getenv('PDF_CACHE_MAX_AGE', '3600'))
+
+# Pre-renderizado en segundo plano de los PDF recién generados (ver cupones/pdf_worker.py)
+# 'hilos', 'procesos' (esquivan el GIL de ReportLab) o 'no' para desactivarlo
+PDF_PRERENDER_MODO = os.getenv('PDF_PRERENDER_MODO', 'hilos')
+PDF_PRERENDER_WORKERS = int(os.getenv('PDF_PRERENDER_WORKERS', '2'))
+PDF_PRERENDER_MAX_PENDIENTES = int(os.getenv('PDF_PRERENDER_MAX_PENDIENTES', '500'))
+# Segundos que una descarga espera a un render en curso antes de dibujarlo ella misma
+PDF_PRERENDER_ESPERA = float(os.getenv('PDF_PRERENDER_ESPERA', '10'))
+
+# Exportación masiva de PDF de cupones (ver cupones/exportacion_pdf.py)
+# Procesos del pool que comparten todas las exportaciones de cada proceso web
+PDF_LOTE_WORKERS = int(os.getenv('PDF_LOTE_WORKERS', str(os.cpu_count() or 2)))
+PDF_LOTE_TAMANIO = int(os.getenv('PDF_LOTE_TAMANIO', '25')) # Cupones por tarea de cada proceso
+# Páginas máximas del PDF único (uno más grande cuesta abrirlo): más cupones van en ZIP
+PDF_LOTE_MAX_PAGINAS = int(os.getenv('PDF_LOTE_MAX_PAGINAS', '1000'))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
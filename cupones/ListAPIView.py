@@ -2,23 +2,26 @@ from rest_framework.generics import ListAPIView
 from rest_framework.permissions import IsAdminUser
 from .models import SystemLog
 from .serializers import SystemLogSerializer
-from rest_framework.filters import OrderingFilter
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination
 from django_filters.rest_framework import DjangoFilterBackend
 
 
-class LogsPagination(PageNumberPagination):
+class LogsPagination(CursorPagination):
+    """
+    Paginación por cursor sobre (timestamp, id): cada página es una búsqueda
+    por índice desde la última fila vista, sin OFFSET ni COUNT(*).
+    """
     page_size = 30
     page_size_query_param = 'page_size'
     max_page_size = 200
+    ordering = ('-timestamp', '-id')
 
 
 class SystemLogListAPI(ListAPIView):
     permission_classes = [IsAdminUser] 
     serializer_class = SystemLogSerializer
-    queryset = SystemLog.objects.all()
+    queryset = SystemLog.objects.select_related('user')
     pagination_class = LogsPagination
-    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filter_backends = [DjangoFilterBackend]
+    # Cada filtro tiene su índice compuesto con (timestamp, id)
     filterset_fields = ['user', 'action']
-    ordering_fields = ['timestamp']
-    ordering = ['-timestamp']
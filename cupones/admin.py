@@ -8,7 +8,10 @@ from .models import (
     Cuota, 
     CuponPago,
     Perfil,
+    EventoPasarela,
+    TasaRecargo,
 )
+from .catalogos import catalogos
 
 # --- Configuración Inline para Perfil ---
 class PerfilInline(admin.StackedInline):
@@ -43,13 +46,39 @@ class CustomUserAdmin(BaseUserAdmin):
 admin.site.unregister(User) # Des-registra el admin por defecto de User
 admin.site.register(User, CustomUserAdmin) # Registra User con tu admin extendido
 
+# --- Admin de Catálogos ---
+class CatalogoAdmin(admin.ModelAdmin):
+    """ Incrementa la versión de los catálogos en cada alta, edición o baja. """
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        catalogos.invalidar()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        catalogos.invalidar()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        catalogos.invalidar()
+
 # Registramos los modelos "Catálogo" para que el admin pueda
 # crear y editar los estados y pasarelas.
-admin.site.register(EstadoCuota)
-admin.site.register(EstadoCupon)
-admin.site.register(PasarelaPago)
+admin.site.register(EstadoCuota, CatalogoAdmin)
+admin.site.register(EstadoCupon, CatalogoAdmin)
+admin.site.register(PasarelaPago, CatalogoAdmin)
 
 # Registramos los modelos principales (luego los 
 # haremos más bonitos, por ahora solo los registramos)
 admin.site.register(Cuota)
 admin.site.register(CuponPago)
+admin.site.register(TasaRecargo)
+
+
+# --- Bandeja de webhooks (solo lectura de hecho: la escriben las pasarelas) ---
+@admin.register(EventoPasarela)
+class EventoPasarelaAdmin(admin.ModelAdmin):
+    list_display = ('evento_id', 'pasarela', 'tipo', 'estado', 'intentos', 'fecha_recepcion', 'fecha_procesado')
+    list_filter = ('estado', 'pasarela', 'tipo')
+    search_fields = ('evento_id',)
+    readonly_fields = ('pasarela', 'evento_id', 'tipo', 'payload', 'intentos', 'fecha_recepcion', 'fecha_procesado')
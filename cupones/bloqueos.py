@@ -0,0 +1,68 @@
+import os
+import socket
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import BloqueoTarea
+
+# --- BLOQUEOS DE TAREAS PROGRAMADAS ---
+# Garantizan que un comando corra una sola vez a la vez. El bloqueo vive en
+# la base (tabla BloqueoTarea), así sirve aunque los comandos se lancen desde
+# varios servidores. Vence solo si el proceso muere sin liberarlo; mientras
+# trabaja, el proceso debe renovarlo.
+
+DURACION_BLOQUEO = 600 # segundos
+
+
+class TareaEnCurso(Exception):
+    pass
+
+
+class Bloqueo:
+    def __init__(self, nombre, dueno, duracion):
+        self.nombre = nombre
+        self.dueno = dueno
+        self.duracion = duracion
+
+    def renovar(self):
+        """ Extiende el vencimiento. Lanza TareaEnCurso si otro proceso se quedó con el bloqueo. """
+        renovado = BloqueoTarea.objects.filter(nombre=self.nombre, dueno=self.dueno).update(
+            hasta=timezone.now() + timedelta(seconds=self.duracion)
+        )
+        if not renovado:
+            raise TareaEnCurso(f"Se perdió el bloqueo de la tarea '{self.nombre}'.")
+
+
+def _adquirir(nombre, dueno, duracion):
+    ahora = timezone.now()
+    hasta = ahora + timedelta(seconds=duracion)
+    # Si hay un bloqueo vencido (proceso muerto) se lo toma con un UPDATE condicional
+    if BloqueoTarea.objects.filter(nombre=nombre, hasta__lt=ahora).update(dueno=dueno, desde=ahora, hasta=hasta):
+        return True
+    try:
+        with transaction.atomic():
+            BloqueoTarea.objects.create(nombre=nombre, dueno=dueno, desde=ahora, hasta=hasta)
+        return True
+    except IntegrityError:
+        return False
+
+
+@contextmanager
+def bloqueo_tarea(nombre, duracion=DURACION_BLOQUEO):
+    """
+    Context manager que toma el bloqueo de la tarea 'nombre' o lanza
+    TareaEnCurso si otro proceso lo tiene. Devuelve un Bloqueo con renovar().
+    """
+    dueno = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'[:64]
+    if not _adquirir(nombre, dueno, duracion):
+        actual = BloqueoTarea.objects.filter(nombre=nombre).first()
+        detalle = f' (lo tiene {actual.dueno} hasta {actual.hasta:%Y-%m-%d %H:%M:%S})' if actual else ''
+        raise TareaEnCurso(f"La tarea '{nombre}' ya está en ejecución{detalle}.")
+    try:
+        yield Bloqueo(nombre, dueno, duracion)
+    finally:
+        BloqueoTarea.objects.filter(nombre=nombre, dueno=dueno).delete()
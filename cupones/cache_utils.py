@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+# --- CACHÉ DE LA LISTA DE CUOTAS PENDIENTES ---
+# Guarda, por alumno, el payload ya serializado de ListaCuotasPendientesAPI.
+# Se invalida desde las señales de models.py cada vez que cambia una
+# Cuota, un PagoParcial o un CuponPagoCuota del alumno.
+#
+# Solo se usa con una caché compartida entre workers (Redis, Memcached,
+# base de datos, archivos). Con LocMemCache cada worker tiene su propia
+# copia y la señal solo borra la del proceso que hizo el cambio: los demás
+# mostrarían cuotas viejas hasta CUOTAS_PENDIENTES_CACHE_TIMEOUT.
+# CUOTAS_PENDIENTES_CACHE_LOCAL = True la habilita igual (un solo proceso).
+
+BACKENDS_LOCALES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+PREFIJO_CUOTAS_PENDIENTES = 'cuotas_pendientes'
+CLAVE_HITS = f'{PREFIJO_CUOTAS_PENDIENTES}:hits'
+CLAVE_MISSES = f'{PREFIJO_CUOTAS_PENDIENTES}:misses'
+
+
+def clave_cuotas_pendientes(alumno_id):
+    return f'{PREFIJO_CUOTAS_PENDIENTES}:alumno:{alumno_id}'
+
+
+def cache_cuotas_pendientes_habilitada():
+    """ True si la caché es compartida entre workers (o se habilitó la local a mano). """
+    if getattr(settings, 'CUOTAS_PENDIENTES_CACHE_LOCAL', False):
+        return True
+    return settings.CACHES['default']['BACKEND'] not in BACKENDS_LOCALES
+
+
+def _incrementar(clave):
+    # cache.incr falla si la clave no existe; add() la inicializa sin pisar
+    # el valor que otro worker haya escrito mientras tanto.
+    cache.add(clave, 0, timeout=None)
+    try:
+        cache.incr(clave)
+    except ValueError:
+        # La clave expiró o fue desalojada entre el add() y el incr()
+        cache.set(clave, 1, timeout=None)
+
+
+def obtener_cuotas_pendientes(alumno_id):
+    """
+    Devuelve el payload cacheado del alumno o None si no está en caché
+    (o si la caché no está habilitada). Registra el hit/miss en los contadores.
+    """
+    if not cache_cuotas_pendientes_habilitada():
+        return None
+    data = cache.get(clave_cuotas_pendientes(alumno_id))
+    _incrementar(CLAVE_HITS if data is not None else CLAVE_MISSES)
+    return data
+
+
+def guardar_cuotas_pendientes(alumno_id, data):
+    if not cache_cuotas_pendientes_habilitada():
+        return
+    cache.set(
+        clave_cuotas_pendientes(alumno_id),
+        data,
+        timeout=getattr(settings, 'CUOTAS_PENDIENTES_CACHE_TIMEOUT', 300)
+    )
+
+
+def invalidar_cuotas_pendientes(*alumno_ids):
+    """
+    Borra el payload cacheado de los alumnos indicados.
+    Si hay una transacción abierta, se vuelve a borrar al confirmarla, para que
+    una lectura concurrente no deje cacheados los datos viejos.
+    """
+    claves = [clave_cuotas_pendientes(alumno_id) for alumno_id in set(alumno_ids) if alumno_id]
+    if claves:
+        cache.delete_many(claves)
+        transaction.on_commit(lambda: cache.delete_many(claves))
+
+
+def estadisticas_cache_cuotas_pendientes():
+    """ Devuelve los contadores de hits/misses y la tasa de aciertos. """
+    hits = cache.get(CLAVE_HITS, 0)
+    misses = cache.get(CLAVE_MISSES, 0)
+    total = hits + misses
+    return {
+        'habilitada': cache_cuotas_pendientes_habilitada(),
+        'hits': hits,
+        'misses': misses,
+        'tasa_aciertos': round(hits / total, 4) if total else None,
+    }
+
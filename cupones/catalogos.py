@@ -0,0 +1,137 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import EstadoCuota, EstadoCupon, PasarelaPago, CatalogoVersion
+
+
+class RegistroCatalogos:
+    """
+    Copia en memoria (una por worker) de las tablas catálogo: EstadoCuota,
+    EstadoCupon y PasarelaPago. Resuelve nombres (o IDs) a instancias sin
+    consultar la BD en cada request.
+
+    Para enterarse de los cambios hechos desde otros workers, compara cada
+    CATALOGOS_INTERVALO_VERIFICACION segundos su versión con la guardada en
+    CatalogoVersion, y recarga todo si cambió.
+
+    Las instancias devueltas son compartidas: se usan solo para leer o para
+    asignarlas a una ForeignKey, nunca se modifican.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._ultima_verificacion = 0.0
+        self._estados_cuota = {}
+        self._estados_cupon = {}
+        self._estados_cupon_por_id = {}
+        self._pasarelas = {}
+        self._pasarelas_por_id = {}
+
+    # --- Carga y verificación de versión ---
+
+    def _intervalo(self):
+        return getattr(settings, 'CATALOGOS_INTERVALO_VERIFICACION', 5)
+
+    def _vigente(self):
+        return (
+            self._version is not None
+            and time.monotonic() - self._ultima_verificacion < self._intervalo()
+        )
+
+    def _cargar(self):
+        estados_cupon = list(EstadoCupon.objects.order_by('id'))
+        pasarelas = list(PasarelaPago.objects.order_by('id'))
+        self._estados_cuota = {e.nombre: e for e in EstadoCuota.objects.order_by('id')}
+        self._estados_cupon = {e.nombre: e for e in estados_cupon}
+        self._estados_cupon_por_id = {e.id: e for e in estados_cupon}
+        self._pasarelas = {p.nombre: p for p in pasarelas}
+        self._pasarelas_por_id = {p.id: p for p in pasarelas}
+
+    def _asegurar_cargado(self):
+        if self._vigente():
+            return
+        with self._lock:
+            if self._vigente():
+                return
+            version = CatalogoVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+            if version != self._version:
+                self._cargar()
+            self._version = version
+            self._ultima_verificacion = time.monotonic()
+
+    def _descartar(self):
+        with self._lock:
+            self._version = None
+
+    def invalidar(self):
+        """
+        Incrementa la versión en la BD (para el resto de los workers) y
+        descarta la copia local. Se llama después de cada escritura sobre
+        un catálogo.
+        """
+        actualizadas = CatalogoVersion.objects.filter(pk=1).update(version=F('version') + 1)
+        if not actualizadas:
+            CatalogoVersion.objects.get_or_create(pk=1, defaults={'version': 1})
+        self._descartar()
+        # Se vuelve a descartar al confirmar, por si otro thread recargó
+        # antes de que la escritura fuera visible.
+        transaction.on_commit(self._descartar)
+
+    # --- Consultas ---
+
+    def estado_cuota(self, nombre):
+        """ Igual que EstadoCuota.objects.get(nombre=nombre), pero desde memoria. """
+        self._asegurar_cargado()
+        try:
+            return self._estados_cuota[nombre]
+        except KeyError:
+            raise EstadoCuota.DoesNotExist(f"EstadoCuota '{nombre}' no existe.")
+
+    def estados_cuota(self, *nombres):
+        """ Devuelve los estados de cuota existentes entre los nombres dados. """
+        self._asegurar_cargado()
+        return [self._estados_cuota[n] for n in nombres if n in self._estados_cuota]
+
+    def estado_cupon(self, nombre):
+        """ Igual que EstadoCupon.objects.get(nombre=nombre), pero desde memoria. """
+        self._asegurar_cargado()
+        try:
+            return self._estados_cupon[nombre]
+        except KeyError:
+            raise EstadoCupon.DoesNotExist(f"EstadoCupon '{nombre}' no existe.")
+
+    def estado_cupon_por_id(self, estado_id):
+        self._asegurar_cargado()
+        try:
+            return self._estados_cupon_por_id[int(estado_id)]
+        except (KeyError, TypeError, ValueError):
+            raise EstadoCupon.DoesNotExist(f"EstadoCupon con id '{estado_id}' no existe.")
+
+    def estados_cupon(self):
+        """ Todos los estados de cupón, ordenados por id. """
+        self._asegurar_cargado()
+        return list(self._estados_cupon_por_id.values())
+
+    def pasarela(self, nombre):
+        """ Igual que PasarelaPago.objects.get(nombre=nombre), pero desde memoria. """
+        self._asegurar_cargado()
+        try:
+            return self._pasarelas[nombre]
+        except KeyError:
+            raise PasarelaPago.DoesNotExist(f"PasarelaPago '{nombre}' no existe.")
+
+    def pasarela_por_id(self, pasarela_id):
+        self._asegurar_cargado()
+        try:
+            return self._pasarelas_por_id[int(pasarela_id)]
+        except (KeyError, TypeError, ValueError):
+            raise PasarelaPago.DoesNotExist(f"PasarelaPago con id '{pasarela_id}' no existe.")
+
+
+# Instancia única por proceso
+catalogos = RegistroCatalogos()
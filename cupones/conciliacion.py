@@ -0,0 +1,226 @@
+import csv
+from collections import Counter, namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .models import CuponPago
+from .catalogos import catalogos
+from .transiciones import cambiar_estado_cupones
+
+# --- CONCILIACIÓN DE ARCHIVOS DE RENDICIÓN DE LAS PASARELAS ---
+# Pago Fácil y Macro Click envían un archivo diario con los pagos cobrados.
+# Se lee en streaming, se cruza por lotes contra CuponPago (por id_externo
+# o por número de cupón), se marcan como pagados los que coinciden y se
+# arma un reporte con todas las diferencias.
+
+TAMANIO_LOTE_CONCILIACION = 2000
+
+FORMATO_CSV = 'csv'
+FORMATO_ANCHO_FIJO = 'ancho-fijo'
+FORMATOS = (FORMATO_CSV, FORMATO_ANCHO_FIJO)
+
+# Diseño de registro del archivo de ancho fijo: (campo, desde, hasta).
+# Los registros de cabecera ('H') y de cierre ('T') se ignoran.
+#   tipo        1 caracter: 'D' = detalle
+#   id_externo  20 caracteres, completado con espacios
+#   cupon       10 dígitos, completado con ceros
+#   monto       12 dígitos, en centavos
+#   fecha       AAAAMMDD
+DISENO_ANCHO_FIJO = (
+    ('tipo', 0, 1),
+    ('id_externo', 1, 21),
+    ('cupon', 21, 31),
+    ('monto', 31, 43),
+    ('fecha', 43, 51),
+)
+
+COLUMNAS_REPORTE = ['linea', 'id_externo', 'cupon', 'monto_archivo', 'monto_cupon', 'resultado', 'detalle']
+
+FilaRendicion = namedtuple('FilaRendicion', 'linea id_externo cupon_id monto error')
+
+
+class ReporteEnMemoria:
+    """
+    Reemplazo de csv.writer que junta las diferencias en una lista, hasta
+    'limite' filas (para devolverlas en la respuesta de la API).
+    """
+    def __init__(self, limite):
+        self.limite = limite
+        self.filas = []
+        self.omitidas = 0
+
+    def writerow(self, fila):
+        if len(self.filas) < self.limite:
+            self.filas.append(dict(zip(COLUMNAS_REPORTE, fila)))
+        else:
+            self.omitidas += 1
+
+
+# --- Lectura de archivos ---
+
+def _parsear_monto_csv(valor):
+    valor = (valor or '').strip().replace('$', '')
+    if ',' in valor and '.' not in valor:
+        valor = valor.replace(',', '.')
+    try:
+        return Decimal(valor)
+    except InvalidOperation:
+        raise ValueError('Monto inválido.')
+
+
+def _parsear_cupon(valor):
+    valor = (valor or '').strip()
+    if not valor:
+        return None
+    if not valor.isdigit():
+        raise ValueError('Número de cupón inválido.')
+    return int(valor)
+
+
+def leer_csv(lineas, delimitador=','):
+    """
+    Lee un CSV con encabezado. Columnas: 'id_externo' y/o 'cupon', y 'monto'
+    (con punto o coma decimal). Genera FilaRendicion de a una.
+    """
+    lector = csv.DictReader(lineas, delimiter=delimitador)
+    for numero, registro in enumerate(lector, start=2):
+        try:
+            id_externo = (registro.get('id_externo') or '').strip() or None
+            cupon_id = _parsear_cupon(registro.get('cupon'))
+            monto = _parsear_monto_csv(registro.get('monto'))
+            if not id_externo and cupon_id is None:
+                raise ValueError("La fila no tiene 'id_externo' ni 'cupon'.")
+            yield FilaRendicion(numero, id_externo, cupon_id, monto, None)
+        except ValueError as e:
+            yield FilaRendicion(numero, registro.get('id_externo'), registro.get('cupon'), registro.get('monto'), str(e))
+
+
+def leer_ancho_fijo(lineas):
+    """ Lee el archivo de ancho fijo descrito en DISENO_ANCHO_FIJO. """
+    for numero, linea in enumerate(lineas, start=1):
+        linea = linea.rstrip('\r\n')
+        if not linea.strip():
+            continue
+        campos = {campo: linea[desde:hasta] for campo, desde, hasta in DISENO_ANCHO_FIJO}
+        if campos['tipo'] != 'D':
+            continue
+        try:
+            id_externo = campos['id_externo'].strip() or None
+            cupon_id = _parsear_cupon(campos['cupon'].strip().lstrip('0'))
+            if not campos['monto'].isdigit():
+                raise ValueError('Monto inválido.')
+            monto = Decimal(int(campos['monto'])) / 100
+            if not id_externo and cupon_id is None:
+                raise ValueError("El registro no tiene id externo ni número de cupón.")
+            yield FilaRendicion(numero, id_externo, cupon_id, monto, None)
+        except ValueError as e:
+            yield FilaRendicion(numero, campos['id_externo'].strip(), campos['cupon'], campos['monto'], str(e))
+
+
+def leer_archivo(lineas, formato, delimitador=','):
+    if formato == FORMATO_CSV:
+        return leer_csv(lineas, delimitador=delimitador)
+    if formato == FORMATO_ANCHO_FIJO:
+        return leer_ancho_fijo(lineas)
+    raise ValueError(f"Formato desconocido: '{formato}'. Opciones: {', '.join(FORMATOS)}.")
+
+
+def _lotes(filas, tamanio):
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= tamanio:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+# --- Conciliación ---
+
+def buscar_cupones(ids_externos, cupon_ids):
+    """
+    Trae los cupones con dos consultas por índice (id_externo y pk).
+    Devuelve dos dicts de valores: {id_externo: cupon} y {id: cupon}.
+    """
+    campos = ('id', 'id_externo', 'monto_total', 'estado_cupon_id', 'pasarela_id')
+    por_externo = {}
+    if ids_externos:
+        for cupon in CuponPago.objects.filter(id_externo__in=ids_externos).values(*campos):
+            por_externo[cupon['id_externo']] = cupon
+    por_id = {c['id']: c for c in CuponPago.objects.filter(id__in=cupon_ids).values(*campos)} if cupon_ids else {}
+    return por_externo, por_id
+
+
+def conciliar(filas, pasarela=None, escritor_reporte=None, tamanio_lote=TAMANIO_LOTE_CONCILIACION):
+    """
+    Concilia las filas de un archivo de rendición contra los cupones.
+
+    Cada lote se resuelve con dos SELECT y se liquida en su propia
+    transacción con transiciones.cambiar_estado_cupones(). Si se pasa
+    'pasarela', los cupones de otra pasarela se reportan como diferencia.
+    Las diferencias se escriben en 'escritor_reporte' (un csv.writer), si
+    se indica. Devuelve un Counter con la cantidad de filas por resultado.
+
+    Los cupones repetidos se detectan dentro de cada lote (la memoria no
+    crece con el archivo). Una repetición en un lote posterior encuentra
+    el cupón ya pagado en la base y se reporta como 'ya_pagado'.
+    """
+    estado_pagado = catalogos.estado_cupon('Pagado')
+    resumen = Counter()
+
+    def reportar(fila, resultado, detalle, cupon=None):
+        resumen[resultado] += 1
+        if escritor_reporte is not None and resultado != 'conciliado':
+            escritor_reporte.writerow([
+                fila.linea, fila.id_externo or '', fila.cupon_id or '', fila.monto,
+                cupon['monto_total'] if cupon else '', resultado, detalle
+            ])
+
+    for lote in _lotes(filas, tamanio_lote):
+        validas = []
+        for fila in lote:
+            if fila.error:
+                reportar(fila, 'formato_invalido', fila.error)
+            else:
+                validas.append(fila)
+
+        por_externo, por_id = buscar_cupones(
+            {fila.id_externo for fila in validas if fila.id_externo},
+            {fila.cupon_id for fila in validas if fila.cupon_id is not None}
+        )
+        a_pagar = {}
+        vistos = set()
+        for fila in validas:
+            cupon = por_externo.get(fila.id_externo) if fila.id_externo else None
+            if cupon is None and fila.cupon_id is not None:
+                cupon = por_id.get(fila.cupon_id)
+
+            if cupon is None:
+                reportar(fila, 'no_encontrado', 'No hay un cupón con ese id externo o número.')
+            elif cupon['id'] in vistos:
+                reportar(fila, 'duplicado', 'El cupón ya figura en una fila anterior del lote.', cupon)
+            elif pasarela is not None and cupon['pasarela_id'] != pasarela.id:
+                reportar(fila, 'pasarela_distinta', f"El cupón no es de '{pasarela.nombre}'.", cupon)
+            elif cupon['monto_total'] != fila.monto:
+                reportar(fila, 'monto_distinto', 'El monto cobrado no coincide con el del cupón.', cupon)
+            elif cupon['estado_cupon_id'] == estado_pagado.id:
+                reportar(fila, 'ya_pagado', 'El cupón ya estaba marcado como pagado.', cupon)
+            else:
+                a_pagar[cupon['id']] = (fila, cupon)
+            if cupon is not None:
+                vistos.add(cupon['id'])
+
+        if not a_pagar:
+            continue
+        with transaction.atomic():
+            resultados = cambiar_estado_cupones(list(a_pagar), estado_pagado)
+        for cupon_id, (resultado, detalle) in resultados.items():
+            fila, cupon = a_pagar[cupon_id]
+            if resultado == 'actualizado':
+                reportar(fila, 'conciliado', None, cupon)
+            else:
+                reportar(fila, 'estado_invalido', detalle, cupon)
+
+    return resumen
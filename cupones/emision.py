@@ -0,0 +1,82 @@
+import calendar
+from datetime import date
+
+from django.db import transaction
+
+from .models import Cuota, Perfil
+from .catalogos import catalogos
+from .cache_utils import invalidar_cuotas_pendientes
+
+# --- EMISIÓN MASIVA DE CUOTAS ---
+# Genera las cuotas de un plan (N cuotas, monto, vencimientos mensuales)
+# para todos los alumnos de una carrera. Se recorre a los alumnos por lotes
+# y cada lote es una transacción con un SELECT de las cuotas existentes y un
+# bulk_create de las que faltan: volver a emitir el mismo plan no duplica
+# nada, porque se saltea cada (alumno, período) que ya existe.
+
+TAMANIO_LOTE_EMISION = 1000
+
+
+def _sumar_meses(fecha, meses):
+    """ Misma fecha 'meses' meses después; si el día no existe, el último del mes. """
+    mes = fecha.month - 1 + meses
+    anio = fecha.year + mes // 12
+    mes = mes % 12 + 1
+    return date(anio, mes, min(fecha.day, calendar.monthrange(anio, mes)[1]))
+
+
+def armar_plan(cantidad_cuotas, monto, primer_vencimiento, periodo):
+    """
+    Devuelve la lista [(periodo, monto, fecha_vencimiento)] del plan, con un
+    vencimiento por mes. Ej: "Cuota 1/5 - Período 2026-1".
+    """
+    return [
+        (f"Cuota {numero}/{cantidad_cuotas} - {periodo}", monto, _sumar_meses(primer_vencimiento, numero - 1))
+        for numero in range(1, cantidad_cuotas + 1)
+    ]
+
+
+def alumnos_de_carrera(carrera, tamanio_lote=TAMANIO_LOTE_EMISION):
+    """ Genera listas de ids de alumnos activos de la carrera, en lotes por id (keyset). """
+    perfiles = Perfil.objects.filter(carrera=carrera, user__is_active=True, user__is_staff=False)
+    ultimo_id = 0
+    while True:
+        lote = list(perfiles.filter(user_id__gt=ultimo_id).order_by('user_id').values_list('user_id', flat=True)[:tamanio_lote])
+        if not lote:
+            return
+        yield lote
+        ultimo_id = lote[-1]
+
+
+def emitir_cuotas(plan, carrera, tamanio_lote=TAMANIO_LOTE_EMISION, dry_run=False):
+    """
+    Crea las cuotas de 'plan' (ver armar_plan) en estado 'Pendiente' para
+    los alumnos de la carrera. Lanza EstadoCuota.DoesNotExist si no existe
+    el estado. Genera un dict {'alumnos', 'creadas', 'existentes'} por lote.
+    """
+    estado_pendiente = catalogos.estado_cuota('Pendiente')
+    periodos = [periodo for periodo, _, _ in plan]
+
+    for alumno_ids in alumnos_de_carrera(carrera, tamanio_lote):
+        with transaction.atomic():
+            existentes = set(
+                Cuota.objects.filter(alumno_id__in=alumno_ids, periodo__in=periodos).values_list('alumno_id', 'periodo')
+            )
+            nuevas = [
+                Cuota(
+                    alumno_id=alumno_id,
+                    estado_cuota=estado_pendiente,
+                    periodo=periodo,
+                    monto=monto,
+                    saldo_pendiente=monto,
+                    fecha_vencimiento=vencimiento
+                )
+                for alumno_id in alumno_ids
+                for periodo, monto, vencimiento in plan
+                if (alumno_id, periodo) not in existentes
+            ]
+            if nuevas and not dry_run:
+                # bulk_create no dispara señales: la caché se invalida a mano
+                Cuota.objects.bulk_create(nuevas, batch_size=tamanio_lote)
+                invalidar_cuotas_pendientes(*{cuota.alumno_id for cuota in nuevas})
+        yield {'alumnos': len(alumno_ids), 'creadas': len(nuevas), 'existentes': len(existentes)}
@@ -0,0 +1,388 @@
+import atexit
+import io
+import multiprocessing
+import os
+import threading
+import traceback
+import zipfile
+from collections import deque
+from contextlib import closing
+from concurrent import futures
+
+from django.conf import settings
+from django.db import close_old_connections
+from pypdf import PdfReader
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, NameObject, NumberObject, StreamObject
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+
+from .exportaciones import iterar_por_lotes
+from .models import CuponPago, PasarelaPago
+from .pdf_generator import dibujar_cupon, generate_pago_facil_pdf
+from .pdf_worker import inicializar_proceso
+
+# --- EXPORTACIÓN MASIVA DE PDF DE CUPONES ---
+# Los cupones se reparten en tareas de PDF_LOTE_TAMANIO ids entre los
+# procesos de un pool (ReportLab es puro Python: con hilos no se usaría más
+# de un núcleo). Cada proceso lee sus cupones y devuelve los PDF ya
+# dibujados; este proceso solo los empaqueta y los va entregando.
+#
+# El pool es uno por proceso web, de PDF_LOTE_WORKERS procesos, y lo
+# comparten todas las exportaciones: varias descargas a la vez se reparten
+# esos procesos en vez de crear cada una los suyos. Cada exportación tiene
+# a lo sumo 2 tareas por worker en vuelo, así la memoria queda acotada
+# aunque se exporten miles de cupones (y el que descarga marca el ritmo).
+#
+# El primer lote se dibuja antes de empezar la respuesta (ver iniciar()):
+# si falla, se responde con un error. Si después falla un lote, el archivo
+# se completa igual y lleva una entrada de error con esos cupones.
+# Formatos:
+#   'zip': un PDF por cupón (y ERRORES.txt si algún lote falló).
+#   'pdf': un único PDF con una página por cupón (y una página de error por
+#          lote fallido), que se arma y se entrega a medida que llegan los
+#          lotes (ver PDFEnStreaming). Se limita a PDF_LOTE_MAX_PAGINAS cupones.
+
+FORMATOS = ('zip', 'pdf')
+TAMANIO_BLOQUE_SALIDA = 64 * 1024
+
+
+def cupones_pago_facil(queryset):
+    """ Solo los cupones de Pago Fácil tienen PDF (el resto redirige a la pasarela). """
+    ids = [pasarela.id for pasarela in PasarelaPago.objects.only('id', 'nombre') if pasarela.nombre.lower() == 'pago fácil']
+    return queryset.filter(pasarela_id__in=ids)
+
+
+def renderizar_lote(cupon_ids, formato):
+    """
+    Trabajo de cada proceso del pool. Para 'zip' devuelve [(cupon_id, pdf)];
+    para 'pdf', un PDF con una página por cupón (la plantilla se incluye una
+    sola vez por tarea, ver pdf_generator.dibujar_cupon).
+    """
+    close_old_connections()
+    cupones = (
+        CuponPago.objects
+        .select_related('alumno__perfil', 'pasarela')
+        .prefetch_related('cuotas_incluidas')
+        .filter(id__in=cupon_ids)
+        .order_by('id')
+    )
+    if formato == 'zip':
+        return [(cupon.id, generate_pago_facil_pdf(cupon).getvalue()) for cupon in cupones]
+
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    for cupon in cupones:
+        dibujar_cupon(p, cupon)
+        p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+def _agrupar(ids, tamanio):
+    lote = []
+    for cupon_id in ids:
+        lote.append(cupon_id)
+        if len(lote) >= tamanio:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+class ExportacionFallida(Exception):
+    """ Falló el primer lote: todavía no se entregó nada y se puede responder con un error. """
+
+
+_pool = None
+_pid = None
+_candado = threading.Lock()
+
+
+def _crear_pool(workers):
+    # 'spawn': los procesos no heredan las conexiones abiertas de este
+    return futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=inicializar_proceso
+    )
+
+
+def _pool_compartido():
+    """ Crea el pool la primera vez (en cada proceso: los workers web se crean por fork). """
+    global _pool, _pid
+    with _candado:
+        if _pid != os.getpid():
+            _pool = _crear_pool(settings.PDF_LOTE_WORKERS)
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+            _pid = os.getpid()
+        return _pool
+
+
+def _descartar_pool(pool):
+    """ Murió un proceso del pool: la próxima exportación crea otro. """
+    global _pid
+    with _candado:
+        if _pool is pool:
+            _pid = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def renderizar_en_paralelo(queryset, formato, workers=None, tamanio_lote=None):
+    """
+    Genera (lote, resultado, error) por cada lote, en orden de id: el
+    resultado de renderizar_lote(), o None y la excepción si falló. Sin
+    'workers' usa el pool compartido; con 'workers' (ej. el comando), un
+    pool propio de ese tamaño. Si quien consume deja de pedir (ej. el
+    cliente cortó la descarga), se cancelan las tareas pendientes.
+    """
+    propio = workers is not None
+    workers = workers or settings.PDF_LOTE_WORKERS
+    tamanio_lote = tamanio_lote or settings.PDF_LOTE_TAMANIO
+    filas = iterar_por_lotes(queryset, ['id'])
+    ids = (fila[0] for fila in filas)
+
+    pool = _crear_pool(workers) if propio else _pool_compartido()
+    pendientes = deque()
+
+    def enviar(lote):
+        try:
+            futuro = pool.submit(renderizar_lote, lote, formato)
+        except (futures.BrokenExecutor, RuntimeError) as e:
+            # Pool roto o cerrándose: el lote queda como fallido
+            futuro = futures.Future()
+            futuro.set_exception(e)
+        pendientes.append((lote, futuro))
+
+    def siguiente():
+        lote, futuro = pendientes.popleft()
+        try:
+            return lote, futuro.result(), None
+        except Exception as e:
+            print(traceback.format_exc())
+            if isinstance(e, futures.BrokenExecutor) and not propio:
+                _descartar_pool(pool)
+            return lote, None, e
+
+    try:
+        for lote in _agrupar(ids, tamanio_lote):
+            enviar(lote)
+            if len(pendientes) >= 2 * workers:
+                yield siguiente()
+        while pendientes:
+            yield siguiente()
+    finally:
+        filas.close() # Libera el cursor si no se llegó al final
+        for _, futuro in pendientes:
+            futuro.cancel()
+        if propio:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _detalle_error(lote, error):
+    return f"Cupones {', '.join(map(str, lote))}: {type(error).__name__}: {error}"
+
+
+def _pagina_de_error(lote, error):
+    """ PDF de una página que reemplaza a los cupones de un lote fallido. """
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    texto = p.beginText(2*cm, A4[1] - 3*cm)
+    texto.setFont('Helvetica-Bold', 12)
+    texto.textLine('No se pudieron generar estos cupones:')
+    texto.setFont('Helvetica', 10)
+    detalle = _detalle_error(lote, error)
+    for inicio in range(0, len(detalle), 90):
+        texto.textLine(detalle[inicio:inicio + 90])
+    p.drawText(texto)
+    p.showPage()
+    p.save()
+    return buffer.getvalue()
+
+
+class SalidaStreaming:
+    """
+    Archivo de solo escritura y sin seek para zipfile: acumula lo escrito
+    hasta que se lo retira. zipfile detecta que no puede volver atrás y
+    escribe los tamaños después de cada archivo (data descriptor).
+    """
+    def __init__(self):
+        self._partes = []
+
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        datos = b''.join(self._partes)
+        self._partes = []
+        return datos
+
+
+class PDFEnStreaming:
+    """
+    Une en un solo PDF las páginas de los PDF de cada lote, escribiendo cada
+    objeto apenas se copia: en memoria solo quedan la posición de cada
+    objeto y la lista de páginas. Al cerrar se escriben el árbol de páginas,
+    el catálogo y la tabla xref. Lo que comparten las páginas de un lote
+    (la plantilla, el logo) se copia una sola vez por lote.
+    """
+    PAGINAS, CATALOGO = 1, 2
+
+    def __init__(self):
+        self._salida = SalidaStreaming()
+        self._posicion = 0
+        self._posiciones = {}
+        self._siguiente = 3
+        self._paginas = []
+        self._escribir(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _escribir(self, datos):
+        self._salida.write(datos)
+        self._posicion += len(datos)
+
+    def _numero_nuevo(self):
+        numero = self._siguiente
+        self._siguiente += 1
+        return numero
+
+    def _escribir_objeto(self, numero, objeto):
+        buffer = io.BytesIO()
+        buffer.write(f'{numero} 0 obj\n'.encode())
+        objeto.write_to_stream(buffer)
+        buffer.write(b'\nendobj\n')
+        self._posiciones[numero] = self._posicion
+        self._escribir(buffer.getvalue())
+
+    def agregar(self, datos):
+        """ Agrega al final las páginas del PDF 'datos'. """
+        lector = PdfReader(io.BytesIO(datos))
+        numeros = {} # (idnum, generación) en 'datos' -> número en la salida
+        pendientes = deque()
+
+        def copiar(objeto):
+            # dict.items y list.__iter__: sin resolver las referencias (pypdf las resuelve al leer)
+            if isinstance(objeto, IndirectObject):
+                clave = (objeto.idnum, objeto.generation)
+                if clave not in numeros:
+                    numeros[clave] = self._numero_nuevo()
+                    pendientes.append(objeto)
+                return IndirectObject(numeros[clave], 0, None)
+            if isinstance(objeto, StreamObject):
+                copia = StreamObject()
+                copia._data = objeto._data
+            elif isinstance(objeto, DictionaryObject):
+                copia = DictionaryObject()
+            elif isinstance(objeto, ArrayObject):
+                return ArrayObject(copiar(valor) for valor in list.__iter__(objeto))
+            else:
+                return objeto
+            for clave, valor in dict.items(objeto):
+                copia[clave] = copiar(valor)
+            return copia
+
+        paginas = list(lector.pages)
+        for pagina in paginas:
+            referencia = pagina.indirect_reference
+            numeros[(referencia.idnum, referencia.generation)] = self._numero_nuevo()
+        for pagina in paginas:
+            referencia = pagina.indirect_reference
+            numero = numeros[(referencia.idnum, referencia.generation)]
+            copia = DictionaryObject()
+            for clave, valor in dict.items(pagina):
+                if clave != '/Parent':
+                    copia[clave] = copiar(valor)
+            copia[NameObject('/Parent')] = IndirectObject(self.PAGINAS, 0, None)
+            self._escribir_objeto(numero, copia)
+            self._paginas.append(numero)
+            while pendientes:
+                objeto = pendientes.popleft()
+                self._escribir_objeto(numeros[(objeto.idnum, objeto.generation)], copiar(objeto.get_object()))
+
+    def cerrar(self):
+        """ Escribe el árbol de páginas, el catálogo, la tabla xref y el trailer. """
+        self._escribir_objeto(self.PAGINAS, DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(IndirectObject(numero, 0, None) for numero in self._paginas),
+            NameObject('/Count'): NumberObject(len(self._paginas)),
+        }))
+        self._escribir_objeto(self.CATALOGO, DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): IndirectObject(self.PAGINAS, 0, None),
+        }))
+        inicio_xref = self._posicion
+        lineas = [f'xref\n0 {self._siguiente}\n', '0000000000 65535 f \n']
+        lineas += [f'{self._posiciones[numero]:010d} 00000 n \n' for numero in range(1, self._siguiente)]
+        lineas.append(f'trailer\n<< /Size {self._siguiente} /Root {self.CATALOGO} 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n')
+        self._escribir(''.join(lineas).encode())
+
+    def retirar(self):
+        return self._salida.retirar()
+
+
+def _fallo_el_primero(lote, error):
+    raise ExportacionFallida(f'No se pudo generar el primer lote de cupones ({_detalle_error(lote, error)}).') from error
+
+
+def generar_zip(queryset, workers=None, tamanio_lote=None):
+    """ Genera el ZIP (un PDF por cupón) en bloques de bytes. """
+    salida = SalidaStreaming()
+    errores = []
+    # Los PDF ya vienen comprimidos: se guardan sin volver a comprimir
+    with closing(renderizar_en_paralelo(queryset, 'zip', workers, tamanio_lote)) as lotes, \
+            zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_STORED) as archivo_zip:
+        for numero, (lote, resultados, error) in enumerate(lotes):
+            if error is not None:
+                if numero == 0:
+                    _fallo_el_primero(lote, error)
+                errores.append(_detalle_error(lote, error))
+                continue
+            for cupon_id, datos in resultados:
+                archivo_zip.writestr(f'cupon_pago_{cupon_id}.pdf', datos)
+            yield salida.retirar()
+        if errores:
+            archivo_zip.writestr('ERRORES.txt', 'No se pudieron generar estos cupones:\n' + '\n'.join(errores) + '\n')
+    yield salida.retirar() # Directorio central del ZIP
+
+
+def generar_pdf_unico(queryset, workers=None, tamanio_lote=None):
+    """ Genera un único PDF con una página por cupón, en bloques de bytes, a medida que llegan los lotes. """
+    pdf = PDFEnStreaming()
+    with closing(renderizar_en_paralelo(queryset, 'pdf', workers, tamanio_lote)) as lotes:
+        for numero, (lote, datos, error) in enumerate(lotes):
+            if error is not None:
+                if numero == 0:
+                    _fallo_el_primero(lote, error)
+                datos = _pagina_de_error(lote, error)
+            pdf.agregar(datos)
+            yield pdf.retirar()
+    pdf.cerrar()
+    yield pdf.retirar()
+
+
+def generar(queryset, formato, workers=None, tamanio_lote=None):
+    if formato == 'zip':
+        return generar_zip(queryset, workers, tamanio_lote)
+    return generar_pdf_unico(queryset, workers, tamanio_lote)
+
+
+def iniciar(queryset, formato, workers=None, tamanio_lote=None):
+    """
+    Como generar(), pero dibuja ya el primer lote: lanza ExportacionFallida
+    si falla. Devuelve el iterador de bloques para la respuesta.
+    """
+    bloques = generar(queryset, formato, workers, tamanio_lote)
+    primero = next(bloques)
+    return _continuar(primero, bloques)
+
+
+def _continuar(primero, bloques):
+    try:
+        yield primero
+        yield from bloques
+    finally:
+        # Si se corta la descarga, se cancelan las tareas pendientes
+        bloques.close()
@@ -0,0 +1,95 @@
+import csv
+
+from django.utils import timezone
+
+# --- EXPORTACIÓN CSV EN STREAMING ---
+# Generadores que producen el CSV línea por línea, para devolverlo con
+# StreamingHttpResponse sin armar el archivo completo en memoria.
+
+TAMANIO_LOTE_EXPORTACION = 2000
+
+COLUMNAS_CUPONES = [
+    ('id', 'ID Cupón'),
+    ('fecha_generacion', 'Fecha de generación'),
+    ('fecha_vencimiento', 'Fecha de vencimiento'),
+    ('monto_total', 'Monto total'),
+    ('es_pago_parcial', 'Pago parcial'),
+    ('estado_cupon__nombre', 'Estado'),
+    ('pasarela__nombre', 'Pasarela'),
+    ('id_externo', 'ID externo'),
+    ('alumno_id', 'ID Alumno'),
+    ('alumno__username', 'Usuario'),
+    ('alumno__first_name', 'Nombre'),
+    ('alumno__last_name', 'Apellido'),
+    ('alumno__email', 'Email'),
+    ('alumno__perfil__dni', 'DNI'),
+    ('alumno__perfil__legajo', 'Legajo'),
+    ('alumno__perfil__carrera', 'Carrera'),
+]
+
+COLUMNAS_CUOTAS = [
+    ('id', 'ID Cuota'),
+    ('periodo', 'Período'),
+    ('monto', 'Monto'),
+    ('saldo_pendiente', 'Saldo pendiente'),
+    ('recargo', 'Recargo'),
+    ('recargo_pagado', 'Recargo pagado'),
+    ('fecha_recargo', 'Fecha del recargo'),
+    ('fecha_vencimiento', 'Fecha de vencimiento'),
+    ('estado_cuota__nombre', 'Estado'),
+    ('cupon_activo_id', 'Cupón activo'),
+    ('alumno_id', 'ID Alumno'),
+    ('alumno__username', 'Usuario'),
+    ('alumno__first_name', 'Nombre'),
+    ('alumno__last_name', 'Apellido'),
+    ('alumno__perfil__dni', 'DNI'),
+    ('alumno__perfil__legajo', 'Legajo'),
+    ('alumno__perfil__carrera', 'Carrera'),
+]
+
+
+class Echo:
+    """ Objeto tipo archivo que devuelve lo que se le escribe (para csv.writer). """
+    def write(self, value):
+        return value
+
+
+def iterar_por_lotes(queryset, campos, tamanio_lote=TAMANIO_LOTE_EXPORTACION):
+    """
+    Recorre el queryset en lotes ordenados por id (keyset: id > último visto),
+    devolviendo tuplas con 'campos'. El primer campo debe ser 'id'.
+
+    Cada lote se lee con .iterator(); además se corta por id porque el
+    driver de MySQL trae el resultado completo de cada consulta a memoria.
+    Así la memoria queda acotada al tamaño del lote.
+    """
+    ultimo_id = 0
+    while True:
+        lote = queryset.filter(id__gt=ultimo_id).order_by('id').values_list(*campos)[:tamanio_lote]
+        cantidad = 0
+        for fila in lote.iterator(chunk_size=tamanio_lote):
+            cantidad += 1
+            yield fila
+        if cantidad < tamanio_lote:
+            return
+        ultimo_id = fila[0]
+
+
+def _formatear(valor):
+    if valor is None:
+        return ''
+    if hasattr(valor, 'tzinfo') and valor.tzinfo is not None:
+        return timezone.localtime(valor).strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(valor, bool):
+        return 'Sí' if valor else 'No'
+    return valor
+
+
+def generar_csv(queryset, columnas):
+    """ Genera el CSV (encabezado + filas) como una secuencia de strings. """
+    writer = csv.writer(Echo())
+    # BOM para que Excel reconozca el UTF-8 (acentos, ñ)
+    yield '\ufeff' + writer.writerow([titulo for _, titulo in columnas])
+    campos = [campo for campo, _ in columnas]
+    for fila in iterar_por_lotes(queryset, campos):
+        yield writer.writerow([_formatear(valor) for valor in fila])
@@ -0,0 +1,84 @@
+from datetime import datetime, time, timedelta
+
+import django_filters
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .models import CuponPago, Cuota
+
+
+def _inicio_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha, time.min))
+
+
+def _filtrar_nombre_alumno(queryset, value):
+    """
+    Busca por comienzo de nombre, apellido o username del alumno. Cada
+    columna se busca por separado (tienen índice, ver migración 0010) y los
+    ids se unen con UNION: un OR entre columnas distintas no usa índices.
+    """
+    value = value.strip()
+    if not value:
+        return queryset
+    alumnos = User.objects.filter(first_name__istartswith=value).values('id').union(
+        User.objects.filter(last_name__istartswith=value).values('id'),
+        User.objects.filter(username__istartswith=value).values('id'),
+    )
+    return queryset.filter(alumno_id__in=alumnos)
+
+
+class CuponPagoAdminFilter(django_filters.FilterSet):
+    """
+    Filtros de la gestión de cupones (Admin) y de la exportación.
+    Todos se resuelven con índices: estado/pasarela tienen índices
+    compuestos con fecha_generacion, DNI/legajo son únicos en Perfil y
+    carrera usa el índice (carrera, user) de Perfil. es_pago_parcial no
+    tiene índice propio (solo dos valores: el plan recorre igual el índice
+    por fecha de generación).
+    """
+    estado = django_filters.NumberFilter(field_name='estado_cupon_id')
+    pasarela = django_filters.NumberFilter(field_name='pasarela_id')
+    es_pago_parcial = django_filters.BooleanFilter()
+    # Rango sobre la fecha de generación (ambos extremos inclusive).
+    # Se compara contra el inicio del día en vez de usar __date, que no usa índices.
+    fecha_desde = django_filters.DateFilter(method='filtrar_fecha_desde')
+    fecha_hasta = django_filters.DateFilter(method='filtrar_fecha_hasta')
+    dni = django_filters.CharFilter(field_name='alumno__perfil__dni')
+    legajo = django_filters.CharFilter(field_name='alumno__perfil__legajo')
+    carrera = django_filters.CharFilter(field_name='alumno__perfil__carrera')
+    nombre = django_filters.CharFilter(method='filtrar_nombre')
+
+    class Meta:
+        model = CuponPago
+        fields = ['estado', 'pasarela', 'es_pago_parcial', 'fecha_desde', 'fecha_hasta', 'dni', 'legajo', 'carrera', 'nombre']
+
+    def filtrar_fecha_desde(self, queryset, name, value):
+        return queryset.filter(fecha_generacion__gte=_inicio_del_dia(value))
+
+    def filtrar_fecha_hasta(self, queryset, name, value):
+        return queryset.filter(fecha_generacion__lt=_inicio_del_dia(value + timedelta(days=1)))
+
+    def filtrar_nombre(self, queryset, name, value):
+        return _filtrar_nombre_alumno(queryset, value)
+
+
+class CuotaAdminFilter(django_filters.FilterSet):
+    """
+    Filtros para la exportación de cuotas (Admin). Mismo criterio que
+    CuponPagoAdminFilter: alumno por DNI/legajo/nombre y rango de fechas,
+    en este caso sobre el vencimiento.
+    """
+    estado = django_filters.NumberFilter(field_name='estado_cuota_id')
+    vencimiento_desde = django_filters.DateFilter(field_name='fecha_vencimiento', lookup_expr='gte')
+    vencimiento_hasta = django_filters.DateFilter(field_name='fecha_vencimiento', lookup_expr='lte')
+    dni = django_filters.CharFilter(field_name='alumno__perfil__dni')
+    legajo = django_filters.CharFilter(field_name='alumno__perfil__legajo')
+    carrera = django_filters.CharFilter(field_name='alumno__perfil__carrera')
+    nombre = django_filters.CharFilter(method='filtrar_nombre')
+
+    class Meta:
+        model = Cuota
+        fields = ['estado', 'vencimiento_desde', 'vencimiento_hasta', 'dni', 'legajo', 'carrera', 'nombre']
+
+    def filtrar_nombre(self, queryset, name, value):
+        return _filtrar_nombre_alumno(queryset, value)
@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# --- RESERVAS DE IDEMPOTENCIA ---
+# Evita que dos requests con la misma idempotency_key (ej. doble clic) se
+# procesen a la vez. El primero "reserva" la clave con cache.add (atómico);
+# el segundo espera a que el primero guarde su respuesta y la reutiliza.
+#
+# Con una caché compartida (Redis/Memcached) esto funciona entre workers.
+# Con la caché local por proceso, la restricción unique de
+# CuponPago.idempotency_key sigue siendo la última defensa (la vista
+# atrapa el IntegrityError y devuelve el cupón ya creado).
+
+PREFIJO_IDEMPOTENCIA = 'idempotencia'
+
+
+def _clave_reserva(clave):
+    return f'{PREFIJO_IDEMPOTENCIA}:reserva:{clave}'
+
+
+def _clave_respuesta(clave):
+    return f'{PREFIJO_IDEMPOTENCIA}:respuesta:{clave}'
+
+
+def reservar(clave):
+    """ Devuelve True si esta request se quedó con la clave. """
+    return cache.add(
+        _clave_reserva(clave),
+        True,
+        timeout=getattr(settings, 'IDEMPOTENCIA_RESERVA_TIMEOUT', 30)
+    )
+
+
+def liberar(clave):
+    cache.delete(_clave_reserva(clave))
+
+
+def guardar_respuesta(clave, status_code, data):
+    cache.set(
+        _clave_respuesta(clave),
+        (status_code, data),
+        timeout=getattr(settings, 'IDEMPOTENCIA_RESPUESTA_TIMEOUT', 3600)
+    )
+
+
+def obtener_respuesta(clave):
+    """ Devuelve (status_code, data) de la request original, o None. """
+    return cache.get(_clave_respuesta(clave))
+
+
+def esperar_respuesta(clave, timeout, intervalo=0.05):
+    """
+    Espera hasta 'timeout' segundos a que la request que tiene reservada la
+    clave guarde su respuesta. Devuelve (status_code, data), o None si la
+    reserva se liberó sin respuesta (la request original falló) o se agotó
+    el tiempo.
+    """
+    limite = time.monotonic() + timeout
+    while True:
+        respuesta = obtener_respuesta(clave)
+        if respuesta is not None:
+            return respuesta
+        if cache.get(_clave_reserva(clave)) is None or time.monotonic() >= limite:
+            # La respuesta pudo guardarse justo antes de liberar la reserva
+            return obtener_respuesta(clave)
+        time.sleep(intervalo)
@@ -0,0 +1,182 @@
+import csv
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from .models import Perfil
+
+# --- IMPORTACIÓN MASIVA DE ALUMNOS ---
+# Lee un CSV de alumnos en streaming y crea User + Perfil por lotes con
+# bulk_create (sin la señal post_save de User: el Perfil se crea acá).
+# Las unicidades (username, email, DNI, legajo) se validan con una consulta
+# por campo y por lote, y también contra las filas anteriores del archivo.
+
+TAMANIO_LOTE_IMPORTACION = 1000
+
+COLUMNAS_IMPORTACION = ['username', 'nombre', 'apellido', 'email', 'dni', 'legajo', 'carrera']
+COLUMNAS_ERRORES = ['linea', 'username', 'error']
+
+# Largo máximo de cada columna, tomado de los modelos
+LARGOS_MAXIMOS = {
+    'username': User._meta.get_field('username').max_length,
+    'nombre': User._meta.get_field('first_name').max_length,
+    'apellido': User._meta.get_field('last_name').max_length,
+    'email': User._meta.get_field('email').max_length,
+    'dni': Perfil._meta.get_field('dni').max_length,
+    'legajo': Perfil._meta.get_field('legajo').max_length,
+    'carrera': Perfil._meta.get_field('carrera').max_length,
+}
+CAMPOS_UNICOS = ('username', 'email', 'dni', 'legajo')
+
+
+def leer_alumnos(lineas, delimitador=','):
+    """ Genera (numero_de_linea, dict) por cada fila del CSV, con los valores sin espacios. """
+    lector = csv.DictReader(lineas, delimiter=delimitador)
+    faltantes = {'username'} - set(lector.fieldnames or [])
+    if faltantes:
+        raise ValueError(f"Faltan columnas en el archivo: {', '.join(sorted(faltantes))}.")
+    for numero, registro in enumerate(lector, start=2):
+        yield numero, {campo: (registro.get(campo) or '').strip() for campo in COLUMNAS_IMPORTACION + ['password_hash']}
+
+
+def _clave(valor):
+    """ Username, email, DNI y legajo se comparan sin distinguir mayúsculas. """
+    return valor.lower()
+
+
+def _validar_fila(fila):
+    """ Validaciones que no necesitan la base. Devuelve el mensaje de error o None. """
+    if not fila['username']:
+        return 'El username es obligatorio.'
+    try:
+        User.username_validator(fila['username'])
+    except ValidationError:
+        return 'El username solo puede tener letras, números y los caracteres @/./+/-/_.'
+    for campo, largo in LARGOS_MAXIMOS.items():
+        if len(fila[campo]) > largo:
+            return f"El campo '{campo}' supera los {largo} caracteres."
+    if fila['email']:
+        try:
+            validate_email(fila['email'])
+        except ValidationError:
+            return 'El email no es válido.'
+    if fila['password_hash']:
+        try:
+            identify_hasher(fila['password_hash'])
+        except ValueError:
+            return "'password_hash' no es un hash de contraseña reconocido."
+    return None
+
+
+class ImportadorAlumnos:
+    """
+    Importa alumnos por lotes. 'password_hash' es el hash que reciben las
+    filas sin columna 'password_hash' (se calcula una sola vez; por defecto,
+    una contraseña inutilizable: el alumno la define con "olvidé mi contraseña").
+    Los errores se escriben en 'escritor_errores' (un csv.writer).
+    """
+
+    def __init__(self, escritor_errores, password_hash=None, tamanio_lote=TAMANIO_LOTE_IMPORTACION):
+        self.escritor_errores = escritor_errores
+        self.password_hash = password_hash or make_password(None)
+        self.tamanio_lote = tamanio_lote
+        self.creados = 0
+        self.errores = 0
+        # Valores ya importados por filas anteriores del archivo (normalizados, ver _clave)
+        self.vistos = {campo: set() for campo in CAMPOS_UNICOS}
+
+    def error(self, numero, fila, mensaje):
+        self.errores += 1
+        self.escritor_errores.writerow([numero, fila.get('username', ''), mensaje])
+
+    def importar(self, filas):
+        lote = []
+        for numero, fila in filas:
+            lote.append((numero, fila))
+            if len(lote) >= self.tamanio_lote:
+                self.importar_lote(lote)
+                lote = []
+                yield self.creados, self.errores
+        if lote:
+            self.importar_lote(lote)
+            yield self.creados, self.errores
+
+    def _existentes(self, lote):
+        """
+        Una consulta por campo único para todo el lote. En MySQL la
+        comparación ya ignora mayúsculas (collation *_ci); los valores
+        encontrados se normalizan igual que los del archivo.
+        """
+        def valores(campo):
+            return {fila[campo] for _, fila in lote if fila[campo]}
+        encontrados = {
+            'username': User.objects.filter(username__in=valores('username')).values_list('username', flat=True),
+            'email': User.objects.filter(email__in=valores('email')).values_list('email', flat=True),
+            'dni': Perfil.objects.filter(dni__in=valores('dni')).values_list('dni', flat=True),
+            'legajo': Perfil.objects.filter(legajo__in=valores('legajo')).values_list('legajo', flat=True),
+        }
+        return {campo: {_clave(valor) for valor in consulta} for campo, consulta in encontrados.items()}
+
+    def importar_lote(self, lote):
+        existentes = self._existentes(lote)
+        # Valores de las filas válidas de este lote: pasan a self.vistos
+        # recién cuando el lote se guardó
+        del_lote = {campo: set() for campo in CAMPOS_UNICOS}
+        validas = []
+        for numero, fila in lote:
+            mensaje = _validar_fila(fila)
+            if mensaje is None:
+                for campo in CAMPOS_UNICOS:
+                    if not fila[campo]:
+                        continue
+                    clave = _clave(fila[campo])
+                    if clave in existentes[campo]:
+                        mensaje = f"Ya existe un usuario con ese {campo} ({fila[campo]})."
+                    elif clave in self.vistos[campo] or clave in del_lote[campo]:
+                        mensaje = f"El {campo} {fila[campo]} está repetido en el archivo."
+                    if mensaje:
+                        break
+            if mensaje:
+                self.error(numero, fila, mensaje)
+                continue
+            for campo in CAMPOS_UNICOS:
+                if fila[campo]:
+                    del_lote[campo].add(_clave(fila[campo]))
+            validas.append((numero, fila))
+
+        if not validas:
+            return
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([
+                    User(
+                        username=fila['username'],
+                        first_name=fila['nombre'],
+                        last_name=fila['apellido'],
+                        email=fila['email'],
+                        password=fila['password_hash'] or self.password_hash
+                    )
+                    for _, fila in validas
+                ], batch_size=self.tamanio_lote)
+                # MySQL no devuelve los ids de bulk_create: se buscan por username
+                ids = dict(User.objects.filter(username__in=[fila['username'] for _, fila in validas]).values_list('username', 'id'))
+                Perfil.objects.bulk_create([
+                    Perfil(
+                        user_id=ids[fila['username']],
+                        dni=fila['dni'] or None,
+                        legajo=fila['legajo'] or None,
+                        carrera=fila['carrera'] or None
+                    )
+                    for _, fila in validas
+                ], batch_size=self.tamanio_lote)
+        except IntegrityError as e:
+            # Otro proceso creó alguno de estos usuarios mientras importábamos
+            for numero, fila in validas:
+                self.error(numero, fila, f"No se importó el lote por un conflicto de unicidad: {e}")
+            return
+        self.creados += len(validas)
+        for campo in CAMPOS_UNICOS:
+            self.vistos[campo] |= del_lote[campo]
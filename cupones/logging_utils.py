@@ -1,25 +1,144 @@
+import atexit
+import os
+import queue
+import threading
+import time
+import traceback
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import close_old_connections
+from django.utils import timezone
+
 from .models import SystemLog
 
 User = get_user_model()
 
+# --- ESCRITURA DEL REGISTRO DE AUDITORÍA ---
+# create_log/log_action no escriben en la base: encolan la entrada en
+# memoria y un hilo de fondo las inserta con bulk_create, cuando junta
+# SYSTEMLOG_TAMANIO_LOTE entradas o pasan SYSTEMLOG_INTERVALO segundos.
+# Al terminar el proceso se vacía la cola (atexit). Si la cola se llena
+# (la base no da abasto), se vuelve a escribir en el momento.
+# Con SYSTEMLOG_ASINCRONICO = False (ej. en tests) se escribe siempre en el momento.
 
-def create_log(user, action: str, detail: str = ""):
-    if isinstance(user, User) and not user.is_authenticated:
-        user = None
+_FIN = object() # Marca para que el hilo termine (ver vaciar)
 
-    SystemLog.objects.create(
-        user=user,
-        action=action,
-        detail=detail or "",
-    )
 
-def log_action(user, action, detail=""):
-    if user and not user.is_authenticated:
+class EscritorLogs:
+    def __init__(self, tamanio_lote=100, intervalo=1.0, capacidad=10000, asincronico=True):
+        self.asincronico = asincronico
+        self.tamanio_lote = tamanio_lote
+        self.intervalo = intervalo
+        self.cola = queue.Queue(maxsize=capacidad)
+        self._hilo = None
+        self._pid = None
+        self._candado = threading.Lock()
+        self._atexit_registrado = False
+
+    def registrar(self, entrada):
+        """ Encola un SystemLog (sin guardar). Si la cola está llena, lo guarda ya. """
+        if not self.asincronico:
+            entrada.save()
+            return
+        self._iniciar()
+        try:
+            self.cola.put_nowait(entrada)
+        except queue.Full:
+            entrada.save()
+
+    def _iniciar(self):
+        # El hilo se crea en cada proceso (los workers se crean por fork)
+        if self._pid == os.getpid():
+            return
+        with self._candado:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Proceso hijo: la cola heredada pertenece al padre
+                self.cola = queue.Queue(maxsize=self.cola.maxsize)
+            self._hilo = threading.Thread(target=self._trabajar, name='escritor-logs', daemon=True)
+            self._hilo.start()
+            self._pid = os.getpid()
+            if not self._atexit_registrado:
+                atexit.register(self.vaciar)
+                self._atexit_registrado = True
+
+    def _tomar_lote(self):
+        """
+        Espera la primera entrada y junta más hasta completar el lote o el
+        intervalo. La marca de fin (ver vaciar) corta la espera.
+        """
+        lote = [self.cola.get()]
+        limite = time.monotonic() + self.intervalo
+        while len(lote) < self.tamanio_lote and lote[-1] is not _FIN:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                lote.append(self.cola.get(timeout=restante))
+            except queue.Empty:
+                break
+        return lote
+
+    def _trabajar(self):
+        while True:
+            lote = self._tomar_lote()
+            fin = any(entrada is _FIN for entrada in lote)
+            # El hilo mantiene su propia conexión: se renueva si expiró
+            close_old_connections()
+            self._guardar([entrada for entrada in lote if entrada is not _FIN])
+            if fin:
+                return
+
+    def _guardar(self, lote):
+        try:
+            SystemLog.objects.bulk_create(lote, batch_size=self.tamanio_lote)
+        except Exception:
+            # La auditoría nunca debe tumbar al proceso
+            print(traceback.format_exc())
+
+    def vaciar(self, timeout=5):
+        """
+        Guarda todo lo que quedó en la cola. Se le pide al hilo que termine
+        su lote (así no se pierde lo que ya tomó) y lo que reste se guarda acá.
+        """
+        hilo = self._hilo
+        if hilo is not None and hilo.is_alive() and self._pid == os.getpid():
+            try:
+                self.cola.put(_FIN, timeout=timeout)
+                hilo.join(timeout)
+            except queue.Full:
+                pass
+        lote = []
+        while True:
+            try:
+                entrada = self.cola.get_nowait()
+            except queue.Empty:
+                break
+            if entrada is not _FIN:
+                lote.append(entrada)
+        if lote:
+            self._guardar(lote)
+        self._pid = None # Si se vuelve a registrar algo, se crea otro hilo
+
+
+escritor = EscritorLogs(
+    tamanio_lote=getattr(settings, 'SYSTEMLOG_TAMANIO_LOTE', 100),
+    intervalo=getattr(settings, 'SYSTEMLOG_INTERVALO', 1.0),
+    capacidad=getattr(settings, 'SYSTEMLOG_CAPACIDAD', 10000),
+    asincronico=getattr(settings, 'SYSTEMLOG_ASINCRONICO', True),
+)
+
+
+def _nuevo_log(user, action, detail):
+    if user is not None and not (isinstance(user, User) and user.is_authenticated):
         user = None
+    return SystemLog(user_id=user.pk if user else None, action=action, detail=detail or "", timestamp=timezone.now())
 
-    SystemLog.objects.create(
-        user=user,
-        action=action,
-        detail=detail
-    )
+
+def create_log(user, action: str, detail: str = ""):
+    escritor.registrar(_nuevo_log(user, action, detail))
+
+def log_action(user, action, detail=""):
+    escritor.registrar(_nuevo_log(user, action, detail))
@@ -0,0 +1,47 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import EstadoCuota
+from ...recargos import TAMANIO_LOTE_RECARGOS, aplicar_recargos
+from ...bloqueos import bloqueo_tarea, TareaEnCurso
+
+
+class Command(BaseCommand):
+    help = 'Calcula el recargo por mora de las cuotas impagas según la tabla TasaRecargo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', type=date.fromisoformat, default=None, help='Fecha de cálculo (AAAA-MM-DD). Por defecto, hoy.')
+        parser.add_argument('--batch-size', type=int, default=TAMANIO_LOTE_RECARGOS, help='Ancho de cada ventana de ids (un UPDATE por ventana).')
+        parser.add_argument('--forzar', action='store_true', help='Recalcular también las cuotas ya calculadas para esa fecha (ej. si cambió la tabla de tasas).')
+        parser.add_argument('--dry-run', action='store_true', help='Solo contar las cuotas de cada tramo, sin modificarlas.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size debe ser mayor que 0.')
+        fecha = options['fecha'] or date.today()
+        self.stdout.write(self.style.NOTICE(f'Calculando recargos al {fecha}...'))
+
+        inicio = time.monotonic()
+        por_tramo = {}
+        try:
+            with bloqueo_tarea('aplicar_recargos') as bloqueo:
+                for tasa, cantidad in aplicar_recargos(fecha, options['batch_size'], options['forzar'], options['dry_run']):
+                    por_tramo[tasa] = por_tramo.get(tasa, 0) + cantidad
+                    bloqueo.renovar()
+        except EstadoCuota.DoesNotExist as e:
+            raise CommandError(f'Error: No se encontraron los estados "Pendiente" o "Vencida". Detalle: {e}')
+        except TareaEnCurso as e:
+            raise CommandError(str(e))
+
+        if not por_tramo and not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('No hay cuotas para recargar.'))
+            return
+        for tasa, cantidad in por_tramo.items():
+            self.stdout.write(f'  {tasa}: {cantidad} cuotas')
+        total = sum(por_tramo.values())
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'[dry-run] Se recargarían {total} cuotas.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'¡Éxito! Se recargaron {total} cuotas en {time.monotonic() - inicio:.1f}s.'))
@@ -0,0 +1,83 @@
+import gzip
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime, time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from ...models import SystemLog
+from ...bloqueos import bloqueo_tarea, TareaEnCurso
+
+
+class Command(BaseCommand):
+    help = 'Mueve los registros de SystemLog anteriores a un corte a archivos JSONL comprimidos (uno por día) y los borra de la tabla.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=90, help='Conservar en la tabla los últimos N días (por defecto 90).')
+        parser.add_argument('--antes-de', type=date.fromisoformat, help='Archivar lo anterior a esta fecha (AAAA-MM-DD). Tiene prioridad sobre --dias.')
+        parser.add_argument('--directorio', required=True, help='Directorio donde escribir los archivos systemlog-AAAA-MM-DD.jsonl.gz.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Registros por lote.')
+        parser.add_argument('--dry-run', action='store_true', help='Solo contar los registros que se archivarían.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size debe ser mayor que 0.')
+        fecha_corte = options['antes_de'] or (timezone.localdate() - timedelta(days=options['dias']))
+        corte = timezone.make_aware(datetime.combine(fecha_corte, dt_time.min))
+        viejos = SystemLog.objects.filter(timestamp__lt=corte)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'[dry-run] Hay {viejos.count()} registros anteriores al {fecha_corte} para archivar.'))
+            return
+
+        os.makedirs(options['directorio'], exist_ok=True)
+        self.stdout.write(self.style.NOTICE(f'Archivando registros anteriores al {fecha_corte} en {options["directorio"]}...'))
+
+        inicio = time.monotonic()
+        total = 0
+        try:
+            with bloqueo_tarea('archivar_logs') as bloqueo:
+                while True:
+                    # Siempre el primer lote: los anteriores ya se borraron
+                    lote = list(
+                        viejos.order_by('timestamp', 'id')
+                        .values('id', 'user_id', 'user__username', 'action', 'detail', 'timestamp')[:options['batch_size']]
+                    )
+                    if not lote:
+                        break
+                    self.escribir(options['directorio'], lote)
+                    # Se borra recién después de escribir y cerrar los archivos.
+                    # Si el proceso se corta en el medio, el próximo run vuelve a
+                    # archivar ese lote (los registros llevan su id para deduplicar).
+                    with transaction.atomic():
+                        SystemLog.objects.filter(id__in=[fila['id'] for fila in lote]).delete()
+                    total += len(lote)
+                    segundos = max(time.monotonic() - inicio, 1e-6)
+                    self.stdout.write(f'  {total} registros archivados ({total / segundos:.0f} registros/s)')
+                    bloqueo.renovar()
+        except TareaEnCurso as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(f'¡Éxito! Se archivaron {total} registros en {time.monotonic() - inicio:.1f}s.'))
+
+    def escribir(self, directorio, lote):
+        """ Agrega el lote a los archivos de cada día (cada append es un miembro gzip nuevo). """
+        por_dia = defaultdict(list)
+        for fila in lote:
+            por_dia[timezone.localtime(fila['timestamp']).date()].append(fila)
+        for dia, filas in por_dia.items():
+            ruta = os.path.join(directorio, f'systemlog-{dia:%Y-%m-%d}.jsonl.gz')
+            with gzip.open(ruta, 'at', encoding='utf-8') as archivo:
+                for fila in filas:
+                    archivo.write(json.dumps({
+                        'id': fila['id'],
+                        'user_id': fila['user_id'],
+                        'username': fila['user__username'],
+                        'action': fila['action'],
+                        'detail': fila['detail'],
+                        'timestamp': fila['timestamp'].isoformat(),
+                    }, ensure_ascii=False) + '\n')
@@ -0,0 +1,62 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...catalogos import catalogos
+from ...conciliacion import (
+    COLUMNAS_REPORTE, FORMATOS, FORMATO_CSV, TAMANIO_LOTE_CONCILIACION, conciliar, leer_archivo
+)
+from ...models import PasarelaPago
+
+
+class Command(BaseCommand):
+    help = 'Concilia un archivo de rendición de la pasarela (CSV o ancho fijo) y marca como pagados los cupones cobrados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo de rendición.')
+        parser.add_argument('--formato', choices=FORMATOS, default=FORMATO_CSV)
+        parser.add_argument('--pasarela', help="Nombre de la pasarela (ej. 'Pago Fácil'). Los cupones de otra pasarela se reportan como diferencia.")
+        parser.add_argument('--delimitador', default=',', help='Separador de columnas del CSV.')
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--reporte', help='Archivo CSV donde escribir las diferencias (por defecto, la salida estándar; el resumen va siempre a stderr).')
+        parser.add_argument('--lote', type=int, default=TAMANIO_LOTE_CONCILIACION, help='Filas por lote.')
+
+    def handle(self, *args, **options):
+        pasarela = None
+        if options['pasarela']:
+            try:
+                pasarela = catalogos.pasarela(options['pasarela'])
+            except PasarelaPago.DoesNotExist:
+                raise CommandError(f"No existe la pasarela '{options['pasarela']}'.")
+
+        self.informar(f"Conciliando '{options['archivo']}'...", self.style.NOTICE)
+        inicio = time.monotonic()
+
+        salida = open(options['reporte'], 'w', newline='', encoding='utf-8-sig') if options['reporte'] else self.stdout
+        try:
+            escritor = csv.writer(salida)
+            escritor.writerow(COLUMNAS_REPORTE)
+            with open(options['archivo'], newline='', encoding=options['encoding']) as archivo:
+                filas = leer_archivo(archivo, options['formato'], delimitador=options['delimitador'])
+                resumen = conciliar(filas, pasarela=pasarela, escritor_reporte=escritor, tamanio_lote=options['lote'])
+        except OSError as e:
+            raise CommandError(str(e))
+        finally:
+            if salida is not self.stdout:
+                salida.close()
+
+        segundos = time.monotonic() - inicio
+        total = sum(resumen.values())
+        for resultado, cantidad in sorted(resumen.items()):
+            self.informar(f'  {resultado}: {cantidad}')
+        self.informar(
+            f"¡Éxito! {total} filas procesadas en {segundos:.1f}s: "
+            f"{resumen['conciliado']} cupones conciliados, {total - resumen['conciliado']} diferencias.",
+            self.style.SUCCESS
+        )
+
+    def informar(self, mensaje, estilo=None):
+        # El progreso y el resumen van a stderr: la salida estándar queda
+        # solo para el reporte CSV (se puede redirigir a un archivo)
+        self.stderr.write(mensaje, style_func=estilo or (lambda texto: texto))
@@ -0,0 +1,61 @@
+import time
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import EstadoCuota
+from ...emision import TAMANIO_LOTE_EMISION, armar_plan, emitir_cuotas
+from ...bloqueos import bloqueo_tarea, TareaEnCurso
+
+
+def _monto(valor):
+    try:
+        monto = Decimal(valor)
+    except InvalidOperation:
+        raise ValueError(valor)
+    if monto <= 0:
+        raise ValueError(valor)
+    return monto
+
+
+class Command(BaseCommand):
+    help = 'Emite las cuotas de un plan (N cuotas mensuales) para todos los alumnos de una carrera.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--carrera', required=True, help='Carrera de los alumnos (Perfil.carrera).')
+        parser.add_argument('--periodo', required=True, help='Nombre del período (ej. "Período 2026-1").')
+        parser.add_argument('--cuotas', type=int, required=True, help='Cantidad de cuotas del plan.')
+        parser.add_argument('--monto', type=_monto, required=True, help='Monto de cada cuota.')
+        parser.add_argument('--primer-vencimiento', type=date.fromisoformat, required=True, help='Vencimiento de la primera cuota (AAAA-MM-DD); las demás vencen mes a mes.')
+        parser.add_argument('--batch-size', type=int, default=TAMANIO_LOTE_EMISION, help='Alumnos por lote.')
+        parser.add_argument('--dry-run', action='store_true', help='Solo contar las cuotas que se crearían.')
+
+    def handle(self, *args, **options):
+        if options['cuotas'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--cuotas y --batch-size deben ser mayores que 0.')
+
+        plan = armar_plan(options['cuotas'], options['monto'], options['primer_vencimiento'], options['periodo'])
+        self.stdout.write(self.style.NOTICE(
+            f"Emitiendo {len(plan)} cuotas de ${options['monto']} para la carrera '{options['carrera']}'..."
+        ))
+
+        inicio = time.monotonic()
+        totales = {'alumnos': 0, 'creadas': 0, 'existentes': 0}
+        try:
+            with bloqueo_tarea('emitir_cuotas') as bloqueo:
+                for resumen in emitir_cuotas(plan, options['carrera'], options['batch_size'], options['dry_run']):
+                    for clave, cantidad in resumen.items():
+                        totales[clave] += cantidad
+                    self.stdout.write(f"  {totales['alumnos']} alumnos, {totales['creadas']} cuotas nuevas")
+                    bloqueo.renovar()
+        except EstadoCuota.DoesNotExist:
+            raise CommandError('Error: No se encontró el estado "Pendiente".')
+        except TareaEnCurso as e:
+            raise CommandError(str(e))
+
+        prefijo = '[dry-run] Se crearían' if options['dry_run'] else '¡Éxito! Se crearon'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefijo} {totales['creadas']} cuotas para {totales['alumnos']} alumnos "
+            f"({totales['existentes']} ya existían) en {time.monotonic() - inicio:.1f}s."
+        ))
@@ -1,15 +1,49 @@
+import time
+
 from django.core.management.base import BaseCommand, CommandError
-from django.utils import timezone
+from django.db import close_old_connections, transaction
 from datetime import date
 
 # Importamos tus modelos exactos de models.py
-from ...models import CuponPago, EstadoCupon 
+from ...models import CuponPago, EstadoCupon
+from ...transiciones import cambiar_estado_cupones
+from ...catalogos import catalogos
+from ...bloqueos import bloqueo_tarea, TareaEnCurso
 
 class Command(BaseCommand):
     help = 'Busca y actualiza el estado de los cupones "Activos" a "Expirado" si su fecha de vencimiento ya pasó.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Cupones por lote (una transacción por lote).')
+        parser.add_argument('--pausa', type=float, default=0.1, help='Segundos de pausa entre lotes, para no acaparar la base.')
+        parser.add_argument('--loop', action='store_true', help='Quedarse corriendo y repetir el job cada --interval segundos.')
+        parser.add_argument('--interval', type=int, default=3600, help='Segundos entre ejecuciones (con --loop).')
+
     def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size debe ser mayor que 0.')
+
+        while True:
+            # Con --loop el proceso vive días: cierra la conexión que quedó
+            # abierta durante la espera (la base pudo cortarla por inactividad)
+            close_old_connections()
+            try:
+                # Un solo proceso a la vez, aunque se lance desde cron y en modo --loop
+                with bloqueo_tarea('expirar_cupones') as bloqueo:
+                    self.expirar(bloqueo, options['batch_size'], options['pausa'])
+            except TareaEnCurso as e:
+                if not options['loop']:
+                    raise CommandError(str(e))
+                self.stdout.write(self.style.WARNING(str(e)))
+
+            if not options['loop']:
+                break
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                break
 
+    def expirar(self, bloqueo, batch_size, pausa):
         # Obtenemos la fecha de hoy
         today = date.today()
 
@@ -17,8 +51,8 @@ class Command(BaseCommand):
 
         try:
             # 1. Obtenemos los estados que necesitamos (basado en tu models.py)
-            estado_activo = EstadoCupon.objects.get(nombre="Activo")
-            estado_expirado = EstadoCupon.objects.get(nombre="Expirado")
+            estado_activo = catalogos.estado_cupon("Activo")
+            estado_expirado = catalogos.estado_cupon("Expirado")
 
         except EstadoCupon.DoesNotExist as e:
             raise CommandError(f'Error: No se encontró uno de los estados requeridos ("Activo" o "Expirado"). Asegúrate de que existan en la base de datos. Detalle: {e}')
@@ -31,11 +65,37 @@ class Command(BaseCommand):
             fecha_vencimiento__lt=today
         )
 
-        # 3. Actualizamos todos los cupones encontrados en una sola consulta
-        # El método .update() devuelve el número de filas afectadas
-        count = cupones_a_expirar.update(estado_cupon=estado_expirado)
+        # 3. Los recorremos por lotes en orden de id (índice de la FK de estado,
+        # que ya incluye la clave primaria al final).
+        # Cada lote es una transacción corta: bloquea sus cupones, mueve los
+        # contadores de EstadisticaCupon, los pasa a "Expirado" con un UPDATE
+        # y libera sus cuotas (ver transiciones.cambiar_estado_cupones).
+        # Así GenerarCuponAPI no queda esperando detrás de un UPDATE gigante.
+        count = 0
+        ultimo_id = 0
+        inicio = time.monotonic()
+        while True:
+            cupon_ids = list(
+                cupones_a_expirar.filter(id__gt=ultimo_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not cupon_ids:
+                break
+            ultimo_id = cupon_ids[-1]
+
+            with transaction.atomic():
+                resultados = cambiar_estado_cupones(cupon_ids, estado_expirado)
+            count += sum(1 for resultado, _ in resultados.values() if resultado == 'actualizado')
+
+            segundos = max(time.monotonic() - inicio, 1e-6)
+            self.stdout.write(f'  {count} cupones expirados ({count / segundos:.0f} cupones/s)')
+
+            bloqueo.renovar()
+            if len(cupon_ids) < batch_size:
+                break
+            if pausa:
+                time.sleep(pausa)
 
         if count > 0:
-            self.stdout.write(self.style.SUCCESS(f'¡Éxito! Se actualizaron {count} cupones a "Expirado".'))
+            self.stdout.write(self.style.SUCCESS(f'¡Éxito! Se actualizaron {count} cupones a "Expirado" en {time.monotonic() - inicio:.1f}s.'))
         else:
-            self.stdout.write(self.style.SUCCESS('No se encontraron cupones para expirar.'))
\ No newline at end of file
+            self.stdout.write(self.style.SUCCESS('No se encontraron cupones para expirar.'))
@@ -0,0 +1,68 @@
+import os
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import CuponPago, EstadoCupon
+from ...catalogos import catalogos
+from ...filters import CuponPagoAdminFilter
+from ... import exportacion_pdf
+
+
+class Command(BaseCommand):
+    help = 'Exporta los PDF de muchos cupones de Pago Fácil (ej. todos los activos de una carrera) a un ZIP o a un único PDF, dibujándolos en paralelo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salida', required=True, help='Archivo a escribir (.zip o .pdf).')
+        parser.add_argument('--formato', choices=exportacion_pdf.FORMATOS, help='zip (un PDF por cupón) o pdf (un único PDF). Por defecto, según la extensión de --salida.')
+        parser.add_argument('--estado', help='Nombre del estado del cupón (ej. Activo).')
+        parser.add_argument('--carrera', help='Carrera de los alumnos.')
+        parser.add_argument('--fecha-desde', type=date.fromisoformat, help='Generados desde esta fecha (AAAA-MM-DD).')
+        parser.add_argument('--fecha-hasta', type=date.fromisoformat, help='Generados hasta esta fecha inclusive (AAAA-MM-DD).')
+        parser.add_argument('--workers', type=int, help='Procesos que dibujan los PDF (por defecto, PDF_LOTE_WORKERS). Crea un pool propio de ese tamaño.')
+        parser.add_argument('--batch-size', type=int, help='Cupones por tarea de cada proceso (por defecto, PDF_LOTE_TAMANIO).')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or os.path.splitext(options['salida'])[1].lstrip('.').lower()
+        if formato not in exportacion_pdf.FORMATOS:
+            raise CommandError('No se pudo deducir el formato: usa --formato zip o --formato pdf.')
+        for opcion in ('workers', 'batch_size'):
+            if options[opcion] is not None and options[opcion] < 1:
+                raise CommandError(f"--{opcion.replace('_', '-')} debe ser mayor que 0.")
+
+        # Los mismos filtros que la exportación desde la API
+        datos = {'carrera': options['carrera'], 'fecha_desde': options['fecha_desde'], 'fecha_hasta': options['fecha_hasta']}
+        if options['estado']:
+            try:
+                datos['estado'] = catalogos.estado_cupon(options['estado']).id
+            except EstadoCupon.DoesNotExist as e:
+                raise CommandError(str(e))
+        filtro = CuponPagoAdminFilter({clave: valor for clave, valor in datos.items() if valor is not None}, queryset=CuponPago.objects.all())
+        if not filtro.is_valid():
+            raise CommandError(f'Filtros inválidos: {filtro.errors}')
+        cupones = exportacion_pdf.cupones_pago_facil(filtro.qs)
+
+        total = cupones.count()
+        if total == 0:
+            self.stdout.write(self.style.WARNING('No hay cupones de Pago Fácil con esos filtros.'))
+            return
+        self.stdout.write(self.style.NOTICE(f'Exportando {total} cupones a {options["salida"]} ({formato})...'))
+
+        inicio = time.monotonic()
+        temporal = options['salida'] + '.tmp'
+        try:
+            with open(temporal, 'wb') as archivo:
+                for bloque in exportacion_pdf.iniciar(cupones, formato, options['workers'], options['batch_size']):
+                    archivo.write(bloque)
+            os.replace(temporal, options['salida'])
+        except exportacion_pdf.ExportacionFallida as e:
+            os.unlink(temporal)
+            raise CommandError(str(e))
+        except BaseException:
+            if os.path.exists(temporal):
+                os.unlink(temporal)
+            raise
+
+        segundos = max(time.monotonic() - inicio, 1e-6)
+        self.stdout.write(self.style.SUCCESS(f'¡Éxito! Se exportaron {total} cupones en {segundos:.1f}s ({total / segundos:.1f} cupones/s).'))
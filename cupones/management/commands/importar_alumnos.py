@@ -0,0 +1,48 @@
+import csv
+import sys
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from ...importacion import COLUMNAS_ERRORES, TAMANIO_LOTE_IMPORTACION, ImportadorAlumnos, leer_alumnos
+
+
+class Command(BaseCommand):
+    help = 'Importa alumnos desde un CSV (username, nombre, apellido, email, dni, legajo, carrera), creando User y Perfil por lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del CSV de alumnos (con encabezado).')
+        parser.add_argument('--errores', help='Archivo CSV donde escribir las filas rechazadas (por defecto, la salida estándar).')
+        parser.add_argument('--password-inicial', help='Contraseña inicial para las filas sin "password_hash". Sin esto, la contraseña queda inutilizable.')
+        parser.add_argument('--delimitador', default=',', help='Separador de columnas del CSV.')
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--batch-size', type=int, default=TAMANIO_LOTE_IMPORTACION, help='Filas por lote.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size debe ser mayor que 0.')
+
+        # Se hashea una sola vez para todo el archivo
+        password_hash = make_password(options['password_inicial']) if options['password_inicial'] else None
+
+        self.stdout.write(self.style.NOTICE(f"Importando alumnos de '{options['archivo']}'..."))
+        inicio = time.monotonic()
+        salida = open(options['errores'], 'w', newline='', encoding='utf-8-sig') if options['errores'] else sys.stdout
+        try:
+            escritor = csv.writer(salida)
+            escritor.writerow(COLUMNAS_ERRORES)
+            importador = ImportadorAlumnos(escritor, password_hash=password_hash, tamanio_lote=options['batch_size'])
+            with open(options['archivo'], newline='', encoding=options['encoding']) as archivo:
+                for creados, errores in importador.importar(leer_alumnos(archivo, options['delimitador'])):
+                    self.stdout.write(f'  {creados} alumnos creados, {errores} filas con error')
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        finally:
+            if salida is not sys.stdout:
+                salida.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'¡Éxito! Se importaron {importador.creados} alumnos en {time.monotonic() - inicio:.1f}s '
+            f'({importador.errores} filas con error).'
+        ))
@@ -0,0 +1,89 @@
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ...models import Cuota
+from ...catalogos import catalogos
+from ...cache_utils import clave_cuotas_pendientes
+from ...views import ListaCuotasPendientesAPI
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia de ListaCuotasPendientesAPI sin caché y con la caché de cuotas pendientes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alumno', help='Username del alumno a consultar (por defecto, el que tiene más cuotas).')
+        parser.add_argument('--sembrar', type=int, default=0, help='Crea un alumno con N cuotas pendientes para medir; se deshace al terminar.')
+        parser.add_argument('--repeticiones', type=int, default=200, help='Requests por medición.')
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] < 1:
+            raise CommandError('--repeticiones debe ser mayor que 0.')
+
+        # Todo corre en una transacción que se deshace: --sembrar no deja datos
+        with transaction.atomic():
+            alumno = self.sembrar(options['sembrar']) if options['sembrar'] else self.buscar_alumno(options['alumno'])
+            # La medición es en un solo proceso: la caché local sirve
+            with override_settings(CUOTAS_PENDIENTES_CACHE_LOCAL=True):
+                self.medir(alumno, options['repeticiones'])
+            transaction.set_rollback(True)
+
+    def buscar_alumno(self, username):
+        if username:
+            alumno = User.objects.filter(username=username).first()
+        else:
+            alumno = User.objects.annotate(total=Count('cuotas')).filter(total__gt=0).order_by('-total').first()
+        if alumno is None:
+            raise CommandError('No se encontró el alumno (usa --alumno o --sembrar).')
+        return alumno
+
+    def sembrar(self, cantidad):
+        alumno = User.objects.create_user(f'medicion_{time.time_ns()}')
+        pendiente = catalogos.estado_cuota('Pendiente')
+        hoy = date.today()
+        Cuota.objects.bulk_create([
+            Cuota(alumno=alumno, estado_cuota=pendiente, periodo=f'Cuota {i + 1}', monto=Decimal('1000.00'),
+                  fecha_vencimiento=hoy + timedelta(days=30 * i))
+            for i in range(cantidad)
+        ], batch_size=1000)
+        return alumno
+
+    def medir(self, alumno, repeticiones):
+        factory = APIRequestFactory()
+        vista = ListaCuotasPendientesAPI.as_view()
+        clave = clave_cuotas_pendientes(alumno.id)
+
+        def pedir():
+            request = factory.get('/cupones/lista-pendientes/')
+            force_authenticate(request, user=alumno)
+            inicio = time.perf_counter()
+            respuesta = vista(request)
+            respuesta.render()
+            return (time.perf_counter() - inicio) * 1000, len(respuesta.data)
+
+        for nombre, limpiar in (('Sin caché', True), ('Con caché', False)):
+            cache.delete(clave)
+            pedir() # Calentamiento (y, con caché, carga el payload)
+            tiempos = []
+            with CaptureQueriesContext(connection) as consultas:
+                for _ in range(repeticiones):
+                    if limpiar:
+                        cache.delete(clave)
+                    milisegundos, cuotas = pedir()
+                    tiempos.append(milisegundos)
+            tiempos.sort()
+            self.stdout.write(
+                f'  {nombre}: media {statistics.mean(tiempos):.2f} ms, p95 {tiempos[int(len(tiempos) * 0.95) - 1]:.2f} ms, '
+                f'{len(consultas) / repeticiones:.1f} consultas/request ({cuotas} cuotas)'
+            )
+        cache.delete(clave)
+        self.stdout.write(self.style.SUCCESS('Medición terminada (no se guardó ningún cambio).'))
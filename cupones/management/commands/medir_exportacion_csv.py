@@ -0,0 +1,122 @@
+import gc
+import resource
+import time
+import uuid
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from ...models import Cuota, CuponPago, PasarelaPago, Perfil
+from ...catalogos import catalogos
+from ...views import AdminExportarCuotasCSV, AdminExportarCuponesCSV
+
+VISTAS = {
+    'cuotas': (AdminExportarCuotasCSV, '/cupones/admin/exportar/cuotas/'),
+    'cupones': (AdminExportarCuponesCSV, '/cupones/admin/exportar/cupones/'),
+}
+TAMANIO_SIEMBRA = 10000
+ALUMNOS_SIEMBRA = 1000
+MUESTREO_RSS = 1000 # Cada cuántos bloques del CSV se mide la memoria
+
+
+def _rss_actual_mb():
+    """ Memoria residente actual del proceso (Linux); None si no se puede leer. """
+    try:
+        with open('/proc/self/status') as status:
+            for linea in status:
+                if linea.startswith('VmRSS:'):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _rss_pico_mb():
+    # ru_maxrss está en KB en Linux (en bytes en macOS)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = 'Mide tiempo y memoria (RSS) de la exportación CSV en streaming, recorriendo la respuesta de la vista.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tipo', choices=sorted(VISTAS), default='cuotas')
+        parser.add_argument('--sembrar', type=int, default=0, help='Crea N filas para medir (ej. 1000000); se deshace al terminar.')
+
+    def handle(self, *args, **options):
+        admin = User.objects.filter(is_staff=True).first()
+        if admin is None:
+            raise CommandError('Se necesita un usuario staff para llamar a la vista.')
+
+        # Todo corre en una transacción que se deshace: --sembrar no deja datos
+        with transaction.atomic():
+            if options['sembrar']:
+                inicio = time.perf_counter()
+                self.sembrar(options['tipo'], options['sembrar'])
+                self.stdout.write(f"  Siembra de {options['sembrar']} filas: {time.perf_counter() - inicio:.1f} s")
+            gc.collect()
+            self.medir(options['tipo'], admin)
+            transaction.set_rollback(True)
+
+    def sembrar(self, tipo, cantidad):
+        marca = time.time_ns()
+        User.objects.bulk_create([User(username=f'medicion_{marca}_{i}') for i in range(ALUMNOS_SIEMBRA)])
+        alumnos = list(User.objects.filter(username__startswith=f'medicion_{marca}_').values_list('id', flat=True))
+        Perfil.objects.bulk_create([
+            Perfil(user_id=alumno_id, dni=f'{marca % 10**6}{i}', legajo=f'M-{marca % 10**6}-{i}', carrera='Medición')
+            for i, alumno_id in enumerate(alumnos)
+        ])
+        hoy = date.today()
+        # Por tandas: la siembra no debe subir el pico de memoria que se quiere medir
+        for desde in range(0, cantidad, TAMANIO_SIEMBRA):
+            hasta = min(desde + TAMANIO_SIEMBRA, cantidad)
+            if tipo == 'cuotas':
+                pendiente = catalogos.estado_cuota('Pendiente')
+                filas = [
+                    Cuota(alumno_id=alumnos[i % len(alumnos)], estado_cuota=pendiente, periodo=f'Cuota {i}',
+                          monto=Decimal('1000.00'), fecha_vencimiento=hoy + timedelta(days=i % 365))
+                    for i in range(desde, hasta)
+                ]
+                Cuota.objects.bulk_create(filas)
+            else:
+                activo = catalogos.estado_cupon('Activo')
+                pasarela = PasarelaPago.objects.first()
+                filas = [
+                    CuponPago(alumno_id=alumnos[i % len(alumnos)], estado_cupon=activo, pasarela=pasarela,
+                              monto_total=Decimal('1000.00'), fecha_vencimiento=hoy, idempotency_key=uuid.uuid4())
+                    for i in range(desde, hasta)
+                ]
+                CuponPago.objects.bulk_create(filas)
+
+    def medir(self, tipo, admin):
+        vista, url = VISTAS[tipo]
+        request = APIRequestFactory().get(url)
+        force_authenticate(request, user=admin)
+
+        rss_inicial = _rss_actual_mb()
+        pico_inicial = _rss_pico_mb()
+        rss_maximo = rss_inicial or 0
+        bloques = bytes_totales = 0
+        inicio = time.perf_counter()
+        respuesta = vista.as_view()(request)
+        # generar_csv entrega una línea por bloque (la primera es el encabezado)
+        for bloque in respuesta.streaming_content:
+            bloques += 1
+            bytes_totales += len(bloque)
+            if bloques % MUESTREO_RSS == 0:
+                rss_maximo = max(rss_maximo, _rss_actual_mb() or 0)
+        segundos = time.perf_counter() - inicio
+        filas = bloques - 1
+
+        self.stdout.write(
+            f'  {filas} filas, {bytes_totales / 1024 / 1024:.1f} MB de CSV en {segundos:.1f} s '
+            f'({filas / segundos:.0f} filas/s)'
+        )
+        if rss_inicial is not None:
+            self.stdout.write(f'  RSS al empezar: {rss_inicial:.1f} MB, máximo durante la exportación: {rss_maximo:.1f} MB')
+        self.stdout.write(f'  Pico de RSS del proceso (ru_maxrss): antes {pico_inicial:.1f} MB, después {_rss_pico_mb():.1f} MB')
+        self.stdout.write(self.style.SUCCESS('Medición terminada (no se guardó ningún cambio).'))
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import CuponPago
+from ... import pdf_generator
+from . import _pdf_generator_anterior
+
+
+class Command(BaseCommand):
+    help = 'Mide cuántos PDF de cupón por segundo dibuja generate_pago_facil_pdf, contra el generador anterior (copia congelada).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cupon', type=int, help='Id del cupón a dibujar (por defecto, el último de Pago Fácil).')
+        parser.add_argument('--cantidad', type=int, default=200, help='Cantidad de PDF a dibujar en cada medición.')
+
+    def handle(self, *args, **options):
+        if options['cantidad'] < 1:
+            raise CommandError('--cantidad debe ser mayor que 0.')
+
+        cupones = CuponPago.objects.select_related('alumno__perfil', 'pasarela').prefetch_related('cuotas_incluidas')
+        if options['cupon']:
+            cupon = cupones.filter(pk=options['cupon']).first()
+        else:
+            cupon = cupones.filter(pasarela__nombre__iexact='pago fácil').order_by('-id').first()
+        if cupon is None:
+            raise CommandError('No se encontró un cupón para dibujar.')
+        # Se fuerza la carga de las cuotas antes de medir
+        list(cupon.cuotas_incluidas.all())
+
+        # 1. El generador anterior (copia sin cambios, ver _pdf_generator_anterior.py)
+        anterior = self.medir(_pdf_generator_anterior.generate_pago_facil_pdf, cupon, options['cantidad'])
+        self.stdout.write(f'  Generador anterior: {anterior:.1f} PDF/s')
+
+        # 2. El actual, volviendo a armar el logo y el QR en cada PDF
+        frio = self.medir(pdf_generator.generate_pago_facil_pdf, cupon, options['cantidad'], descartar_caches=True)
+        self.stdout.write(f'  Actual, sin caché de plantilla: {frio:.1f} PDF/s ({frio / anterior:.2f}x)')
+
+        # 3. El actual, con el logo y el QR armados una sola vez por proceso
+        caliente = self.medir(pdf_generator.generate_pago_facil_pdf, cupon, options['cantidad'])
+        self.stdout.write(f'  Actual, con caché de plantilla: {caliente:.1f} PDF/s ({caliente / anterior:.2f}x)')
+
+        self.stdout.write(self.style.SUCCESS(f'Cupón {cupon.id}: {caliente / anterior:.2f}x más rápido que el generador anterior.'))
+
+    def medir(self, generar, cupon, cantidad, descartar_caches=False):
+        generar(cupon) # Calentamiento (imports, fuentes)
+        inicio = time.perf_counter()
+        for _ in range(cantidad):
+            if descartar_caches:
+                pdf_generator._logo.cache_clear()
+                pdf_generator._qr.cache_clear()
+                pdf_generator._comprimir.cache_clear()
+                pdf_generator._nombre_logo.cache_clear()
+            generar(cupon)
+        return cantidad / max(time.perf_counter() - inicio, 1e-9)
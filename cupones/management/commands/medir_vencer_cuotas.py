@@ -0,0 +1,105 @@
+import io
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ...models import Cuota
+from ...catalogos import catalogos
+
+TAMANIO_SIEMBRA = 10000
+ALUMNOS_SIEMBRA = 5000
+
+
+class MedidorUpdates:
+    """
+    execute_wrapper que toma el tiempo de cada UPDATE sobre las cuotas: en
+    vencer_cuotas cada uno es un lote, y su duración es lo que el lote
+    mantiene bloqueadas sus filas.
+    """
+    def __init__(self):
+        self.tiempos = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith('UPDATE') or Cuota._meta.db_table not in sql:
+            return execute(sql, params, many, context)
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempos.append((time.perf_counter() - inicio) * 1000)
+
+
+class Command(BaseCommand):
+    help = 'Mide vencer_cuotas (conteo en --dry-run y la corrida real) sobre una tabla de cuotas grande.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sembrar', type=int, default=0, help='Crea N cuotas para medir (ej. 5000000); se deshace al terminar.')
+        parser.add_argument('--vencidas', type=float, default=0.2, help='Fracción de las cuotas sembradas que ya venció (0 a 1).')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Se pasa a vencer_cuotas.')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['vencidas'] <= 1:
+            raise CommandError('--vencidas debe estar entre 0 y 1.')
+
+        # Todo corre en una transacción que se deshace: ni la siembra ni las
+        # cuotas vencidas quedan guardadas. Por eso los lotes no se confirman
+        # uno a uno como en la corrida real; el tiempo de cada UPDATE sí es el mismo.
+        with transaction.atomic():
+            if options['sembrar']:
+                inicio = time.perf_counter()
+                self.sembrar(options['sembrar'], options['vencidas'])
+                self.stdout.write(f"  Siembra de {options['sembrar']} cuotas: {time.perf_counter() - inicio:.1f} s")
+            self.stdout.write(f'  Cuotas en la tabla: {Cuota.objects.count()}')
+            self.medir(options['batch_size'])
+            transaction.set_rollback(True)
+
+    def sembrar(self, cantidad, vencidas):
+        marca = time.time_ns()
+        User.objects.bulk_create([User(username=f'medicion_{marca}_{i}') for i in range(ALUMNOS_SIEMBRA)])
+        alumnos = list(User.objects.filter(username__startswith=f'medicion_{marca}_').values_list('id', flat=True))
+        pendiente = catalogos.estado_cuota('Pendiente')
+        pagada = catalogos.estado_cuota('Pagada')
+        hoy = date.today()
+        cantidad_vencidas = int(cantidad * vencidas)
+        for desde in range(0, cantidad, TAMANIO_SIEMBRA):
+            hasta = min(desde + TAMANIO_SIEMBRA, cantidad)
+            # Las primeras 'cantidad_vencidas' están vencidas; del resto, la
+            # mitad ya está pagada (el índice tiene que saltear esas filas)
+            Cuota.objects.bulk_create([
+                Cuota(
+                    alumno_id=alumnos[i % len(alumnos)],
+                    estado_cuota=pendiente if i < cantidad_vencidas or i % 2 else pagada,
+                    periodo=f'Cuota {i}',
+                    monto=Decimal('1000.00'),
+                    fecha_vencimiento=hoy - timedelta(days=1 + i % 365) if i < cantidad_vencidas else hoy + timedelta(days=i % 365)
+                )
+                for i in range(desde, hasta)
+            ])
+
+    def medir(self, batch_size):
+        salida = io.StringIO()
+        inicio = time.perf_counter()
+        call_command('vencer_cuotas', '--dry-run', stdout=salida)
+        self.stdout.write(f'  --dry-run: {(time.perf_counter() - inicio) * 1000:.0f} ms ({salida.getvalue().strip()})')
+
+        medidor = MedidorUpdates()
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(medidor):
+            call_command('vencer_cuotas', '--batch-size', str(batch_size), '--pausa', '0', stdout=io.StringIO())
+        segundos = time.perf_counter() - inicio
+
+        vencidas = Cuota.objects.filter(estado_cuota=catalogos.estado_cuota('Vencida'), fecha_vencimiento__lt=date.today()).count()
+        self.stdout.write(f'  Corrida: {vencidas} cuotas vencidas en {segundos:.1f} s ({vencidas / max(segundos, 1e-6):.0f} cuotas/s)')
+        if medidor.tiempos:
+            tiempos = sorted(medidor.tiempos)
+            self.stdout.write(
+                f'  {len(tiempos)} lotes (UPDATE): media {statistics.mean(tiempos):.1f} ms, '
+                f'p95 {tiempos[max(int(len(tiempos) * 0.95) - 1, 0)]:.1f} ms, máximo {tiempos[-1]:.1f} ms'
+            )
+        self.stdout.write(self.style.SUCCESS('Medición terminada (no se guardó ningún cambio).'))
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from ...models import EstadoCupon, EstadoCuota
+from ...webhooks import DIFERIDO, TAMANIO_LOTE_EVENTOS, procesar_lote
+
+
+class Command(BaseCommand):
+    help = 'Aplica por lotes los eventos pendientes de la bandeja de webhooks de las pasarelas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANIO_LOTE_EVENTOS, help='Eventos por lote.')
+        parser.add_argument('--loop', action='store_true', help='No terminar: seguir esperando eventos nuevos.')
+        parser.add_argument('--intervalo', type=float, default=2.0, help='Segundos de espera cuando la bandeja está vacía (con --loop).')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.NOTICE('Procesando eventos de las pasarelas...'))
+        totales = {}
+        try:
+            while True:
+                resumen = procesar_lote(options['lote'])
+                for estado, cantidad in resumen.items():
+                    totales[estado] = totales.get(estado, 0) + cantidad
+                if resumen:
+                    # También si todo el lote quedó diferido: se sigue con el próximo
+                    self.stdout.write(
+                        f"  Lote: {resumen.get('procesado', 0)} procesados, {resumen.get('error', 0)} con error, "
+                        f"{resumen.get(DIFERIDO, 0)} diferidos."
+                    )
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['intervalo'])
+                # La conexión pudo quedar vencida durante la espera
+                close_old_connections()
+        except (EstadoCupon.DoesNotExist, EstadoCuota.DoesNotExist) as e:
+            raise CommandError(f'Falta un estado requerido en la base de datos. Detalle: {e}')
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"¡Éxito! {totales.get('procesado', 0)} eventos procesados, {totales.get('error', 0)} con error."
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, DateField
+from django.db.models.functions import TruncMonth
+
+from ...models import CuponPago, EstadisticaCupon
+
+
+class Command(BaseCommand):
+    help = 'Recalcula desde cero los contadores de EstadisticaCupon a partir de la tabla de cupones.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.NOTICE('Recalculando estadísticas de cupones...'))
+
+        filas = (
+            CuponPago.objects
+            .annotate(mes=TruncMonth('fecha_generacion', output_field=DateField()))
+            .values('estado_cupon_id', 'pasarela_id', 'mes')
+            .annotate(cantidad=Count('id'))
+            .order_by()
+        )
+
+        # Se borra y se vuelve a crear en una sola transacción, así nadie lee
+        # contadores a medio reconstruir.
+        with transaction.atomic():
+            EstadisticaCupon.objects.all().delete()
+            creadas = EstadisticaCupon.objects.bulk_create([EstadisticaCupon(**fila) for fila in filas])
+
+        total = sum(fila.cantidad for fila in creadas)
+        self.stdout.write(self.style.SUCCESS(f'¡Éxito! Se recalcularon {len(creadas)} contadores ({total} cupones).'))
@@ -0,0 +1,81 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...models import Cuota, EstadoCuota
+from ...catalogos import catalogos
+from ...bloqueos import bloqueo_tarea, TareaEnCurso
+from ...cache_utils import invalidar_cuotas_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Pasa a "Vencida" las cuotas "Pendiente" cuya fecha de vencimiento ya pasó.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Cuotas por lote (un UPDATE por lote).')
+        parser.add_argument('--pausa', type=float, default=0.1, help='Segundos de pausa entre lotes.')
+        parser.add_argument('--dry-run', action='store_true', help='Solo contar las cuotas que se vencerían, sin modificarlas.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size debe ser mayor que 0.')
+
+        today = date.today()
+        try:
+            estado_pendiente = catalogos.estado_cuota('Pendiente')
+            estado_vencida = catalogos.estado_cuota('Vencida')
+        except EstadoCuota.DoesNotExist as e:
+            raise CommandError(f'Error: No se encontró uno de los estados requeridos ("Pendiente" o "Vencida"). Detalle: {e}')
+
+        # Se resuelve con el índice (estado_cuota, fecha_vencimiento)
+        cuotas_a_vencer = Cuota.objects.filter(estado_cuota=estado_pendiente, fecha_vencimiento__lt=today)
+
+        if options['dry_run']:
+            total = cuotas_a_vencer.count()
+            self.stdout.write(self.style.SUCCESS(f'[dry-run] Hay {total} cuotas vencidas al {today} para pasar a "Vencida".'))
+            return
+
+        self.stdout.write(self.style.NOTICE(f'Venciendo cuotas con vencimiento anterior a {today}...'))
+        try:
+            with bloqueo_tarea('vencer_cuotas') as bloqueo:
+                count, segundos = self.vencer(cuotas_a_vencer, estado_pendiente, estado_vencida, bloqueo, options)
+        except TareaEnCurso as e:
+            raise CommandError(str(e))
+
+        if count > 0:
+            self.stdout.write(self.style.SUCCESS(f'¡Éxito! Se pasaron {count} cuotas a "Vencida" en {segundos:.1f}s.'))
+        else:
+            self.stdout.write(self.style.SUCCESS('No se encontraron cuotas para vencer.'))
+
+    def vencer(self, cuotas_a_vencer, estado_pendiente, estado_vencida, bloqueo, options):
+        """
+        Cada lote toma los primeros N ids en el orden del índice y los
+        actualiza con un UPDATE condicional (solo si siguen "Pendiente").
+        Las cuotas actualizadas dejan de cumplir el filtro, así que cada
+        lote vuelve a empezar desde el principio del rango sin recorrerlo entero.
+        """
+        count = 0
+        inicio = time.monotonic()
+        while True:
+            lote = list(
+                cuotas_a_vencer.order_by('fecha_vencimiento', 'id').values_list('id', 'alumno_id')[:options['batch_size']]
+            )
+            if not lote:
+                break
+
+            count += Cuota.objects.filter(
+                id__in=[cuota_id for cuota_id, _ in lote],
+                estado_cuota=estado_pendiente
+            ).update(estado_cuota=estado_vencida)
+            invalidar_cuotas_pendientes(*{alumno_id for _, alumno_id in lote})
+
+            segundos = max(time.monotonic() - inicio, 1e-6)
+            self.stdout.write(f'  {count} cuotas vencidas ({count / segundos:.0f} cuotas/s)')
+
+            bloqueo.renovar()
+            if len(lote) < options['batch_size']:
+                break
+            if options['pausa']:
+                time.sleep(options['pausa'])
+        return count, time.monotonic() - inicio
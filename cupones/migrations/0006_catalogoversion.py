@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+def crear_fila_version(apps, schema_editor):
+    CatalogoVersion = apps.get_model('cupones', 'CatalogoVersion')
+    CatalogoVersion.objects.get_or_create(pk=1, defaults={'version': 0})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cupones', '0005_cuponpago_es_pago_parcial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogoVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(crear_fila_version, migrations.RunPython.noop),
+    ]
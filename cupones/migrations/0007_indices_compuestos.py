@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cupones', '0006_catalogoversion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cuota',
+            index=models.Index(fields=['alumno', 'fecha_vencimiento', 'estado_cuota'], name='cuota_alumno_venc_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cuponpago',
+            index=models.Index(fields=['alumno', '-fecha_generacion'], name='cupon_alumno_fecha_gen_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cuponpago',
+            index=models.Index(fields=['estado_cupon', 'fecha_vencimiento'], name='cupon_estado_venc_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def marcar_cupones_activos(apps, schema_editor):
+    """
+    Completa cupon_activo con los cupones 'Activo' existentes.
+    Si una cuota quedó en más de un cupón activo, gana el más reciente.
+    """
+    CuponPagoCuota = apps.get_model('cupones', 'CuponPagoCuota')
+    Cuota = apps.get_model('cupones', 'Cuota')
+    detalles = (
+        CuponPagoCuota.objects
+        .filter(cupon_pago__estado_cupon__nombre='Activo')
+        .order_by('cupon_pago_id')
+        .values_list('cuota_id', 'cupon_pago_id')
+    )
+    activo_por_cuota = dict(detalles.iterator())
+    for cuota_id, cupon_id in activo_por_cuota.items():
+        Cuota.objects.filter(pk=cuota_id).update(cupon_activo_id=cupon_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cupones', '0007_indices_compuestos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cuota',
+            name='cupon_activo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cuotas_activas', to='cupones.cuponpago'),
+        ),
+        migrations.RunPython(marcar_cupones_activos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.25 on 2026-10-17 03:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cupones', '0008_cuota_cupon_activo'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cuponpago',
+            name='cupon_alumno_fecha_gen_idx',
+        ),
+        migrations.AddIndex(
+            model_name='cuponpago',
+            index=models.Index(fields=['alumno', '-fecha_generacion', '-id'], name='cupon_alumno_gen_id_idx'),
+        ),
+    ]
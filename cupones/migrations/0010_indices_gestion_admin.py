@@ -0,0 +1,54 @@
+# Generated by Django 4.2.25 on 2026-10-17 03:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Búsqueda por nombre en la gestión de cupones y cuotas (filters.py): cada
+# columna se filtra por prefijo con su propio índice. La tabla de usuarios
+# es de django.contrib.auth, así que los índices se crean a mano.
+INDICES_USUARIO = {
+    'user_first_name_idx': 'first_name',
+    'user_last_name_idx': 'last_name',
+}
+
+
+def _tabla_usuarios(apps):
+    return apps.get_model(*settings.AUTH_USER_MODEL.split('.'))._meta.db_table
+
+
+def crear_indices(apps, schema_editor):
+    tabla = schema_editor.quote_name(_tabla_usuarios(apps))
+    for nombre, columna in INDICES_USUARIO.items():
+        schema_editor.execute(
+            f'CREATE INDEX {schema_editor.quote_name(nombre)} ON {tabla} ({schema_editor.quote_name(columna)})'
+        )
+
+
+def borrar_indices(apps, schema_editor):
+    tabla = schema_editor.quote_name(_tabla_usuarios(apps))
+    for nombre in INDICES_USUARIO:
+        schema_editor.execute(schema_editor.sql_delete_index % {'table': tabla, 'name': schema_editor.quote_name(nombre)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cupones', '0009_indice_historial_cursor'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cuponpago',
+            index=models.Index(fields=['-fecha_generacion', '-id'], name='cupon_gen_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cuponpago',
+            index=models.Index(fields=['estado_cupon', '-fecha_generacion', '-id'], name='cupon_estado_gen_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cuponpago',
+            index=models.Index(fields=['pasarela', '-fecha_generacion', '-id'], name='cupon_pasarela_gen_id_idx'),
+        ),
+        migrations.RunPython(crear_indices, borrar_indices),
+    ]
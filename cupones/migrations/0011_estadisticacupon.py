@@ -0,0 +1,41 @@
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+
+
+def calcular_estadisticas(apps, schema_editor):
+    CuponPago = apps.get_model('cupones', 'CuponPago')
+    EstadisticaCupon = apps.get_model('cupones', 'EstadisticaCupon')
+    filas = (
+        CuponPago.objects
+        .annotate(mes=TruncMonth('fecha_generacion', output_field=models.DateField()))
+        .values('estado_cupon_id', 'pasarela_id', 'mes')
+        .annotate(cantidad=Count('id'))
+        .order_by()
+    )
+    EstadisticaCupon.objects.bulk_create([EstadisticaCupon(**fila) for fila in filas])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cupones', '0010_indices_gestion_admin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaCupon',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mes', models.DateField()),
+                ('cantidad', models.BigIntegerField(default=0)),
+                ('estado_cupon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas', to='cupones.estadocupon')),
+                ('pasarela', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estadisticas', to='cupones.pasarelapago')),
+            ],
+            options={
+                'unique_together': {('estado_cupon', 'pasarela', 'mes')},
+            },
+        ),
+        migrations.RunPython(calcular_estadisticas, migrations.RunPython.noop),
+    ]
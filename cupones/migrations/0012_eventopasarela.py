@@ -0,0 +1,33 @@
+# Generated by Django 4.2.25 on 2026-10-17 03:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cupones', '0011_estadisticacupon'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoPasarela',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('evento_id', models.CharField(max_length=255)),
+                ('tipo', models.CharField(max_length=50)),
+                ('payload', models.TextField()),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('procesado', 'Procesado'), ('error', 'Error')], default='pendiente', max_length=20)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('fecha_recepcion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_procesado', models.DateTimeField(blank=True, null=True)),
+                ('pasarela', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='eventos', to='cupones.pasarelapago')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'id'], name='evento_estado_id_idx')],
+                'unique_together': {('pasarela', 'evento_id')},
+            },
+        ),
+    ]
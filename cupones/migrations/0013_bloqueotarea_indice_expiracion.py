@@ -0,0 +1,23 @@
+# Generated by Django 4.2.25 on 2026-10-17 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cupones', '0012_eventopasarela'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BloqueoTarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True)),
+                ('dueno', models.CharField(max_length=64)),
+                ('desde', models.DateTimeField()),
+                ('hasta', models.DateTimeField()),
+            ],
+        ),
+    ]
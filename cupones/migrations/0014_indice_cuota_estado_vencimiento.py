@@ -0,0 +1,17 @@
+# Generated by Django 4.2.25 on 2026-10-17 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cupones', '0013_bloqueotarea_indice_expiracion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cuota',
+            index=models.Index(fields=['estado_cuota', 'fecha_vencimiento'], name='cuota_estado_venc_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.25 on 2026-10-17 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cupones', '0014_indice_cuota_estado_vencimiento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TasaRecargo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dias_desde', models.PositiveIntegerField(unique=True)),
+                ('porcentaje', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('descripcion', models.CharField(blank=True, max_length=255, null=True)),
+            ],
+            options={
+                'ordering': ['dias_desde'],
+            },
+        ),
+        migrations.AddField(
+            model_name='cuota',
+            name='fecha_recargo',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cuota',
+            name='recargo',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='cuota',
+            name='recargo_pagado',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='cuponpagocuota',
+            name='recargo_cuota',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+    ]
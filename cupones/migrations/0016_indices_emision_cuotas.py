@@ -0,0 +1,21 @@
+# Generated by Django 4.2.25 on 2026-10-17 03:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cupones', '0015_recargos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cuota',
+            index=models.Index(fields=['alumno', 'periodo'], name='cuota_alumno_periodo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='perfil',
+            index=models.Index(fields=['carrera', 'user'], name='perfil_carrera_user_idx'),
+        ),
+    ]
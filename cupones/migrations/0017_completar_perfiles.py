@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db import migrations
+
+
+def crear_perfiles_faltantes(apps, schema_editor):
+    # Hasta ahora la señal de User creaba el Perfil faltante en cualquier
+    # save(); desde esta versión solo lo crea al dar de alta el usuario.
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Perfil = apps.get_model('cupones', 'Perfil')
+    user_ids = list(User.objects.filter(perfil__isnull=True).values_list('id', flat=True))
+    Perfil.objects.bulk_create([Perfil(user_id=user_id) for user_id in user_ids], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cupones', '0016_indices_emision_cuotas'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_perfiles_faltantes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.25 on 2026-10-17 03:34
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cupones', '0018_systemlog'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='systemlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['-timestamp', '-id'], name='log_timestamp_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='log_user_timestamp_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='systemlog',
+            index=models.Index(fields=['action', '-timestamp', '-id'], name='log_action_timestamp_id_idx'),
+        ),
+    ]
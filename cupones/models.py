@@ -1,4 +1,8 @@
-from django.db import models
+import traceback
+
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.contrib.auth.models import User # El sistema de usuarios de Django
 
 # --- TABLAS "MAESTRAS" O "CATÁLOGO" ---
@@ -40,6 +44,34 @@ class PasarelaPago(models.Model):
     def __str__(self):
         return self.nombre
 
+class CatalogoVersion(models.Model):
+    """
+    Contador de versión de las tablas catálogo (EstadoCuota, EstadoCupon,
+    PasarelaPago). Cada escritura sobre ellas lo incrementa y así los
+    workers saben que deben recargar su copia en memoria (ver catalogos.py).
+    Tiene una sola fila (pk=1).
+    """
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Versión de catálogos: {self.version}"
+
+class TasaRecargo(models.Model):
+    """
+    Tabla de recargos por mora. Cada fila es un tramo: a partir de
+    'dias_desde' días de atraso la cuota lleva un recargo de 'porcentaje'
+    sobre su monto. Se aplica el tramo más alto alcanzado (ver recargos.py).
+    """
+    dias_desde = models.PositiveIntegerField(unique=True)
+    porcentaje = models.DecimalField(max_digits=5, decimal_places=2)
+    descripcion = models.CharField(max_length=255, blank=True, null=True)
+
+    class Meta:
+        ordering = ['dias_desde']
+
+    def __str__(self):
+        return f"{self.porcentaje}% desde {self.dias_desde} días de atraso"
+
 # --- TABLAS TRANSACCIONALES ---
 # (El corazón de tu módulo)
 
@@ -60,10 +92,74 @@ class Cuota(models.Model):
     monto = models.DecimalField(max_digits=10, decimal_places=2)
     saldo_pendiente = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     fecha_vencimiento = models.DateField()
+
+    # Recargo por mora calculado por 'aplicar_recargos' y fecha del cálculo.
+    # 'recargo' es el total devengado; lo ya cobrado de él va en 'recargo_pagado'
+    # (así recalcular el recargo no vuelve a cobrar lo que ya se pagó)
+    recargo = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    recargo_pagado = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    fecha_recargo = models.DateField(null=True, blank=True)
+
+    # Cupón "Activo" que cubre esta cuota (si hay). Se mantiene al generar,
+    # anular, pagar y expirar cupones (ver transiciones.py). Como se reclama
+    # con un UPDATE condicional, la BD garantiza un solo cupón activo por cuota.
+    cupon_activo = models.ForeignKey(
+        'CuponPago',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="cuotas_activas"
+    )
+
+    class Meta:
+        indexes = [
+            # Lista de cuotas pendientes: filtra por alumno y estado, ordena por vencimiento.
+            # El estado va al final porque se filtra con IN (Pendiente, Vencida):
+            # así el índice ya entrega las filas ordenadas y no hace falta ordenar.
+            models.Index(fields=['alumno', 'fecha_vencimiento', 'estado_cuota'], name='cuota_alumno_venc_estado_idx'),
+            # vencer_cuotas: cuotas de un estado con vencimiento anterior a hoy
+            models.Index(fields=['estado_cuota', 'fecha_vencimiento'], name='cuota_estado_venc_idx'),
+            # emitir_cuotas: verifica qué (alumno, período) ya existen
+            models.Index(fields=['alumno', 'periodo'], name='cuota_alumno_periodo_idx'),
+        ]
     
     def __str__(self):
         return f"Cuota de {self.alumno.username} - {self.periodo}"
 
+    @property
+    def saldo_capital(self):
+        return self.saldo_pendiente if self.saldo_pendiente is not None else self.monto
+
+    @property
+    def recargo_pendiente(self):
+        return max(self.recargo - self.recargo_pagado, 0)
+
+    @property
+    def total_adeudado(self):
+        """ Lo que falta pagar: saldo de la cuota más el recargo todavía no cobrado. """
+        return self.saldo_capital + self.recargo_pendiente
+
+    def imputar_pago(self, monto):
+        """
+        Aplica un pago: primero cancela el recargo pendiente y el resto se
+        descuenta del saldo. No guarda; devuelve True si la cuota quedó sin deuda.
+        """
+        al_recargo = min(monto, self.recargo_pendiente)
+        self.recargo_pagado += al_recargo
+        self.saldo_pendiente = max(self.saldo_capital - (monto - al_recargo), 0)
+        return self.total_adeudado <= 0
+
+    def liquidar(self, recargo_cubierto):
+        """
+        Aplica el pago de un cupón completo: cancela el saldo y el recargo que
+        cubría el cupón (CuponPagoCuota.recargo_cuota). Si el recargo subió
+        después de generarlo, la diferencia queda pendiente. No guarda;
+        devuelve True si la cuota quedó sin deuda.
+        """
+        self.recargo_pagado = min(self.recargo_pagado + recargo_cubierto, self.recargo)
+        self.saldo_pendiente = 0
+        return self.total_adeudado <= 0
+
 class PagoParcial(models.Model):
     """
     Registra un pago parcial realizado sobre una cuota.
@@ -111,7 +207,27 @@ class CuponPago(models.Model):
         through='CuponPagoCuota',
         related_name="cupones"
     )
+
+    class Meta:
+        indexes = [
+            # Historial del alumno: filtra por alumno, pagina por cursor sobre (fecha de generación, id)
+            models.Index(fields=['alumno', '-fecha_generacion', '-id'], name='cupon_alumno_gen_id_idx'),
+            # expirar_cupones: filtra por estado y vencimiento
+            models.Index(fields=['estado_cupon', 'fecha_vencimiento'], name='cupon_estado_venc_idx'),
+            # Gestión de cupones (Admin): listado por cursor, sin filtro o
+            # filtrado por estado o pasarela
+            models.Index(fields=['-fecha_generacion', '-id'], name='cupon_gen_id_idx'),
+            models.Index(fields=['estado_cupon', '-fecha_generacion', '-id'], name='cupon_estado_gen_id_idx'),
+            models.Index(fields=['pasarela', '-fecha_generacion', '-id'], name='cupon_pasarela_gen_id_idx'),
+        ]
     
+    def get_url_pdf(self):
+        """
+        URL para descargar el PDF. Se deriva del id, así al crear el cupón
+        no hace falta un segundo UPDATE para guardarla.
+        """
+        return self.url_pdf or f'/cupones/cupon/{self.id}/descargar/'
+
     def __str__(self):
         return f"Cupón {self.id} de {self.alumno.username} por ${self.monto_total}"
 
@@ -126,6 +242,9 @@ class CuponPagoCuota(models.Model):
     
     # Guardamos el monto de la cuota en ese momento
     monto_cuota = models.DecimalField(max_digits=10, decimal_places=2) 
+    # Recargo por mora que cobra el cupón por esta cuota (el pendiente al
+    # generarlo): al pagarse se cancela solo esto (ver Cuota.liquidar)
+    recargo_cuota = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
     class Meta:
         # Evita que se pueda añadir la misma cuota al mismo cupón dos veces
@@ -134,6 +253,141 @@ class CuponPagoCuota(models.Model):
     def __str__(self):
         return f"Detalle: Cupón {self.cupon_pago.id} -> Cuota {self.cuota.id}"
 
+class EstadisticaCupon(models.Model):
+    """
+    Contador de cupones por estado, pasarela y mes de generación.
+    Se actualiza al confirmarse cada cambio de estado (señales de CuponPago
+    y transiciones.py para los UPDATE masivos), así las estadísticas del
+    admin se leen de esta tabla chica en vez de agregar toda la tabla
+    CuponPago. 'recalcular_estadisticas_cupones' la rehace.
+    """
+    estado_cupon = models.ForeignKey(EstadoCupon, on_delete=models.CASCADE, related_name="estadisticas")
+    pasarela = models.ForeignKey(PasarelaPago, on_delete=models.CASCADE, related_name="estadisticas")
+    mes = models.DateField() # Primer día del mes de generación
+    cantidad = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('estado_cupon', 'pasarela', 'mes')
+
+    def __str__(self):
+        return f"{self.estado_cupon_id}/{self.pasarela_id}/{self.mes:%Y-%m}: {self.cantidad}"
+
+    @staticmethod
+    def mes_de(fecha_generacion):
+        """ Mes (primer día) al que corresponde un cupón, en la zona horaria actual. """
+        return timezone.localtime(fecha_generacion).date().replace(day=1)
+
+    @classmethod
+    def ajustar(cls, deltas):
+        """
+        Suma los deltas a los contadores cuando se confirma la transacción
+        actual (en el momento, si no hay una). 'deltas' es un dict
+        {(estado_cupon_id, pasarela_id, mes): delta}.
+
+        Se difiere porque todos los cupones del mes suman en la misma fila:
+        hecho dentro de la transacción que crea el cupón, el bloqueo de esa
+        fila duraría toda la transacción y serializaría las generaciones.
+        """
+        deltas = {clave: delta for clave, delta in deltas.items() if delta}
+        if deltas:
+            transaction.on_commit(lambda: cls._aplicar(deltas))
+
+    @classmethod
+    def _aplicar(cls, deltas):
+        try:
+            # Transacción corta y filas en orden fijo: dos ajustes no se bloquean mutuamente
+            with transaction.atomic():
+                for (estado_id, pasarela_id, mes), delta in sorted(deltas.items()):
+                    filtro = {'estado_cupon_id': estado_id, 'pasarela_id': pasarela_id, 'mes': mes}
+                    if cls.objects.filter(**filtro).update(cantidad=F('cantidad') + delta):
+                        continue
+                    _, creado = cls.objects.get_or_create(**filtro, defaults={'cantidad': delta})
+                    if not creado:
+                        # Otra transacción creó la fila entre el UPDATE y el INSERT
+                        cls.objects.filter(**filtro).update(cantidad=F('cantidad') + delta)
+        except Exception:
+            # El cambio de estado ya se confirmó: no se le devuelve un error al
+            # usuario. El contador queda corrido hasta 'recalcular_estadisticas_cupones'.
+            print(traceback.format_exc())
+
+
+class EventoPasarela(models.Model):
+    """
+    Bandeja de entrada de las notificaciones (webhooks) de las pasarelas.
+    El endpoint solo valida la firma y guarda el cuerpo tal cual llegó;
+    el comando 'procesar_eventos_pasarela' las aplica luego por lotes.
+    La restricción única (pasarela, evento_id) descarta los reenvíos.
+    """
+    PENDIENTE = 'pendiente'
+    PROCESADO = 'procesado'
+    ERROR = 'error'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'),
+        (PROCESADO, 'Procesado'),
+        (ERROR, 'Error'),
+    ]
+
+    pasarela = models.ForeignKey(PasarelaPago, on_delete=models.PROTECT, related_name="eventos")
+    evento_id = models.CharField(max_length=255) # ID del evento según la pasarela
+    tipo = models.CharField(max_length=50)
+    payload = models.TextField() # Cuerpo original (JSON) de la notificación
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    fecha_recepcion = models.DateTimeField(auto_now_add=True)
+    fecha_procesado = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        unique_together = ('pasarela', 'evento_id')
+        indexes = [
+            # procesar_eventos_pasarela: toma los pendientes en orden de llegada
+            models.Index(fields=['estado', 'id'], name='evento_estado_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"Evento {self.evento_id} de {self.pasarela_id} ({self.estado})"
+
+
+class BloqueoTarea(models.Model):
+    """
+    Bloqueo para que un comando programado (ej. expirar_cupones) no corra
+    dos veces a la vez, aunque se lance desde distintos servidores.
+    Una fila por tarea en curso; 'hasta' permite recuperar el bloqueo de un
+    proceso que murió sin liberarlo. Se usa a través de bloqueos.py.
+    """
+    nombre = models.CharField(max_length=100, unique=True)
+    dueno = models.CharField(max_length=64) # Identificador del proceso que lo tiene
+    desde = models.DateTimeField()
+    hasta = models.DateTimeField()
+
+    def __str__(self):
+        return f"Bloqueo '{self.nombre}' hasta {self.hasta}"
+
+
+class SystemLog(models.Model):
+    """
+    Registro de auditoría de las acciones de usuarios y administradores.
+    Se escribe a través de logging_utils (buffer en memoria + bulk_create),
+    por eso 'timestamp' se fija al registrar la acción y no al insertar.
+    """
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="logs")
+    action = models.CharField(max_length=100)
+    detail = models.TextField(blank=True, default="")
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # SystemLogListAPI: paginación por cursor, sin filtro o filtrando por usuario o acción.
+            # El primero también sirve a 'archivar_logs' (timestamp < corte).
+            models.Index(fields=['-timestamp', '-id'], name='log_timestamp_id_idx'),
+            models.Index(fields=['user', '-timestamp', '-id'], name='log_user_timestamp_id_idx'),
+            models.Index(fields=['action', '-timestamp', '-id'], name='log_action_timestamp_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"[{self.timestamp:%Y-%m-%d %H:%M:%S}] {self.action} ({self.user_id})"
+
+
 class Perfil(models.Model):
     """
     Extiende el modelo User de Django para añadir campos específicos
@@ -157,24 +411,113 @@ class Perfil(models.Model):
     class Meta:
         verbose_name = "Perfil de Usuario"
         verbose_name_plural = "Perfiles de Usuarios"
+        indexes = [
+            # emitir_cuotas: recorre los alumnos de una carrera en orden de id
+            models.Index(fields=['carrera', 'user'], name='perfil_carrera_user_idx'),
+        ]
 
 # --- SEÑALES PARA CREAR/ACTUALIZAR PERFIL AUTOMÁTICAMENTE ---
 # Importaciones necesarias para las señales (signals)
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, post_init, pre_save
 from django.dispatch import receiver
+from .cache_utils import invalidar_cuotas_pendientes
 
 @receiver(post_save, sender=User) # Esta función se ejecutará DESPUÉS de que se guarde un User
-def create_or_update_user_profile(sender, instance, created, **kwargs):
+def create_user_profile(sender, instance, created, raw, **kwargs):
     """
-    Crea un Perfil automáticamente cuando se crea un nuevo User,
-    o simplemente guarda el perfil existente cuando se actualiza un User.
+    Crea un Perfil automáticamente cuando se crea un nuevo User.
+    Los demás save() del User (cambio de contraseña, último login, etc.) no
+    tocan el Perfil: no tiene campos que dependan del usuario. Los usuarios
+    anteriores sin Perfil se completaron en la migración 0017.
     """
-    if created:
+    if created and not raw:
         Perfil.objects.create(user=instance)
-    # Asegura que el perfil se guarde cada vez que el usuario se guarde
-    # Esto puede ser útil si el perfil tuviera lógica que dependiera del usuario
+
+
+# --- SEÑALES PARA INVALIDAR LA CACHÉ DE CUOTAS PENDIENTES ---
+# Cualquier cambio en las cuotas del alumno (o en lo que cuelga de ellas)
+# borra el payload cacheado de ListaCuotasPendientesAPI.
+
+@receiver(post_save, sender=Cuota)
+@receiver(post_delete, sender=Cuota)
+def invalidar_cache_por_cuota(sender, instance, **kwargs):
+    invalidar_cuotas_pendientes(instance.alumno_id)
+
+@receiver(post_save, sender=PagoParcial)
+@receiver(post_delete, sender=PagoParcial)
+def invalidar_cache_por_pago_parcial(sender, instance, **kwargs):
     try:
-        instance.perfil.save()
-    except Perfil.DoesNotExist:
-        # Si por alguna razón el perfil no se creó (ej. usuario creado antes de implementar esto), lo crea ahora.
-        Perfil.objects.create(user=instance)
+        invalidar_cuotas_pendientes(instance.cuota.alumno_id)
+    except Cuota.DoesNotExist:
+        # La cuota se borró en cascada; su propia señal ya invalidó la caché
+        pass
+
+@receiver(post_save, sender=CuponPagoCuota)
+@receiver(post_delete, sender=CuponPagoCuota)
+def invalidar_cache_por_detalle_cupon(sender, instance, **kwargs):
+    try:
+        invalidar_cuotas_pendientes(instance.cupon_pago.alumno_id)
+    except CuponPago.DoesNotExist:
+        pass
+
+
+# --- SEÑALES PARA MANTENER LAS ESTADÍSTICAS DE CUPONES ---
+# Cubren todo lo que pase por save()/delete() (vistas, admin de Django).
+# Los UPDATE masivos (.update()) no disparan señales: esos casos usan
+# transiciones.ajustar_estadisticas_por_cambio().
+
+@receiver(post_init, sender=CuponPago)
+def recordar_estado_cupon(sender, instance, **kwargs):
+    # Se lee de __dict__ para no disparar consultas si el campo está diferido
+    instance._estadistica_original = (
+        instance.__dict__.get('estado_cupon_id'),
+        instance.__dict__.get('pasarela_id'),
+    ) if instance.pk else None
+
+@receiver(pre_save, sender=CuponPago)
+def completar_estado_original_cupon(sender, instance, raw, **kwargs):
+    original = getattr(instance, '_estadistica_original', None)
+    if raw or instance._state.adding or (original and None not in original):
+        return
+    # El cupón se cargó con campos diferidos: se lee el estado guardado
+    instance._estadistica_original = CuponPago.objects.filter(pk=instance.pk).values_list(
+        'estado_cupon_id', 'pasarela_id'
+    ).first()
+
+# Debe registrarse antes que actualizar_estadisticas_cupon, que pisa el estado original
+@receiver(post_save, sender=CuponPago)
+def liberar_cuotas_de_cupon_inactivo(sender, instance, created, raw, **kwargs):
+    """
+    Si un save() (vista, admin de Django, shell) saca al cupón de 'Activo',
+    sus cuotas dejan de apuntarlo como cupón activo. Sin esto la cuota
+    quedaría bloqueada para siempre (GenerarCuponAPI respondería 409).
+    """
+    if raw or created:
+        return
+    from .catalogos import catalogos # Import local: catalogos importa este módulo
+    original = instance._estadistica_original
+    if original and original[0] == instance.estado_cupon_id:
+        return
+    if instance.estado_cupon_id != catalogos.estado_cupon('Activo').id:
+        if Cuota.objects.filter(cupon_activo=instance).update(cupon_activo=None):
+            invalidar_cuotas_pendientes(instance.alumno_id)
+
+@receiver(post_save, sender=CuponPago)
+def actualizar_estadisticas_cupon(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    actual = (instance.estado_cupon_id, instance.pasarela_id)
+    mes = EstadisticaCupon.mes_de(instance.fecha_generacion)
+    original = None if created else instance._estadistica_original
+    if original != actual:
+        deltas = {(*actual, mes): 1}
+        if original:
+            deltas[(*original, mes)] = -1
+        EstadisticaCupon.ajustar(deltas)
+    instance._estadistica_original = actual
+
+@receiver(post_delete, sender=CuponPago)
+def descontar_estadisticas_cupon(sender, instance, **kwargs):
+    EstadisticaCupon.ajustar({
+        (instance.estado_cupon_id, instance.pasarela_id, EstadisticaCupon.mes_de(instance.fecha_generacion)): -1
+    })
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+# --- CACHÉ EN DISCO DE LOS PDF DE CUPONES ---
+# El PDF se guarda con nombre "<id>-<version>.pdf", donde la versión es un
+# hash de todo lo que se imprime (más la versión de la plantilla). Si nada
+# cambió, se sirve el archivo sin volver a dibujarlo; el mismo hash es el
+# ETag de la respuesta. El tamaño total se acota borrando los archivos
+# usados hace más tiempo (LRU por fecha de modificación, que se actualiza
+# en cada lectura).
+#
+# Recorrer el directorio cuesta lo mismo que la cantidad de archivos, así
+# que no se hace en cada escritura: cada proceso lleva la cuenta de los
+# bytes escritos desde el último recorrido y solo vuelve a recorrerlo al
+# pasar el máximo o cada PDF_CACHE_INTERVALO_DESALOJO segundos (los demás
+# procesos también escriben). Las versiones viejas de un cupón se borran
+# en ese mismo recorrido.
+
+# Subir este número cuando cambie el diseño de pdf_generator, así se
+# descartan los PDF viejos.
+VERSION_PLANTILLA = 2
+
+_candado = threading.Lock()
+_ocupado = None # Bytes en la caché según el último recorrido, más lo escrito desde entonces
+_ultimo_recorrido = 0.0
+
+
+def version_contenido(cupon):
+    """
+    Hash de los datos que se imprimen en el PDF. Usa el alumno, el perfil y
+    las cuotas ya cargados (select_related/prefetch_related de la vista).
+    """
+    alumno = cupon.alumno
+    perfil = alumno.perfil
+    cuotas = sorted(cupon.cuotas_incluidas.all(), key=lambda cuota: (cuota.fecha_vencimiento, cuota.id))
+    contenido = [
+        VERSION_PLANTILLA,
+        cupon.id,
+        cupon.fecha_generacion.isoformat(),
+        str(cupon.monto_total),
+        alumno.get_full_name() or alumno.username,
+        perfil.dni, perfil.legajo, perfil.carrera,
+        [(cuota.periodo, cuota.fecha_vencimiento.isoformat(), str(cuota.monto)) for cuota in cuotas],
+    ]
+    return hashlib.sha256(json.dumps(contenido).encode('utf-8')).hexdigest()[:20]
+
+
+def _ruta(cupon_id, version):
+    return os.path.join(settings.PDF_CACHE_DIR, f'{cupon_id}-{version}.pdf')
+
+
+def abrir(cupon_id, version):
+    """
+    Abre el PDF cacheado (modo binario) y lo marca como recién usado.
+    Devuelve None si no está. Una vez abierto, aunque otro proceso lo
+    desaloje, el archivo se puede seguir leyendo hasta cerrarlo.
+    """
+    ruta = _ruta(cupon_id, version)
+    try:
+        archivo = open(ruta, 'rb')
+    except OSError:
+        return None # No está, o la caché no se puede leer: se dibuja de nuevo
+    try:
+        os.utime(ruta)
+    except OSError:
+        pass
+    return archivo
+
+
+def guardar(cupon_id, version, datos):
+    """
+    Escribe el PDF de forma atómica (archivo temporal + rename, así nadie
+    lee un archivo a medio escribir) y libera espacio si hace falta.
+    Devuelve la ruta. Si el disco falla (lleno, sin permisos) lanza OSError.
+    """
+    os.makedirs(settings.PDF_CACHE_DIR, exist_ok=True)
+    ruta = _ruta(cupon_id, version)
+    descriptor, temporal = tempfile.mkstemp(dir=settings.PDF_CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as archivo:
+            archivo.write(datos)
+        os.replace(temporal, ruta)
+    except BaseException:
+        try:
+            os.unlink(temporal)
+        except OSError:
+            pass
+        raise
+
+    if _hay_que_desalojar(len(datos)):
+        _desalojar(excepto=ruta)
+    return ruta
+
+
+def _hay_que_desalojar(escritos):
+    """ Suma lo escrito y decide si toca recorrer el directorio. """
+    global _ocupado
+    with _candado:
+        if _ocupado is None:
+            return True
+        _ocupado += escritos
+        vencido = time.monotonic() - _ultimo_recorrido >= settings.PDF_CACHE_INTERVALO_DESALOJO
+        return vencido or _ocupado > settings.PDF_CACHE_MAX_BYTES
+
+
+def _desalojar(excepto):
+    """
+    Borra las versiones viejas de cada cupón (queda la más reciente) y, si
+    se supera el máximo, los archivos menos usados.
+    """
+    global _ocupado, _ultimo_recorrido
+    recientes = {} # cupon_id -> (mtime, tamaño, ruta) de su versión más reciente
+    viejos = []
+    with os.scandir(settings.PDF_CACHE_DIR) as entradas:
+        for entrada in entradas:
+            if not entrada.name.endswith('.pdf'):
+                continue
+            try:
+                info = entrada.stat()
+            except FileNotFoundError:
+                continue # Otro proceso lo borró
+            cupon_id = entrada.name.split('-', 1)[0]
+            # La que se acaba de escribir es la versión vigente aunque otra tenga la misma fecha
+            candidato = (float('inf') if entrada.path == excepto else info.st_mtime, info.st_size, entrada.path)
+            anterior = recientes.get(cupon_id)
+            if anterior is None or candidato > anterior:
+                recientes[cupon_id] = candidato
+                candidato = anterior
+            if candidato is not None:
+                viejos.append(candidato)
+
+    for _, _, ruta in viejos:
+        try:
+            os.unlink(ruta)
+        except FileNotFoundError:
+            pass
+
+    total = sum(tamanio for _, tamanio, _ in recientes.values())
+    if total > settings.PDF_CACHE_MAX_BYTES:
+        for _, tamanio, ruta in sorted(recientes.values()):
+            if ruta == excepto:
+                continue
+            try:
+                os.unlink(ruta)
+            except FileNotFoundError:
+                pass
+            total -= tamanio
+            if total <= settings.PDF_CACHE_MAX_BYTES:
+                break
+
+    with _candado:
+        _ocupado = total
+        _ultimo_recorrido = time.monotonic()
@@ -1,70 +1,226 @@
+import functools
 import io
 import os
+import zlib
+import reportlab
 from django.conf import settings
+from reportlab.pdfbase.pdfdoc import PDFImageXObject, _mode2CS
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm
+from reportlab.lib.utils import ImageReader, _digester
 from reportlab.graphics.barcode import qr
-from reportlab.graphics.shapes import Drawing
-from reportlab.graphics import renderPDF
+from reportlab.lib.colors import black
+from reportlab.pdfgen.pathobject import PDFPathObject
 
-# Importas los modelos que necesitas para los datos
-from .models import CuponPago 
+# --- PLANTILLA PRECOMPILADA ---
+# Todo lo que es igual en todos los cupones (encabezado fijo, títulos,
+# líneas, QR, logo y leyenda del pie) se dibuja una sola vez por PDF como
+# un "form XObject" de ReportLab, y cada página lo reutiliza con doForm().
+# El logo (leído y decodificado) y el dibujo del QR se arman una sola vez
+# por proceso. Por cupón solo se dibujan sus datos.
+#
+# Si se cambia el diseño, subir pdf_cache.VERSION_PLANTILLA.
 
-def generate_pago_facil_pdf(cupon):
+PLANTILLA = 'plantilla_pago_facil'
+ANCHO, ALTO = A4 # A4 es (21*cm, 29.7*cm)
+FOOTER_Y_BASE = 5*cm # Posición vertical base para el footer
+URL_QR = 'https://www.pagofacil.com.ar'
+
+# El logo se guarda en binario y no en ASCII85: sin la extensión en C de
+# ReportLab, codificar el logo en ASCII85 era lo más lento de cada PDF.
+# No se cambia rl_config.useA85 (es global: afectaría a cualquier otro PDF
+# del proceso); el logo se registra en cada canvas como _ImagenBinaria.
+#
+# _ImagenBinaria y _registrar_logo usan partes internas de ReportLab
+# (PDFImageXObject, _mode2CS, _digester, Canvas._doc), verificadas con la
+# versión fijada en requirements.txt (ver GeneradorPDFTests, que lee el PDF
+# con pypdf). Con otra versión el logo lo registra drawImage como siempre.
+VERSION_REPORTLAB_PROBADA = '4.4.1'
+
+
+@functools.lru_cache(maxsize=None)
+def _logo():
+    """ Logo de Pago Fácil ya decodificado, o None si no está el archivo. """
+    logo_path = os.path.join(settings.BASE_DIR, 'cupones', 'static', 'logo-pago-facil.png')
+    if not os.path.exists(logo_path):
+        return None
+    logo = ImageReader(logo_path)
+    # Se decodifica ahora (y no en el primer drawImage) para poder
+    # compartirlo entre hilos sin que dos lo decodifiquen a la vez
+    logo.getRGBData()
+    logo.getTransparent()
+    return logo
+
+
+@functools.lru_cache(maxsize=8)
+def _comprimir(imagen):
+    """ Píxeles de la imagen comprimidos con Flate (una vez por proceso). """
+    return zlib.compress(imagen.getRGBData())
+
+
+@functools.lru_cache(maxsize=None)
+def _nombre_logo():
+    """ Mismo nombre que le da drawImage(logo, mask='auto'), para que reutilice el registrado. """
+    logo = _logo()
+    mascara = logo._dataA.getRGBData() if logo._dataA else b'auto'
+    return _digester(logo.getRGBData() + mascara)
+
+
+class _ImagenBinaria(PDFImageXObject):
     """
-    Función que usa ReportLab para crear un PDF similar
-    al ejemplo cuponDePago_1093.pdf.
-    Recibe un objeto 'cupon' ya consultado.
+    XObject de imagen comprimido con Flate y sin ASCII85, sin importar
+    rl_config.useA85. Los datos comprimidos se reutilizan entre PDF.
     """
-    # --- 1. Configuración inicial ---
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4 # A4 es (21*cm, 29.7*cm)
-    
-    # --- 2. Datos ---
-    alumno = cupon.alumno
-    perfil = alumno.perfil
-    # Usamos .all() ya que la vista hizo prefetch_related
-    cuotas = cupon.cuotas_incluidas.all().order_by('fecha_vencimiento')
-    
-    # --- 3. Dibujar PDF (coordenadas (0,0) es abajo-izquierda) ---
-    
-    # --- Encabezado (Ya corregido) ---
+
+    def __init__(self, name, imagen, mask=None):
+        self.name = name
+        self.mask = mask
+        self.width, self.height = imagen.getSize()
+        self.bitsPerComponent = 8
+        self.colorSpace = _mode2CS[imagen.mode]
+        self._filters = ('FlateDecode',)
+        self.streamContent = _comprimir(imagen)
+        self._checkTransparency(imagen)
+
+    def _checkTransparency(self, im):
+        if self.mask == 'auto' and im._dataA:
+            # Canal alfa como máscara suave, también en binario
+            self.mask = None
+            self._smask = _ImagenBinaria(_digester(im._dataA.getRGBData()), im._dataA)
+            self._smask._decode = [0, 1]
+        else:
+            super()._checkTransparency(im)
+
+
+def _registrar_logo(p):
+    """
+    Registra el logo en el canvas 'p' como lo hace drawImage la primera vez,
+    pero con _ImagenBinaria: el drawImage siguiente lo encuentra y lo reutiliza.
+    """
+    nombre = _nombre_logo()
+    registro = p._doc.getXObjectName(nombre)
+    if p._doc.idToObject.get(registro) is not None:
+        return
+    imagen = _ImagenBinaria(nombre, _logo(), mask='auto')
+    p._setXObjects(imagen)
+    p._doc.Reference(imagen, registro)
+    p._doc.addForm(nombre, imagen)
+    mascara = getattr(imagen, '_smask', None)
+    if mascara is not None:
+        p._setXObjects(mascara)
+        imagen.smask = p._doc.Reference(mascara, p._doc.getXObjectName(mascara.name))
+        del imagen._smask
+
+
+@functools.lru_cache(maxsize=None)
+def _qr():
+    """
+    QR de la URL (constante) como un único trazado de 4cm x 4cm con origen
+    en (0, 0). Se calcula una vez: el widget volvería a codificar el QR y
+    a dibujar cada módulo como una figura aparte en cada PDF.
+    """
+    qr_code = qr.QrCodeWidget(URL_QR)
+    bounds = qr_code.getBounds()
+    width_qr = bounds[2] - bounds[0]
+    height_qr = bounds[3] - bounds[1]
+
+    qr_size = 4*cm # Tamaño del QR
+    escala_x, escala_y = qr_size/width_qr, qr_size/height_qr
+    trazado = PDFPathObject()
+    for modulo in qr_code.draw().contents:
+        if modulo.fillColor is None:
+            continue # Fondo transparente
+        trazado.rect(modulo.x * escala_x, modulo.y * escala_y, modulo.width * escala_x, modulo.height * escala_y)
+    return trazado
+
+
+def _definir_plantilla(p):
+    """ Define en el canvas 'p' el form XObject con las partes fijas del cupón. """
+    width, height = ANCHO, ALTO
+    p.beginForm(PLANTILLA)
+
+    # --- Encabezado ---
     p.setFont("Helvetica-Bold", 16)
     p.drawString(3*cm, height - 3*cm, "INSTITUTO SUPERIOR DEL MILAGRO N° 8207")
     p.setFont("Helvetica", 10)
     p.drawString(3*cm, height - 3.5*cm, "Dirección: Alvarado 951, Salta")
-    p.setFont("Helvetica-Bold", 14)
-    p.drawRightString(width - 3*cm, height - 4.5*cm, f"CUPÓN DE PAGO N° {cupon.id}")
-    p.setFont("Helvetica", 10)
-    p.drawRightString(width - 3*cm, height - 5*cm, f"Factura impresa el día: {cupon.fecha_generacion.strftime('%d/%m/%Y %H:%M')}")
     p.line(2*cm, height - 6*cm, width - 2*cm, height - 6*cm) # Línea divisoria
-    # --- FIN Encabezado ---
 
-    # --- DATOS DEL ALUMNO (Re-ubicado) ---
-    p.setFont("Helvetica-Bold", 12)
-    p.drawString(3*cm, height - 7*cm, "DATOS DEL ALUMNO/A") 
-    p.setFont("Helvetica", 10)
-    p.drawString(3*cm, height - 7.5*cm, f"Alumno: {alumno.get_full_name() or alumno.username}")
-    p.drawString(3*cm, height - 8*cm, f"Documento: {perfil.dni or 'No especificado'}")
-    p.drawString(3*cm, height - 8.5*cm, f"N. de Legajo: {perfil.legajo or 'No especificado'}")
-    p.drawString(3*cm, height - 9*cm, f"Carrera: {perfil.carrera or 'No especificada'}")
-    
-    # --- DETALLE DE CUOTAS (Re-ubicado) ---
+    # --- Títulos de las secciones ---
     p.setFont("Helvetica-Bold", 12)
+    p.drawString(3*cm, height - 7*cm, "DATOS DEL ALUMNO/A")
     p.drawString(2*cm, height - 10.5*cm, "DATOS DE LOS MESES A PAGAR")
-    
+
     # Encabezados de tabla
     y_tabla = height - 11.5*cm
     p.setFont("Helvetica-Bold", 10)
     p.drawString(3*cm, y_tabla, "MES / PERIODO")
     p.drawRightString(width - 3*cm, y_tabla, "PRECIO DE LA CUOTA")
     p.line(2*cm, y_tabla - 0.5*cm, width - 2*cm, y_tabla - 0.5*cm)
-    
-    # Filas de la tabla
-    y_actual = y_tabla - 1.5*cm
+
+    # --- Footer (QR, leyenda y logo) ---
+    p.saveState()
+    p.translate(3*cm, FOOTER_Y_BASE) # Posiciona el QR
+    p.setFillColor(black)
+    p.drawPath(_qr(), stroke=0, fill=1)
+    p.restoreState()
+
+    p.setFont("Helvetica-Bold", 10)
+    p.drawString(3*cm, FOOTER_Y_BASE - 0.5*cm, "CUPÓN DE PAGO PARA PAGAR EN LOCALES")
+
+    # Logo Pago Fácil
+    try:
+        logo = _logo()
+        if logo is not None:
+            # Dibuja el logo a la derecha del QR, usando la misma base
+            if reportlab.Version == VERSION_REPORTLAB_PROBADA:
+                _registrar_logo(p)
+            p.drawImage(logo, width - 9*cm, FOOTER_Y_BASE, width=6*cm, preserveAspectRatio=True, mask='auto')
+        else:
+            p.drawString(width - 9*cm, FOOTER_Y_BASE, "[Logo Pago Fácil no encontrado]")
+    except Exception as e:
+        print(f"Error al cargar logo: {e}")
+        p.drawString(width - 9*cm, FOOTER_Y_BASE, "[Error al cargar logo]")
+
+    # Línea del código de barras (al fondo de la página)
+    p.line(2*cm, 2.5*cm, width - 2*cm, 2.5*cm)
+
+    p.endForm()
+
+
+def dibujar_cupon(p, cupon):
+    """
+    Dibuja el cupón en la página actual del canvas 'p' (no la cierra: el que
+    llama hace showPage()). La plantilla se define la primera vez en cada
+    canvas, así un PDF con muchos cupones la incluye una sola vez.
+    Recibe un objeto 'cupon' con alumno__perfil y cuotas_incluidas ya cargados.
+    """
+    width, height = ANCHO, ALTO
+    if not p.hasForm(PLANTILLA):
+        _definir_plantilla(p)
+    p.doForm(PLANTILLA)
+
+    # --- Datos ---
+    alumno = cupon.alumno
+    perfil = alumno.perfil
+    # Se ordena acá: .order_by() volvería a consultar la base e ignoraría el prefetch
+    cuotas = sorted(cupon.cuotas_incluidas.all(), key=lambda cuota: (cuota.fecha_vencimiento, cuota.id))
+
+    # --- Encabezado del cupón ---
+    p.setFont("Helvetica-Bold", 14)
+    p.drawRightString(width - 3*cm, height - 4.5*cm, f"CUPÓN DE PAGO N° {cupon.id}")
     p.setFont("Helvetica", 10)
+    p.drawRightString(width - 3*cm, height - 5*cm, f"Factura impresa el día: {cupon.fecha_generacion.strftime('%d/%m/%Y %H:%M')}")
+
+    # --- DATOS DEL ALUMNO ---
+    p.drawString(3*cm, height - 7.5*cm, f"Alumno: {alumno.get_full_name() or alumno.username}")
+    p.drawString(3*cm, height - 8*cm, f"Documento: {perfil.dni or 'No especificado'}")
+    p.drawString(3*cm, height - 8.5*cm, f"N. de Legajo: {perfil.legajo or 'No especificado'}")
+    p.drawString(3*cm, height - 9*cm, f"Carrera: {perfil.carrera or 'No especificada'}")
+
+    # --- DETALLE DE CUOTAS ---
+    y_actual = height - 11.5*cm - 1.5*cm
     for cuota in cuotas:
         p.drawString(3*cm, y_actual, f"{cuota.periodo} (Vence: {cuota.fecha_vencimiento.strftime('%d/%m/%Y')})")
         p.drawRightString(width - 3*cm, y_actual, f"${cuota.monto:,.2f}")
@@ -76,53 +232,24 @@ def generate_pago_facil_pdf(cupon):
     p.setFont("Helvetica-Bold", 14)
     p.drawRightString(width - 3*cm, y_actual, f"TOTAL: ${cupon.monto_total:,.2f}")
 
-    
-    # --- INICIO FOOTER (CON LOGO Y QR) ---
-    
-    # --- ¡AQUÍ ESTÁ LA CORRECCIÓN! ---
-    # Bajamos la base del footer de 10cm a 5cm
-    footer_y_base = 5*cm # Posición vertical base para el footer
-    # --- FIN DE LA CORRECCIÓN ---
-
-    # QR Simulado
-    qr_code = qr.QrCodeWidget('https://www.pagofacil.com.ar')
-    bounds = qr_code.getBounds()
-    width_qr = bounds[2] - bounds[0]
-    height_qr = bounds[3] - bounds[1]
-    
-    qr_size = 4*cm # Tamaño del QR
-    d = Drawing(qr_size, qr_size, transform=[qr_size/width_qr, 0, 0, qr_size/height_qr, 0, 0])
-    d.add(qr_code)
-    renderPDF.draw(d, p, 3*cm, footer_y_base) # Posiciona el QR
-    
-    p.setFont("Helvetica-Bold", 10)
-    # Posicionamos el texto relativo a la base del footer
-    p.drawString(3*cm, footer_y_base - 0.5*cm, "CUPÓN DE PAGO PARA PAGAR EN LOCALES")
-
-
-    # Logo Pago Fácil
-    try:
-        logo_path = os.path.join(settings.BASE_DIR, 'cupones', 'static', 'logo-pago-facil.png')
-        if os.path.exists(logo_path):
-             # Dibuja el logo a la derecha del QR, usando la misma base
-             p.drawImage(logo_path, width - 9*cm, footer_y_base, width=6*cm, preserveAspectRatio=True, mask='auto')
-        else:
-             p.drawString(width - 9*cm, footer_y_base, "[Logo Pago Fácil no encontrado]")
-    except Exception as e:
-        print(f"Error al cargar logo: {e}")
-        p.drawString(width - 9*cm, footer_y_base, "[Error al cargar logo]")
-
-
     # Simulación de código de barras (al fondo de la página)
     p.setFont("Helvetica", 10)
     barcode_string = f"0966007210600...{perfil.dni or '00000000'}...{int(cupon.monto_total * 100)}"
     p.drawCentredString(width/2, 3*cm, barcode_string)
-    p.line(2*cm, 2.5*cm, width - 2*cm, 2.5*cm)
-    
-    # --- 4. Finalizar y devolver PDF ---
+
+
+def generate_pago_facil_pdf(cupon):
+    """
+    Función que usa ReportLab para crear un PDF similar
+    al ejemplo cuponDePago_1093.pdf.
+    Recibe un objeto 'cupon' ya consultado.
+    """
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    dibujar_cupon(p, cupon)
     p.showPage()
     p.save()
-    
+
     buffer.seek(0)
     # Devuelve el buffer; la vista se encargará de crear el HttpResponse
-    return buffer
\ No newline at end of file
+    return buffer
@@ -0,0 +1,148 @@
+import atexit
+import multiprocessing
+import os
+import threading
+import traceback
+from concurrent import futures
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import pdf_cache
+
+# --- PRE-RENDERIZADO DE PDF EN SEGUNDO PLANO ---
+# Al crearse un cupón (transaction.on_commit en GenerarCuponAPI) se encola
+# su render: un pool de hilos o de procesos (PDF_PRERENDER_MODO) lo dibuja
+# y lo deja en la caché en disco (pdf_cache) antes de la primera descarga.
+# ReportLab es puro Python y retiene el GIL: con 'procesos' los renders no
+# le quitan CPU a los hilos que atienden requests.
+#
+# Cada proceso web tiene su propio pool. Si la descarga llega al mismo
+# proceso mientras el render está en curso, espera ese render (esperar())
+# en lugar de repetirlo. Si no hay worker (modo 'no', cola llena o pool
+# roto), la descarga dibuja el PDF en el momento, como siempre.
+
+_pool = None
+_pid = None
+_candado = threading.Lock()
+_en_curso = {} # cupon_id -> Future
+
+
+def prerenderizar(cupon_id):
+    """
+    Trabajo del pool: lee el cupón, dibuja el PDF si esa versión no está en
+    la caché y devuelve la ruta (None si el cupón no es de Pago Fácil).
+    Corre en un hilo o en otro proceso, con su propia conexión a la base.
+    """
+    # Import local: en modo 'procesos' el módulo se importa antes de django.setup()
+    from .models import CuponPago
+    from .pdf_generator import generate_pago_facil_pdf
+
+    close_old_connections()
+    try:
+        cupon = (
+            CuponPago.objects
+            .select_related('alumno__perfil', 'pasarela')
+            .prefetch_related('cuotas_incluidas')
+            .filter(pk=cupon_id)
+            .first()
+        )
+        if cupon is None or cupon.pasarela.nombre.lower() != 'pago fácil':
+            return None
+        version = pdf_cache.version_contenido(cupon)
+        archivo = pdf_cache.abrir(cupon.id, version)
+        if archivo is not None:
+            archivo.close()
+            return archivo.name
+        return pdf_cache.guardar(cupon.id, version, generate_pago_facil_pdf(cupon).getvalue())
+    finally:
+        close_old_connections()
+
+
+def inicializar_proceso():
+    # Los procesos se crean con 'spawn' (no heredan las conexiones abiertas
+    # del proceso web): hay que cargar Django de nuevo.
+    import django
+    django.setup()
+
+
+def _obtener_pool():
+    """ Crea el pool la primera vez (en cada proceso: los workers web se crean por fork). """
+    global _pool, _pid
+    modo = getattr(settings, 'PDF_PRERENDER_MODO', 'hilos')
+    if modo not in ('hilos', 'procesos'):
+        return None
+    if _pid == os.getpid():
+        return _pool
+    with _candado:
+        if _pid != os.getpid():
+            _en_curso.clear()
+            workers = getattr(settings, 'PDF_PRERENDER_WORKERS', 2)
+            if modo == 'procesos':
+                _pool = futures.ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=inicializar_proceso
+                )
+            else:
+                _pool = futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pdf-prerender')
+            # Al salir no se esperan renders pendientes: se harán en la descarga
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+            _pid = os.getpid()
+    return _pool
+
+
+def encolar(cupon_id):
+    """
+    Encola el render del cupón. Devuelve el Future, o None si no se encoló
+    (sin workers o demasiados pendientes): la descarga lo dibujará en el momento.
+    """
+    global _pid
+    try:
+        pool = _obtener_pool()
+        if pool is None:
+            return None
+        with _candado:
+            futuro = _en_curso.get(cupon_id)
+            if futuro is not None:
+                return futuro
+            if len(_en_curso) >= getattr(settings, 'PDF_PRERENDER_MAX_PENDIENTES', 500):
+                return None
+            futuro = pool.submit(prerenderizar, cupon_id)
+            _en_curso[cupon_id] = futuro
+        futuro.add_done_callback(lambda f: _terminado(cupon_id, f))
+        return futuro
+    except futures.BrokenExecutor:
+        # Murió un proceso del pool: se crea otro en el próximo encolar()
+        _pid = None
+        print(traceback.format_exc())
+        return None
+    except Exception:
+        # Pool roto o cerrándose: no debe afectar a la creación del cupón
+        print(traceback.format_exc())
+        return None
+
+
+def _terminado(cupon_id, futuro):
+    with _candado:
+        if _en_curso.get(cupon_id) is futuro:
+            del _en_curso[cupon_id]
+    if not futuro.cancelled() and futuro.exception() is not None:
+        print(f"Error al pre-renderizar el cupón {cupon_id}: {futuro.exception()}")
+
+
+def esperar(cupon_id, timeout=None):
+    """
+    Si el render de este cupón está en curso en este proceso, lo espera
+    (hasta 'timeout' segundos). Devuelve True si terminó bien.
+    """
+    with _candado:
+        futuro = _en_curso.get(cupon_id)
+    if futuro is None:
+        return False
+    if timeout is None:
+        timeout = getattr(settings, 'PDF_PRERENDER_ESPERA', 10)
+    try:
+        return futuro.result(timeout=timeout) is not None
+    except Exception:
+        return False
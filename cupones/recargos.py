@@ -0,0 +1,75 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import F, Max, Min, Value, DecimalField
+from django.db.models.functions import Greatest, Round
+
+from .models import Cuota, TasaRecargo
+from .catalogos import catalogos
+from .cache_utils import invalidar_cuotas_pendientes
+
+# --- RECARGOS POR MORA ---
+# El recargo se calcula en la base, con un UPDATE por tramo de TasaRecargo
+# y por ventana de ids: recargo = ROUND(monto * porcentaje / 100, 2).
+# Siempre se parte del monto original (no del saldo ni del recargo anterior),
+# así que recalcular para la misma fecha da el mismo resultado. 'recargo' es
+# el total devengado: los pagos no lo descuentan, suman en 'recargo_pagado'
+# (ver Cuota.imputar_pago).
+
+TAMANIO_LOTE_RECARGOS = 5000
+
+
+def tramos(fecha):
+    """
+    Devuelve [(tasa, venc_hasta, venc_desde)]: las cuotas con vencimiento en
+    (venc_desde, venc_hasta] llevan la tasa de ese tramo. El último tramo no
+    tiene límite inferior (venc_desde = None).
+    """
+    tasas = list(TasaRecargo.objects.order_by('dias_desde'))
+    resultado = []
+    for i, tasa in enumerate(tasas):
+        siguiente = tasas[i + 1] if i + 1 < len(tasas) else None
+        venc_hasta = fecha - timedelta(days=tasa.dias_desde)
+        venc_desde = fecha - timedelta(days=siguiente.dias_desde) if siguiente else None
+        resultado.append((tasa, venc_hasta, venc_desde))
+    return resultado
+
+
+def aplicar_recargos(fecha, tamanio_lote=TAMANIO_LOTE_RECARGOS, forzar=False, dry_run=False):
+    """
+    Calcula el recargo de las cuotas impagas (Pendiente o Vencida) según su
+    atraso al día 'fecha'. Salvo 'forzar', saltea las cuotas que ya tienen
+    el recargo calculado para esa fecha. Con 'dry_run' solo cuenta.
+    Genera (tasa, cantidad) por cada lote actualizado.
+    """
+    estados_impagos = catalogos.estados_cuota('Pendiente', 'Vencida')
+    for tasa, venc_hasta, venc_desde in tramos(fecha):
+        cuotas = Cuota.objects.filter(estado_cuota__in=estados_impagos, fecha_vencimiento__lte=venc_hasta)
+        if venc_desde is not None:
+            cuotas = cuotas.filter(fecha_vencimiento__gt=venc_desde)
+        if not forzar:
+            cuotas = cuotas.exclude(fecha_recargo=fecha)
+
+        if dry_run:
+            yield tasa, cuotas.count()
+            continue
+
+        limites = cuotas.aggregate(desde=Min('id'), hasta=Max('id'))
+        if limites['desde'] is None:
+            continue
+        porcentaje = Value(tasa.porcentaje / Decimal(100), output_field=DecimalField(max_digits=7, decimal_places=4))
+        for inicio in range(limites['desde'], limites['hasta'] + 1, tamanio_lote):
+            ventana = cuotas.filter(id__gte=inicio, id__lt=inicio + tamanio_lote)
+            alumnos = set(ventana.values_list('alumno_id', flat=True).distinct())
+            if not alumnos:
+                continue
+            cantidad = ventana.update(
+                # Nunca por debajo de lo ya cobrado (ej. si se bajó una tasa)
+                recargo=Greatest(
+                    Round(F('monto') * porcentaje, 2, output_field=DecimalField(max_digits=10, decimal_places=2)),
+                    F('recargo_pagado')
+                ),
+                fecha_recargo=fecha
+            )
+            invalidar_cuotas_pendientes(*alumnos)
+            yield tasa, cantidad
@@ -1,7 +1,10 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 # Importa User y tu modelo Perfil
 from django.contrib.auth.models import User
-from .models import Cuota, EstadoCuota, CuponPago, EstadoCupon, PasarelaPago, Perfil, PagoParcial
+from .models import Cuota, EstadoCuota, CuponPago, EstadoCupon, PasarelaPago, Perfil, PagoParcial, SystemLog
+from .conciliacion import FORMATOS, FORMATO_CSV
 # Importa lo necesario para el serializer de Token personalizado
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
@@ -72,7 +75,7 @@ class CuotaSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Cuota
-        fields = ['id', 'periodo', 'monto', 'saldo_pendiente', 'fecha_vencimiento', 'estado_cuota']
+        fields = ['id', 'periodo', 'monto', 'saldo_pendiente', 'recargo', 'recargo_pagado', 'fecha_vencimiento', 'estado_cuota']
 
 class GenerarCuponSerializer(serializers.Serializer):
     """ Valida los datos de entrada para generar un cupón (IDs + Key) """
@@ -88,9 +91,49 @@ class PagoParcialSerializer(serializers.Serializer):
     """ Valida los datos de entrada para registrar un pago parcial """
     monto = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0.01)
 
+class CambioEstadoMasivoSerializer(serializers.Serializer):
+    """ Valida los datos de entrada para el cambio de estado masivo de cupones (Admin) """
+    cupon_ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        min_length=1,
+        max_length=5000
+    )
+    estado = serializers.ChoiceField(choices=['Pagado', 'Anulado', 'Expirado'])
+    motivo = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, data):
+        if data['estado'] == 'Anulado' and not data.get('motivo', '').strip():
+            raise serializers.ValidationError({"motivo": "El motivo de anulación es obligatorio."})
+        return data
+
+class ConciliacionSerializer(serializers.Serializer):
+    """ Valida la subida de un archivo de rendición de la pasarela (Admin) """
+    archivo = serializers.FileField()
+    formato = serializers.ChoiceField(choices=FORMATOS, default=FORMATO_CSV)
+    pasarela = serializers.IntegerField(required=False)
+    delimitador = serializers.CharField(max_length=1, default=',', trim_whitespace=False)
+
+class EstadisticasCuponesSerializer(serializers.Serializer):
+    """ Valida los filtros de las estadísticas de cupones (Admin): ?pasarela=<id>&mes=AAAA-MM """
+    pasarela = serializers.IntegerField(required=False, min_value=1)
+    mes = serializers.DateField(
+        required=False, input_formats=['%Y-%m'],
+        error_messages={'invalid': "El parámetro 'mes' debe tener el formato AAAA-MM."}
+    )
+
+class EmisionCuotasSerializer(serializers.Serializer):
+    """ Valida el plan de cuotas a emitir para una carrera (Admin) """
+    carrera = serializers.CharField(max_length=100)
+    periodo = serializers.CharField(max_length=60)
+    cantidad_cuotas = serializers.IntegerField(min_value=1, max_value=24)
+    monto = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    primer_vencimiento = serializers.DateField()
+    dry_run = serializers.BooleanField(default=False)
+
 class CuponPagoGeneradoSerializer(serializers.ModelSerializer):
     """ Serializer para la respuesta de éxito al generar cupón """
     pasarela = PasarelaPagoSimpleSerializer(read_only=True)
+    url_pdf = serializers.CharField(source='get_url_pdf', read_only=True)
     class Meta:
         model = CuponPago
         fields = ['id', 'monto_total', 'fecha_vencimiento', 'url_pdf', 'pasarela'] # Incluye url_pdf
@@ -106,6 +149,7 @@ class CuponPagoListSerializer(serializers.ModelSerializer):
     pasarela = PasarelaPagoSimpleSerializer(read_only=True) # Muestra nombre de pasarela
     # --- CAMBIO: Usa AlumnoSimpleSerializer ---
     alumno = AlumnoSimpleSerializer(read_only=True) # Muestra objeto alumno con DNI, etc.
+    url_pdf = serializers.CharField(source='get_url_pdf', read_only=True)
     # -------------------------------------------
 
     class Meta:
@@ -142,3 +186,12 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         data['is_staff'] = self.user.is_staff
         return data
 # --- FIN SERIALIZER PERSONALIZADO ---
+
+
+class SystemLogSerializer(serializers.ModelSerializer):
+    """ Serializer para el registro de auditoría (Admin) """
+    username = serializers.CharField(source='user.username', read_only=True, default=None)
+
+    class Meta:
+        model = SystemLog
+        fields = ['id', 'user', 'username', 'action', 'detail', 'timestamp']
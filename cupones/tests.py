@@ -1,3 +1,1640 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import hmac
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from concurrent import futures
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core import serializers
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+import reportlab
+from pypdf import PdfReader
+from reportlab import rl_config
+from rest_framework.test import APIClient
+
+from . import exportacion_pdf, exportaciones, idempotencia, logging_utils, pdf_cache, pdf_generator, pdf_worker, recargos, webhooks
+from .catalogos import RegistroCatalogos, catalogos
+from .filters import CuponPagoAdminFilter
+from .importacion import ImportadorAlumnos, leer_alumnos
+from .models import Cuota, CuponPago, CuponPagoCuota, EstadisticaCupon, EstadoCuota, EstadoCupon, EventoPasarela, PasarelaPago, Perfil, SystemLog, TasaRecargo
+from .transiciones import cambiar_estado_cupones
+from .views import GenerarCuponAPI
+
+
+class DatosCuponesMixin:
+    """
+    Datos comunes: catálogos, un alumno con perfil y cuotas pendientes, un
+    administrador y clientes de API ya autenticados. Sirve tanto para
+    TestCase como para TransactionTestCase.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # Los catálogos se verifican una sola vez por test: los conteos de
+        # consultas no dependen de cuánto tarda el test. Sin pre-renderizado
+        # de PDF en segundo plano (ver PreRenderizadoTests)
+        ajustes = override_settings(CATALOGOS_INTERVALO_VERIFICACION=3600, PDF_PRERENDER_MODO='no')
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        catalogos._descartar()
+        # El registro de auditoría se escribe en el momento (sin hilo de fondo)
+        parche = mock.patch.object(logging_utils.escritor, 'asincronico', False)
+        parche.start()
+        self.addCleanup(parche.stop)
+
+        for nombre in ['Pendiente', 'Vencida', 'Pagada', 'Anulada']:
+            EstadoCuota.objects.get_or_create(nombre=nombre)
+        for nombre in ['Activo', 'Expirado', 'Anulado', 'Pagado']:
+            EstadoCupon.objects.get_or_create(nombre=nombre)
+        self.pago_facil, _ = PasarelaPago.objects.get_or_create(nombre='Pago Fácil')
+        self.macro_click, _ = PasarelaPago.objects.get_or_create(nombre='Macro Click')
+
+        self.alumno = User.objects.create_user('alumno', password='clave-segura-123', first_name='Ana', last_name='López', email='ana@example.com')
+        perfil = self.alumno.perfil
+        perfil.dni, perfil.legajo, perfil.carrera = '30111222', 'L-001', 'Sistemas'
+        perfil.save()
+        self.admin = User.objects.create_user('admin', password='clave-segura-123', is_staff=True)
+        self.cuotas = self.crear_cuotas(3)
+
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.alumno)
+        self.cliente_admin = APIClient()
+        self.cliente_admin.force_authenticate(self.admin)
+
+    def crear_cuotas(self, cantidad, alumno=None, monto='1000.00', estado='Pendiente', vencimiento=None):
+        alumno = alumno or self.alumno
+        estado = EstadoCuota.objects.get(nombre=estado)
+        vencimiento = vencimiento or date.today() + timedelta(days=10)
+        return [
+            Cuota.objects.create(
+                alumno=alumno,
+                estado_cuota=estado,
+                periodo=f'Cuota {i + 1}',
+                monto=Decimal(monto),
+                fecha_vencimiento=vencimiento + timedelta(days=30 * i)
+            )
+            for i in range(cantidad)
+        ]
+
+    def generar_cupon(self, cuotas, pasarela=None, cliente=None, **extra):
+        datos = {
+            'cuotas_ids': [cuota.id for cuota in cuotas],
+            'pasarela_id': (pasarela or self.pago_facil).id,
+            'idempotency_key': str(uuid.uuid4()),
+            **extra
+        }
+        return (cliente or self.cliente).post('/cupones/generar-cupon/', datos, format='json')
+
+
+class CacheCuotasPendientesTests(DatosCuponesMixin, TestCase):
+    URL = '/cupones/lista-pendientes/'
+
+    def test_con_cache_local_no_se_cachea(self):
+        # LocMemCache no se comparte entre workers: la lista siempre se lee de la base
+        self.cliente.get(self.URL)
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.cliente.get(self.URL)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertGreater(len(consultas), 0)
+        self.assertFalse(self.cliente_admin.get('/cupones/admin/cache/cuotas-pendientes/').data['habilitada'])
+
+    @override_settings(CUOTAS_PENDIENTES_CACHE_LOCAL=True)
+    def test_hit_sin_consultas_e_invalidacion_por_senal(self):
+        self.assertEqual(len(self.cliente.get(self.URL).data), 3)
+        with self.assertNumQueries(0):
+            respuesta = self.cliente.get(self.URL)
+        self.assertEqual(len(respuesta.data), 3)
+
+        # Cambiar una cuota invalida el payload del alumno
+        self.cuotas[0].estado_cuota = EstadoCuota.objects.get(nombre='Pagada')
+        self.cuotas[0].save()
+        self.assertEqual(len(self.cliente.get(self.URL).data), 2)
+
+        estadisticas = self.cliente_admin.get('/cupones/admin/cache/cuotas-pendientes/').data
+        self.assertEqual((estadisticas['hits'], estadisticas['misses']), (1, 2))
+
+    def test_una_consulta_sin_importar_la_cantidad_de_cuotas(self):
+        self.crear_cuotas(20)
+        self.cliente.get(self.URL) # Carga los catálogos en memoria
+        with self.assertNumQueries(1):
+            respuesta = self.cliente.get(self.URL)
+        self.assertEqual(len(respuesta.data), 23)
+
+
+@override_settings(CATALOGOS_INTERVALO_VERIFICACION=3600)
+class RegistroCatalogosTests(TestCase):
+    """ Los catálogos se leen de memoria y se recargan cuando otro worker los cambia. """
+
+    def setUp(self):
+        self.activo = EstadoCupon.objects.create(nombre='Activo')
+        self.pendiente = EstadoCuota.objects.create(nombre='Pendiente')
+        self.pasarela = PasarelaPago.objects.create(nombre='Pago Fácil')
+        self.registro = RegistroCatalogos()
+        self.admin = APIClient()
+        self.admin.force_authenticate(User.objects.create_user('admin', is_staff=True))
+
+    def test_consultas_desde_memoria(self):
+        with self.assertNumQueries(4): # Versión y las tres tablas
+            self.assertEqual(self.registro.estado_cupon('Activo'), self.activo)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.registro.estado_cuota('Pendiente'), self.pendiente)
+            self.assertEqual(self.registro.estado_cupon_por_id(str(self.activo.id)), self.activo)
+            self.assertEqual(self.registro.pasarela_por_id(self.pasarela.id), self.pasarela)
+            self.assertEqual(self.registro.estados_cuota('Pendiente', 'Pagada'), [self.pendiente])
+            self.assertEqual(self.registro.estados_cupon(), [self.activo])
+            with self.assertRaises(EstadoCupon.DoesNotExist):
+                self.registro.estado_cupon('Pagado')
+            with self.assertRaises(EstadoCupon.DoesNotExist):
+                self.registro.estado_cupon_por_id('abc')
+            with self.assertRaises(PasarelaPago.DoesNotExist):
+                self.registro.pasarela('Macro Click')
+
+    def test_otro_worker_ve_el_cambio_al_verificar_la_version(self):
+        self.assertEqual(self.registro.pasarela_por_id(self.pasarela.id).nombre, 'Pago Fácil')
+
+        # Otro worker renombra la pasarela por la API de configuración
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.admin.patch(f'/cupones/admin/config/pasarelas/{self.pasarela.id}/', {'nombre': 'Pago Fácil S.A.'}, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+
+        # Hasta la próxima verificación se sigue usando la copia en memoria
+        self.assertEqual(self.registro.pasarela_por_id(self.pasarela.id).nombre, 'Pago Fácil')
+        with override_settings(CATALOGOS_INTERVALO_VERIFICACION=0):
+            with self.assertNumQueries(4):
+                self.assertEqual(self.registro.pasarela('Pago Fácil S.A.').id, self.pasarela.id)
+            # Sin cambios de versión, verificar es una sola consulta
+            with self.assertNumQueries(1):
+                self.registro.pasarela('Pago Fácil S.A.')
+
+
+class PlanesDeConsultaTests(TestCase):
+    """
+    Regresión de los planes de consulta de los filtros más usados: cada
+    consulta debe resolverse con su índice compuesto, sin recorrer toda la
+    tabla ni ordenar aparte (filesort / TEMP B-TREE).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        pendiente = EstadoCuota.objects.create(nombre='Pendiente')
+        vencida = EstadoCuota.objects.create(nombre='Vencida')
+        pagada = EstadoCuota.objects.create(nombre='Pagada')
+        cls.activo = EstadoCupon.objects.create(nombre='Activo')
+        pagado = EstadoCupon.objects.create(nombre='Pagado')
+        pasarela = PasarelaPago.objects.create(nombre='Pago Fácil')
+        cls.estados_pendientes = [pendiente, vencida]
+        cls.pendiente = pendiente
+
+        User.objects.bulk_create([User(username=f'alumno{i}') for i in range(200)])
+        alumnos = list(User.objects.filter(username__startswith='alumno'))
+        hoy = date.today()
+        Cuota.objects.bulk_create([
+            Cuota(alumno=alumno, estado_cuota=[pendiente, vencida, pagada, pagada][i % 4], periodo=f'Cuota {i}',
+                  monto=Decimal('1000.00'), fecha_vencimiento=hoy + timedelta(days=30 * (i - 10)))
+            for alumno in alumnos for i in range(20)
+        ], batch_size=1000)
+        CuponPago.objects.bulk_create([
+            CuponPago(alumno=alumno, estado_cupon=cls.activo if i % 4 == 0 else pagado, pasarela=pasarela,
+                      monto_total=Decimal('1000.00'), fecha_vencimiento=hoy + timedelta(days=i - 5), idempotency_key=uuid.uuid4())
+            for alumno in alumnos for i in range(10)
+        ], batch_size=1000)
+        cls.alumno = alumnos[5]
+
+        # Estadísticas para el planificador, como en una base con datos reales
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('ANALYZE')
+            elif connection.vendor == 'mysql':
+                cursor.execute('ANALYZE TABLE cupones_cuota, cupones_cuponpago')
+
+    def assertUsaIndice(self, queryset, indice):
+        plan = queryset.explain()
+        self.assertIn(indice, plan, plan)
+        if connection.vendor == 'sqlite':
+            for linea in plan.splitlines():
+                self.assertFalse(' SCAN ' in f' {linea} ' and 'USING' not in linea, f'Recorre toda la tabla: {plan}')
+            self.assertNotIn('TEMP B-TREE', plan, f'Ordena aparte: {plan}')
+        elif connection.vendor == 'mysql':
+            self.assertNotIn(' ALL ', plan, f'Recorre toda la tabla: {plan}')
+            self.assertNotIn('Using filesort', plan, f'Ordena aparte: {plan}')
+
+    def test_lista_de_cuotas_pendientes(self):
+        # Misma consulta que ListaCuotasPendientesAPI
+        cuotas = Cuota.objects.filter(alumno=self.alumno, estado_cuota__in=self.estados_pendientes).order_by('fecha_vencimiento')
+        self.assertUsaIndice(cuotas, 'cuota_alumno_venc_estado_idx')
+
+    def test_historial_del_alumno(self):
+        # Primera página de HistorialCuponesAPI (cursor sobre fecha de generación e id)
+        cupones = CuponPago.objects.filter(alumno=self.alumno).order_by('-fecha_generacion', '-id')[:21]
+        self.assertUsaIndice(cupones, 'cupon_alumno_gen_id_idx')
+
+    def test_cupones_a_expirar(self):
+        cupones = CuponPago.objects.filter(estado_cupon=self.activo, fecha_vencimiento__lt=date.today())
+        self.assertUsaIndice(cupones, 'cupon_estado_venc_idx')
+
+    def test_lote_de_expiracion(self):
+        # Lote de expirar_cupones: keyset por id dentro de los cupones Activos vencidos
+        cupones = (
+            CuponPago.objects.filter(estado_cupon=self.activo, fecha_vencimiento__lt=date.today(), id__gt=0)
+            .order_by('id').values_list('id', flat=True)[:1000]
+        )
+        self.assertUsaIndice(cupones, 'cupones_cuponpago_estado_cupon_id')
+
+    def test_cuotas_a_vencer(self):
+        # Lote de vencer_cuotas
+        cuotas = (
+            Cuota.objects.filter(estado_cuota=self.pendiente, fecha_vencimiento__lt=date.today())
+            .order_by('fecha_vencimiento', 'id').values_list('id', 'alumno_id')[:1000]
+        )
+        self.assertUsaIndice(cuotas, 'cuota_estado_venc_idx')
+
+    @skipUnless(connection.vendor == 'mysql', 'SQLite solo usa índices en LIKE con columnas NOCASE')
+    def test_busqueda_por_nombre(self):
+        # Cada rama del UNION usa su índice (first_name, last_name, username)
+        alumnos = CuponPagoAdminFilter({'nombre': 'alum'}, queryset=CuponPago.objects.all()).qs
+        plan = alumnos.explain()
+        for indice in ('user_first_name_idx', 'user_last_name_idx', 'username'):
+            self.assertIn(indice, plan)
+
+    def test_gestion_de_cupones_por_estado(self):
+        # Primera página de AdminGestionCuponesAPI filtrando por estado
+        cupones = CuponPago.objects.filter(estado_cupon=self.activo).order_by('-fecha_generacion', '-id')[:21]
+        self.assertUsaIndice(cupones, 'cupon_estado_gen_id_idx')
+
+
+class GenerarCuponConsultasTests(DatosCuponesMixin, TestCase):
+    """ La cantidad de consultas de GenerarCuponAPI no depende de cuántas cuotas se paguen. """
+
+    # Búsqueda por idempotency_key, SAVEPOINT, SELECT de cuotas, INSERT del
+    # cupón, un solo INSERT de detalles, UPDATE de cupon_activo, RELEASE
+    # SAVEPOINT (la estadística se suma después del COMMIT)
+    CONSULTAS = 7
+
+    def test_consultas_constantes(self):
+        self.generar_cupon(self.cuotas) # Carga los catálogos en memoria
+        for cantidad in (1, 10, 100):
+            with self.subTest(cuotas=cantidad):
+                cuotas = self.crear_cuotas(cantidad)
+                with self.assertNumQueries(self.CONSULTAS):
+                    respuesta = self.generar_cupon(cuotas)
+                self.assertEqual(respuesta.status_code, 201, respuesta.data)
+                self.assertEqual(Cuota.objects.filter(cupon_activo_id=respuesta.data['id']).count(), cantidad)
+
+
+class IdempotenciaTests(DatosCuponesMixin, TestCase):
+    """ Repetir la idempotency_key devuelve el cupón original sin crear otro. """
+
+    def test_repetir_la_clave_devuelve_el_mismo_cupon(self):
+        clave = str(uuid.uuid4())
+        primera = self.generar_cupon(self.cuotas, idempotency_key=clave)
+        self.assertEqual(primera.status_code, 201, primera.data)
+
+        segunda = self.generar_cupon(self.cuotas, idempotency_key=clave)
+        # Sin la respuesta en caché (otro worker, reinicio) la encuentra en la base
+        cache.clear()
+        tercera = self.generar_cupon(self.cuotas, idempotency_key=clave)
+
+        self.assertEqual([segunda.status_code, tercera.status_code], [200, 200])
+        self.assertEqual({segunda.data['id'], tercera.data['id']}, {primera.data['id']})
+        self.assertEqual(CuponPago.objects.count(), 1)
+        self.assertEqual(Cuota.objects.filter(cupon_activo_id=primera.data['id']).count(), 3)
+
+    def test_clave_reservada_por_otra_request_reutiliza_su_respuesta(self):
+        clave = str(uuid.uuid4())
+        # Otra request reservó la clave y ya guardó su respuesta
+        self.assertTrue(idempotencia.reservar(clave))
+        idempotencia.guardar_respuesta(clave, 201, {'id': 12345})
+
+        respuesta = self.generar_cupon(self.cuotas, idempotency_key=clave)
+        self.assertEqual((respuesta.status_code, respuesta.data), (200, {'id': 12345}))
+        self.assertFalse(CuponPago.objects.exists())
+        self.assertFalse(idempotencia.reservar(clave))
+
+
+class GenerarCuponConcurrenteTests(DatosCuponesMixin, TransactionTestCase):
+    """
+    Requests simultáneas, cada una en su hilo y con su propia conexión, sin
+    mocks: la reserva real de idempotencia sobre la caché que comparten los
+    hilos (como Redis entre workers), la restricción única de
+    idempotency_key y el reclamo condicional de las cuotas.
+    """
+    HILOS = 8
+
+    def en_paralelo(self, pedidos):
+        barrera = threading.Barrier(len(pedidos))
+        respuestas = [None] * len(pedidos)
+
+        def correr(indice, pedido):
+            try:
+                cliente = APIClient()
+                cliente.force_authenticate(self.alumno)
+                barrera.wait()
+                respuestas[indice] = cliente.post('/cupones/generar-cupon/', pedido, format='json')
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=correr, args=(i, pedido)) for i, pedido in enumerate(pedidos)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        return respuestas
+
+    def pedido(self, cuotas, clave=None):
+        return {
+            'cuotas_ids': [cuota.id for cuota in cuotas],
+            'pasarela_id': self.macro_click.id,
+            'idempotency_key': clave or str(uuid.uuid4())
+        }
+
+    def test_misma_idempotency_key(self):
+        pedido = self.pedido(self.cuotas)
+        respuestas = self.en_paralelo([dict(pedido) for _ in range(self.HILOS)])
+
+        # Una crea el cupón y las demás lo repiten
+        self.assertEqual(sorted(r.status_code for r in respuestas), [200] * (self.HILOS - 1) + [201])
+        cupon = CuponPago.objects.get()
+        self.assertEqual({r.data['id'] for r in respuestas}, {cupon.id})
+        # Las cuotas se reclamaron una sola vez
+        self.assertEqual(CuponPagoCuota.objects.count(), 3)
+        self.assertEqual(Cuota.objects.filter(cupon_activo=cupon).count(), 3)
+
+    @skipUnless(connection.vendor == 'mysql', 'SQLite no deja esperar a dos transacciones que escriben: una falla con "database is locked"')
+    def test_cuotas_superpuestas(self):
+        a, b, c = self.cuotas
+        respuestas = self.en_paralelo([self.pedido([a, b]), self.pedido([b, c])])
+
+        self.assertEqual(sorted(r.status_code for r in respuestas), [201, 409])
+        cupon = CuponPago.objects.get()
+        reclamadas = set(Cuota.objects.filter(cupon_activo=cupon).values_list('id', flat=True))
+        self.assertIn(b.id, reclamadas)
+        # El cupón rechazado no dejó cuotas reclamadas
+        self.assertEqual(Cuota.objects.filter(cupon_activo__isnull=False).count(), 2)
+
+
+class GenerarCuponCarreraTests(DatosCuponesMixin, TestCase):
+    """ La misma carrera, intercalada a mano: corre también en SQLite. """
+
+    def test_integrity_error_devuelve_el_cupon_del_otro_worker(self):
+        clave = uuid.uuid4()
+        original = GenerarCuponAPI._respuesta_previa
+        llamadas = []
+
+        def sin_cupon_la_primera_vez(vista, idempotency_key):
+            llamadas.append(idempotency_key)
+            if len(llamadas) == 1:
+                # Otro worker inserta el cupón justo después de nuestra búsqueda
+                CuponPago.objects.create(
+                    alumno=self.alumno, estado_cupon=EstadoCupon.objects.get(nombre='Anulado'), pasarela=self.macro_click,
+                    monto_total=Decimal('3000.00'), fecha_vencimiento=date.today(), idempotency_key=clave
+                )
+                return None
+            return original(vista, idempotency_key)
+
+        with mock.patch.object(GenerarCuponAPI, '_respuesta_previa', sin_cupon_la_primera_vez):
+            respuesta = self.generar_cupon(self.cuotas, pasarela=self.macro_click, idempotency_key=str(clave))
+
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        self.assertEqual(respuesta.data['id'], CuponPago.objects.get().id)
+        # El INSERT fallido no dejó cuotas reclamadas
+        self.assertFalse(Cuota.objects.filter(cupon_activo__isnull=False).exists())
+
+
+class CuponActivoTests(DatosCuponesMixin, TestCase):
+    """ Cuota.cupon_activo se libera por cualquier camino que saque al cupón de 'Activo'. """
+
+    def test_cambio_de_estado_con_save_libera_las_cuotas(self):
+        respuesta = self.generar_cupon(self.cuotas)
+        self.assertEqual(respuesta.status_code, 201)
+        cupon = CuponPago.objects.get(pk=respuesta.data['id'])
+
+        # Como lo haría el admin de Django
+        cupon.estado_cupon = EstadoCupon.objects.get(nombre='Expirado')
+        cupon.save()
+
+        self.assertFalse(Cuota.objects.filter(cupon_activo__isnull=False).exists())
+        self.assertEqual(self.generar_cupon(self.cuotas).status_code, 201)
+
+    def test_otro_save_no_toca_las_cuotas(self):
+        cupon = CuponPago.objects.get(pk=self.generar_cupon(self.cuotas).data['id'])
+        cupon.motivo_anulacion = 'Nota interna'
+        cupon.save()
+        self.assertEqual(Cuota.objects.filter(cupon_activo=cupon).count(), 3)
+        self.assertEqual(self.generar_cupon(self.cuotas).status_code, 409)
+
+    def test_anulacion_del_alumno_y_reactivacion_del_admin(self):
+        cupon_id = self.generar_cupon(self.cuotas).data['id']
+        self.assertEqual(self.cliente.patch(f'/cupones/cupon/{cupon_id}/anular/').status_code, 204)
+        self.assertFalse(Cuota.objects.filter(cupon_activo__isnull=False).exists())
+
+        activo = EstadoCupon.objects.get(nombre='Activo')
+        respuesta = self.cliente_admin.patch(f'/cupones/admin/cupon/{cupon_id}/estado/', {'estado_cupon_id': activo.id}, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        self.assertEqual(Cuota.objects.filter(cupon_activo_id=cupon_id).count(), 3)
+
+
+class AuditoriaTransaccionalTests(DatosCuponesMixin, TestCase):
+    """ El registro de auditoría de las vistas atómicas se escribe solo si la transacción se confirma. """
+
+    def setUp(self):
+        super().setUp()
+        self.cupon_id = self.generar_cupon(self.cuotas).data['id']
+
+    def anular(self):
+        return self.cliente_admin.patch(f'/cupones/admin/anular/{self.cupon_id}/', {'motivo': 'Duplicado'}, format='json')
+
+    def cambiar_estado(self, nombre):
+        estado = EstadoCupon.objects.get(nombre=nombre)
+        return self.cliente_admin.patch(f'/cupones/admin/cupon/{self.cupon_id}/estado/', {'estado_cupon_id': estado.id}, format='json')
+
+    def test_anulacion_registra_al_confirmar(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(self.anular().status_code, 200)
+            self.assertFalse(SystemLog.objects.filter(action='cupon_anulado').exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(SystemLog.objects.get(action='cupon_anulado').detail, f'Cupón {self.cupon_id}: Duplicado')
+
+    def test_cambio_de_estado_registra_al_confirmar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.cambiar_estado('Expirado').status_code, 200)
+        self.assertTrue(SystemLog.objects.filter(action='cupon_cambio_estado').exists())
+
+    def test_error_deshace_el_cambio_y_no_registra(self):
+        with mock.patch('cupones.views.CuponPagoListSerializer', side_effect=RuntimeError('falla')), \
+                mock.patch('cupones.views.print', create=True):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.anular().status_code, 500)
+                self.assertEqual(self.cambiar_estado('Expirado').status_code, 500)
+        self.assertEqual(CuponPago.objects.get(pk=self.cupon_id).estado_cupon.nombre, 'Activo')
+        self.assertEqual(Cuota.objects.filter(cupon_activo_id=self.cupon_id).count(), 3)
+        self.assertFalse(SystemLog.objects.filter(action__in=['cupon_anulado', 'cupon_cambio_estado']).exists())
+
+
+class EscritorLogsTests(TransactionTestCase):
+    """ El hilo de fondo de EscritorLogs (con su propia conexión a la base). """
+
+    def escritor(self, **opciones):
+        escritor = logging_utils.EscritorLogs(**opciones)
+        parche = mock.patch('cupones.logging_utils.atexit.register')
+        self.registrar_atexit = parche.start()
+        self.addCleanup(parche.stop)
+        self.addCleanup(escritor.vaciar)
+        return escritor
+
+    def registrar(self, escritor, cantidad):
+        for i in range(cantidad):
+            escritor.registrar(logging_utils._nuevo_log(None, 'prueba', str(i)))
+
+    def esperar_filas(self, cantidad, timeout=5):
+        limite = time.monotonic() + timeout
+        while SystemLog.objects.count() < cantidad and time.monotonic() < limite:
+            time.sleep(0.02)
+        return SystemLog.objects.count()
+
+    def test_guarda_al_completar_el_lote(self):
+        escritor = self.escritor(tamanio_lote=5, intervalo=60)
+        self.registrar(escritor, 7)
+        self.assertEqual(self.esperar_filas(5), 5)
+        # Las 2 restantes esperan a completar otro lote (o el intervalo)
+        time.sleep(0.2)
+        self.assertEqual(SystemLog.objects.count(), 5)
+
+    def test_guarda_al_pasar_el_intervalo(self):
+        escritor = self.escritor(tamanio_lote=100, intervalo=0.2)
+        inicio = time.monotonic()
+        self.registrar(escritor, 3)
+        self.assertEqual(self.esperar_filas(3), 3)
+        self.assertGreaterEqual(time.monotonic() - inicio, 0.2)
+
+    def test_vaciar_guarda_lo_pendiente_y_termina_el_hilo(self):
+        escritor = self.escritor(tamanio_lote=100, intervalo=60)
+        self.registrar(escritor, 10)
+        # Se registra una sola vez para el cierre del proceso
+        self.registrar_atexit.assert_called_once_with(escritor.vaciar)
+
+        escritor.vaciar()
+        self.assertEqual(SystemLog.objects.count(), 10)
+        self.assertFalse(escritor._hilo.is_alive())
+
+    def test_cola_llena_escribe_en_el_momento(self):
+        escritor = self.escritor(capacidad=2)
+        # Sin hilo que la consuma, la cola se llena con las 2 primeras
+        with mock.patch.object(escritor, '_iniciar'):
+            self.registrar(escritor, 5)
+        self.assertEqual(SystemLog.objects.count(), 3)
+        escritor.vaciar()
+        self.assertEqual(sorted(SystemLog.objects.values_list('detail', flat=True)), ['0', '1', '2', '3', '4'])
+
+
+class RegistroAuditoriaTests(TestCase):
+    """ Listado del registro por cursor y archivado de lo viejo (archivar_logs). """
+
+    def setUp(self):
+        self.admin = User.objects.create_user('admin', is_staff=True)
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(self.admin)
+        self.ahora = timezone.now()
+
+    def crear_logs(self, cantidad, hace=timedelta(0), action='prueba'):
+        # Varios con el mismo timestamp: el cursor desempata por id
+        return SystemLog.objects.bulk_create([
+            SystemLog(user=self.admin, action=action, detail=str(i), timestamp=self.ahora - hace - timedelta(seconds=i // 3))
+            for i in range(cantidad)
+        ])
+
+    def test_recorre_todas_las_paginas_sin_repetir(self):
+        self.crear_logs(25)
+        self.crear_logs(5, action='otra')
+        esperados = list(SystemLog.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+
+        vistos, url = [], '/cupones/admin/logs/?page_size=7'
+        while url:
+            with self.assertNumQueries(1):
+                respuesta = self.cliente.get(url)
+            self.assertEqual(respuesta.status_code, 200)
+            self.assertNotIn('count', respuesta.data)
+            vistos += [fila['id'] for fila in respuesta.data['results']]
+            url = respuesta.data['next']
+        self.assertEqual(vistos, esperados)
+
+        respuesta = self.cliente.get('/cupones/admin/logs/', {'action': 'otra'})
+        self.assertEqual([fila['action'] for fila in respuesta.data['results']], ['otra'] * 5)
+        self.assertEqual(respuesta.data['results'][0]['username'], 'admin')
+
+    def test_archivar_logs_por_dia(self):
+        self.crear_logs(4, hace=timedelta(days=100))
+        self.crear_logs(3, hace=timedelta(days=95))
+        recientes = self.crear_logs(2)
+
+        salida = io.StringIO()
+        call_command('archivar_logs', '--dias', '90', '--directorio', 'no-se-usa', '--dry-run', stdout=salida)
+        self.assertIn('Hay 7 registros', salida.getvalue())
+        self.assertEqual(SystemLog.objects.count(), 9)
+
+        with tempfile.TemporaryDirectory() as directorio:
+            call_command('archivar_logs', '--dias', '90', '--directorio', directorio, '--batch-size', '3', stdout=io.StringIO())
+            archivados = {}
+            for nombre in sorted(os.listdir(directorio)):
+                with gzip.open(os.path.join(directorio, nombre), 'rt', encoding='utf-8') as archivo:
+                    archivados[nombre] = [json.loads(linea) for linea in archivo]
+
+        dias = [timezone.localdate(self.ahora - timedelta(days=d)) for d in (100, 95)]
+        self.assertEqual(sorted(archivados), [f'systemlog-{dia:%Y-%m-%d}.jsonl.gz' for dia in dias])
+        self.assertEqual([len(filas) for _, filas in sorted(archivados.items())], [4, 3])
+        fila = archivados[f'systemlog-{dias[0]:%Y-%m-%d}.jsonl.gz'][0]
+        self.assertEqual((fila['username'], fila['action']), ('admin', 'prueba'))
+        # En la tabla quedan solo los recientes
+        self.assertEqual(set(SystemLog.objects.values_list('id', flat=True)), {log.id for log in recientes})
+
+
+class DescargaPDFTests(DatosCuponesMixin, TestCase):
+    """ Descarga del PDF de Pago Fácil a través de la caché en disco. """
+
+    def setUp(self):
+        super().setUp()
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(PDF_CACHE_DIR=directorio.name, PDF_PRERENDER_MODO='no')
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        # Cada test empieza sin cuenta de bytes: el primer guardar recorre el directorio
+        parche = mock.patch.multiple(pdf_cache, _ocupado=None, _ultimo_recorrido=0.0)
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.cupon_id = self.generar_cupon(self.cuotas).data['id']
+        self.url = f'/cupones/cupon/{self.cupon_id}/descargar/'
+
+    def descargar(self, **cabeceras):
+        respuesta = self.cliente.get(self.url, **cabeceras)
+        if respuesta.streaming:
+            respuesta.contenido = b''.join(respuesta.streaming_content)
+        return respuesta
+
+    def test_etag_debil_devuelve_304(self):
+        etag = self.descargar()['ETag']
+        for cabecera in (etag, f'W/{etag}', f'"otro", W/{etag}', '*'):
+            self.assertEqual(self.descargar(HTTP_IF_NONE_MATCH=cabecera).status_code, 304, cabecera)
+        self.assertEqual(self.descargar(HTTP_IF_NONE_MATCH='W/"otro"').status_code, 200)
+
+    def test_sin_caché_en_disco_entrega_el_pdf_igual(self):
+        with mock.patch.object(pdf_cache, 'guardar', side_effect=OSError(28, 'No space left on device')), \
+                mock.patch('cupones.views.print', create=True):
+            respuesta = self.descargar()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.contenido.startswith(b'%PDF'))
+
+    def test_desalojo_solo_al_pasar_el_máximo(self):
+        self.descargar()
+        with mock.patch.object(pdf_cache, '_desalojar', wraps=pdf_cache._desalojar) as desalojar:
+            for i in range(5):
+                pdf_cache.guardar(10000 + i, 'v1', b'x' * 100)
+            desalojar.assert_not_called()
+            with override_settings(PDF_CACHE_MAX_BYTES=pdf_cache._ocupado):
+                pdf_cache.guardar(20000, 'v1', b'x' * 100)
+            desalojar.assert_called_once()
+
+    def test_desalojo_borra_versiones_viejas_y_los_menos_usados(self):
+        directorio = settings.PDF_CACHE_DIR
+        os.makedirs(directorio, exist_ok=True)
+        for nombre, antiguedad in (('1-vieja.pdf', 300), ('1-nueva.pdf', 200), ('2-a.pdf', 100)):
+            ruta = os.path.join(directorio, nombre)
+            with open(ruta, 'wb') as archivo:
+                archivo.write(b'x' * 100)
+            os.utime(ruta, (time.time() - antiguedad,) * 2)
+
+        with override_settings(PDF_CACHE_MAX_BYTES=250):
+            pdf_cache.guardar(3, 'a', b'x' * 100)
+        self.assertEqual(sorted(os.listdir(directorio)), ['2-a.pdf', '3-a.pdf'])
+        self.assertEqual(pdf_cache._ocupado, 200)
+
+
+class GeneradorPDFTests(DatosCuponesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cupon = (
+            CuponPago.objects.select_related('alumno__perfil', 'pasarela').prefetch_related('cuotas_incluidas')
+            .get(pk=self.generar_cupon(self.cuotas).data['id'])
+        )
+
+    def test_logo_en_binario_sin_tocar_use_a85(self):
+        datos = pdf_generator.generate_pago_facil_pdf(self.cupon).getvalue()
+        self.assertEqual(rl_config.useA85, 1)
+        imagenes = re.findall(rb'<<[^>]*/Subtype /Image[^>]*>>', datos)
+        self.assertEqual(len(imagenes), 2) # Logo y su máscara
+        for imagen in imagenes:
+            self.assertIn(b'/Filter [ /FlateDecode ]', imagen)
+
+    def test_logo_como_xobject_con_mascara_suave(self):
+        # Si falla al actualizar ReportLab: revisar _ImagenBinaria y
+        # _registrar_logo, y subir VERSION_REPORTLAB_PROBADA
+        self.assertEqual(reportlab.Version, pdf_generator.VERSION_REPORTLAB_PROBADA)
+
+        pagina = PdfReader(pdf_generator.generate_pago_facil_pdf(self.cupon)).pages[0]
+        formularios = list(pagina['/Resources']['/XObject'].values())
+        self.assertEqual(len(formularios), 1) # La plantilla
+        plantilla = formularios[0].get_object()
+        self.assertEqual(plantilla['/Subtype'], '/Form')
+
+        imagenes = [x.get_object() for x in plantilla['/Resources']['/XObject'].values()]
+        self.assertEqual(len(imagenes), 1)
+        logo, fuente = imagenes[0], pdf_generator._logo()
+        self.assertEqual((logo['/Subtype'], logo['/ColorSpace'], logo['/Filter']), ('/Image', '/DeviceRGB', ['/FlateDecode']))
+        self.assertEqual((logo['/Width'], logo['/Height']), tuple(fuente.getSize()))
+        self.assertEqual(logo.get_data(), fuente.getRGBData())
+
+        mascara = logo['/SMask'].get_object()
+        self.assertEqual((mascara['/Subtype'], mascara['/ColorSpace'], mascara['/Filter']), ('/Image', '/DeviceGray', ['/FlateDecode']))
+        self.assertEqual(mascara.get_data(), fuente._dataA.getRGBData())
+
+    def test_medir_pdf(self):
+        salida = io.StringIO()
+        call_command('medir_pdf', '--cupon', str(self.cupon.id), '--cantidad', '1', stdout=salida)
+        self.assertIn('Generador anterior', salida.getvalue())
+
+
+class PoolSincronico:
+    """ Ejecuta cada tarea en el momento: los procesos del pool real no ven la base del test. """
+
+    def submit(self, funcion, *args):
+        futuro = futures.Future()
+        try:
+            futuro.set_result(funcion(*args))
+        except Exception as e:
+            futuro.set_exception(e)
+        return futuro
+
+    def shutdown(self, **kwargs):
+        pass
+
+
+class PreRenderizadoTests(DatosCuponesMixin, TestCase):
+    """ pdf_worker: el PDF se dibuja al crearse el cupón y la descarga lo toma de la caché. """
+
+    def setUp(self):
+        super().setUp()
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(PDF_CACHE_DIR=directorio.name, PDF_PRERENDER_MAX_PENDIENTES=2)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        for parche in (
+            mock.patch.multiple(pdf_cache, _ocupado=None, _ultimo_recorrido=0.0),
+            mock.patch.object(pdf_worker, '_en_curso', {}),
+            # Dentro de TestCase no se puede cerrar la conexión del test
+            mock.patch.object(pdf_worker, 'close_old_connections'),
+        ):
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def generar(self, pool, **extra):
+        with mock.patch.object(pdf_worker, '_obtener_pool', return_value=pool), \
+                self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.generar_cupon(self.cuotas, **extra)
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        return respuesta.data['id']
+
+    def test_la_descarga_usa_el_pdf_pre_renderizado(self):
+        cupon_id = self.generar(PoolSincronico())
+        self.assertEqual(len(os.listdir(settings.PDF_CACHE_DIR)), 1)
+        self.assertEqual(pdf_worker._en_curso, {})
+
+        with mock.patch('cupones.views.generate_pago_facil_pdf') as generar_pdf:
+            respuesta = self.cliente.get(f'/cupones/cupon/{cupon_id}/descargar/')
+            contenido = b''.join(respuesta.streaming_content)
+        generar_pdf.assert_not_called()
+        self.assertTrue(contenido.startswith(b'%PDF'))
+
+    def test_otras_pasarelas_no_se_dibujan(self):
+        self.generar(PoolSincronico(), pasarela=self.macro_click)
+        self.assertFalse(os.path.exists(settings.PDF_CACHE_DIR) and os.listdir(settings.PDF_CACHE_DIR))
+
+    def test_encolar_no_repite_y_respeta_el_maximo(self):
+        pool = mock.Mock()
+        pool.submit.side_effect = lambda funcion, cupon_id: futures.Future()
+        with mock.patch.object(pdf_worker, '_obtener_pool', return_value=pool):
+            primero = pdf_worker.encolar(1)
+            self.assertIs(pdf_worker.encolar(1), primero)
+            self.assertIsNotNone(pdf_worker.encolar(2))
+            # Con 2 pendientes no se encolan más: se dibujará en la descarga
+            self.assertIsNone(pdf_worker.encolar(3))
+        self.assertEqual(pool.submit.call_count, 2)
+
+        # esperar() devuelve lo que pasó con el render en curso
+        primero.set_result('/ruta/1.pdf')
+        self.assertNotIn(1, pdf_worker._en_curso)
+        self.assertFalse(pdf_worker.esperar(1))
+        self.assertFalse(pdf_worker.esperar(2, timeout=0.01))
+
+    def test_si_el_render_falla_la_descarga_lo_dibuja(self):
+        with mock.patch.object(pdf_worker, 'prerenderizar', side_effect=RuntimeError('falla')), \
+                mock.patch('cupones.pdf_worker.print', create=True) as imprimir:
+            cupon_id = self.generar(PoolSincronico())
+        self.assertIn('falla', imprimir.call_args[0][0])
+
+        respuesta = self.cliente.get(f'/cupones/cupon/{cupon_id}/descargar/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(b''.join(respuesta.streaming_content).startswith(b'%PDF'))
+
+
+@override_settings(PDF_LOTE_TAMANIO=1, PDF_LOTE_WORKERS=1)
+class ExportacionPDFTests(DatosCuponesMixin, TestCase):
+    URL = '/cupones/admin/exportar/cupones-pdf/'
+
+    def setUp(self):
+        super().setUp()
+        self.cupon_ids = [self.generar_cupon([cuota]).data['id'] for cuota in self.cuotas]
+        self.crear_pool = mock.patch.object(exportacion_pdf, '_crear_pool', side_effect=lambda workers: PoolSincronico())
+        for parche in (
+            mock.patch.multiple(exportacion_pdf, _pool=None, _pid=None),
+            mock.patch.object(exportacion_pdf, 'close_old_connections'),
+            mock.patch('cupones.exportacion_pdf.print', create=True),
+        ):
+            parche.start()
+            self.addCleanup(parche.stop)
+
+    def exportar(self, formato, fallan=()):
+        original = exportacion_pdf.renderizar_lote
+
+        def renderizar_lote(cupon_ids, formato):
+            if set(cupon_ids) & set(fallan):
+                raise RuntimeError('falla el render')
+            return original(cupon_ids, formato)
+
+        with self.crear_pool as crear_pool, mock.patch.object(exportacion_pdf, 'renderizar_lote', renderizar_lote):
+            respuesta = self.cliente_admin.get(self.URL, {'formato': formato})
+            bloques = list(respuesta.streaming_content) if respuesta.streaming else []
+        return respuesta, bloques, crear_pool
+
+    def test_zip_con_un_lote_fallido_lleva_la_entrada_de_error(self):
+        respuesta, bloques, _ = self.exportar('zip', fallan=[self.cupon_ids[1]])
+        self.assertEqual(respuesta.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b''.join(bloques))) as archivo_zip:
+            self.assertIsNone(archivo_zip.testzip())
+            self.assertEqual(
+                sorted(archivo_zip.namelist()),
+                ['ERRORES.txt', f'cupon_pago_{self.cupon_ids[0]}.pdf', f'cupon_pago_{self.cupon_ids[2]}.pdf']
+            )
+            self.assertIn(f'Cupones {self.cupon_ids[1]}: RuntimeError', archivo_zip.read('ERRORES.txt').decode())
+
+    def test_falla_el_primer_lote_devuelve_error(self):
+        for formato in ('zip', 'pdf'):
+            respuesta, _, _ = self.exportar(formato, fallan=[self.cupon_ids[0]])
+            self.assertEqual(respuesta.status_code, 500)
+            self.assertIn('primer lote', respuesta.data['error'])
+
+    def test_pdf_unico_en_streaming(self):
+        respuesta, bloques, _ = self.exportar('pdf', fallan=[self.cupon_ids[2]])
+        self.assertEqual(respuesta.status_code, 200)
+        # Un bloque por lote y el cierre (árbol de páginas y xref)
+        self.assertEqual(len(bloques), 4)
+        self.assertTrue(bloques[0].startswith(b'%PDF'))
+        lector = PdfReader(io.BytesIO(b''.join(bloques)), strict=True)
+        self.assertEqual(len(lector.pages), 3)
+        self.assertIn(f'CUPÓN DE PAGO N° {self.cupon_ids[0]}', lector.pages[0].extract_text())
+        self.assertIn('No se pudieron generar estos cupones', lector.pages[2].extract_text())
+
+    def test_las_exportaciones_comparten_el_pool(self):
+        _, _, crear_pool = self.exportar('zip')
+        self.assertEqual(crear_pool.call_count, 1)
+        with self.crear_pool as crear_pool:
+            self.cliente_admin.get(self.URL, {'formato': 'zip'})
+        crear_pool.assert_not_called()
+
+
+class ExportacionCSVTests(DatosCuponesMixin, TestCase):
+
+    def descargar(self, url, **filtros):
+        respuesta = self.cliente_admin.get(url, filtros)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta.streaming)
+        contenido = b''.join(respuesta.streaming_content).decode('utf-8')
+        self.assertTrue(contenido.startswith('\ufeff'))
+        return list(csv.DictReader(io.StringIO(contenido[1:])))
+
+    def test_cupones_con_filtros(self):
+        pagado = self.generar_cupon(self.cuotas[:1], pasarela=self.macro_click).data['id']
+        activo = self.generar_cupon(self.cuotas[1:]).data['id']
+        CuponPago.objects.filter(pk=pagado).update(estado_cupon=EstadoCupon.objects.get(nombre='Pagado'))
+
+        filas = self.descargar('/cupones/admin/exportar/cupones/')
+        self.assertEqual([int(fila['ID Cupón']) for fila in filas], [pagado, activo])
+        self.assertEqual(
+            {k: filas[1][k] for k in ('Monto total', 'Pago parcial', 'Estado', 'Pasarela', 'Usuario', 'DNI', 'Carrera')},
+            {'Monto total': '2000.00', 'Pago parcial': 'No', 'Estado': 'Activo', 'Pasarela': 'Pago Fácil',
+             'Usuario': 'alumno', 'DNI': '30111222', 'Carrera': 'Sistemas'}
+        )
+        self.assertEqual(filas[1]['ID externo'], '')
+
+        filas = self.descargar('/cupones/admin/exportar/cupones/', pasarela=self.macro_click.id)
+        self.assertEqual([int(fila['ID Cupón']) for fila in filas], [pagado])
+        respuesta = self.cliente_admin.get('/cupones/admin/exportar/cupones/', {'fecha_desde': 'ayer'})
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_cuotas_en_varios_lotes(self):
+        self.crear_cuotas(4, estado='Vencida')
+        ids = sorted(Cuota.objects.values_list('id', flat=True))
+        filas = self.descargar('/cupones/admin/exportar/cuotas/')
+        self.assertEqual([int(fila['ID Cuota']) for fila in filas], ids)
+
+        # 7 cuotas en lotes de 2: 4 consultas, cada una desde el último id visto
+        with CaptureQueriesContext(connection) as consultas:
+            leidas = [fila[0] for fila in exportaciones.iterar_por_lotes(Cuota.objects.all(), ['id', 'periodo'], tamanio_lote=2)]
+        self.assertEqual(leidas, ids)
+        self.assertEqual(len(consultas), 4)
+
+        vencida = EstadoCuota.objects.get(nombre='Vencida')
+        filas = self.descargar('/cupones/admin/exportar/cuotas/', estado=vencida.id)
+        self.assertEqual({fila['Estado'] for fila in filas}, {'Vencida'})
+        self.assertEqual(len(filas), 4)
+
+    def test_solo_admin(self):
+        self.assertEqual(self.cliente.get('/cupones/admin/exportar/cuotas/').status_code, 403)
+
+
+class HistorialCuponesTests(DatosCuponesMixin, TestCase):
+    URL = '/cupones/historial/'
+
+    def crear_cupones(self, cantidad):
+        activo = EstadoCupon.objects.get(nombre='Activo')
+        CuponPago.objects.bulk_create([
+            CuponPago(alumno=self.alumno, estado_cupon=activo, pasarela=self.pago_facil, monto_total=Decimal('1000.00'),
+                      fecha_vencimiento=date.today(), idempotency_key=uuid.uuid4())
+            for _ in range(cantidad)
+        ])
+
+    def test_consultas_constantes_por_pagina(self):
+        self.cliente.get(self.URL)
+        for cantidad in (1, 20, 100):
+            with self.subTest(cupones=cantidad):
+                CuponPago.objects.all().delete()
+                self.crear_cupones(cantidad)
+                # Una sola consulta (con los JOIN de estado, pasarela y perfil), sin COUNT(*)
+                with self.assertNumQueries(1):
+                    respuesta = self.cliente.get(self.URL, {'page_size': 100})
+                self.assertEqual(len(respuesta.data['results']), cantidad)
+
+    def test_recorre_todas_las_paginas_sin_repetir(self):
+        self.crear_cupones(45)
+        vistos, url, paginas = [], self.URL, 0
+        while url:
+            with self.assertNumQueries(1):
+                datos = self.cliente.get(url).data
+            vistos += [cupon['id'] for cupon in datos['results']]
+            url, paginas = datos['next'], paginas + 1
+        self.assertEqual(paginas, 3)
+        self.assertEqual(len(set(vistos)), 45)
+        self.assertEqual(vistos, sorted(vistos, reverse=True))
+
+
+class FiltrosGestionCuponesTests(DatosCuponesMixin, TestCase):
+    URL = '/cupones/admin/gestion/'
+
+    def setUp(self):
+        super().setUp()
+        self.otro = User.objects.create_user('mperez', first_name='Mario', last_name='Pérez')
+        self.cupon_alumno = self.generar_cupon(self.cuotas).data['id']
+        self.cupon_otro = self.generar_cupon(self.crear_cuotas(1, alumno=self.otro), cliente=self.cliente_como(self.otro)).data['id']
+
+    def cliente_como(self, usuario):
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+        return cliente
+
+    def ids(self, **filtros):
+        respuesta = self.cliente_admin.get(self.URL, filtros)
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        return {cupon['id'] for cupon in respuesta.data['results']}
+
+    def test_nombre_por_nombre_apellido_o_username(self):
+        self.assertEqual(self.ids(nombre='an'), {self.cupon_alumno}) # Nombre: Ana
+        self.assertEqual(self.ids(nombre='pér'), {self.cupon_otro}) # Apellido: Pérez
+        self.assertEqual(self.ids(nombre='mpe'), {self.cupon_otro}) # Username
+        self.assertEqual(self.ids(nombre='l'), {self.cupon_alumno}) # López, sin repetir el cupón
+        self.assertEqual(self.ids(nombre='zzz'), set())
+
+    def test_es_pago_parcial(self):
+        parcial = self.generar_cupon(self.crear_cuotas(1), monto_parcial='100.00').data['id']
+        self.assertEqual(self.ids(es_pago_parcial='true'), {parcial})
+        self.assertEqual(self.ids(es_pago_parcial='false'), {self.cupon_alumno, self.cupon_otro})
+
+
+class EstadisticasCuponesTests(DatosCuponesMixin, TestCase):
+
+    def cantidades(self):
+        return {
+            (e.estado_cupon.nombre, e.pasarela.nombre): e.cantidad
+            for e in EstadisticaCupon.objects.select_related('estado_cupon', 'pasarela') if e.cantidad
+        }
+
+    def test_se_suman_despues_del_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as consultas:
+                cupon_id = self.generar_cupon(self.cuotas, pasarela=self.macro_click).data['id']
+            # Dentro de la transacción de la generación no se toca el contador
+            self.assertFalse(any('estadisticacupon' in c['sql'] for c in consultas))
+        self.assertEqual(self.cantidades(), {('Activo', 'Macro Click'): 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cliente.patch(f'/cupones/cupon/{cupon_id}/anular/')
+        self.assertEqual(self.cantidades(), {('Anulado', 'Macro Click'): 1})
+
+    def test_filtros(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.generar_cupon(self.cuotas[:1], pasarela=self.macro_click)
+            self.generar_cupon(self.cuotas[1:])
+        url = '/cupones/admin/gestion/estadisticas/'
+        self.assertEqual(self.cliente_admin.get(url, {'pasarela': self.macro_click.id}).data['total'], 1)
+        mes = date.today().strftime('%Y-%m')
+        self.assertEqual(self.cliente_admin.get(url, {'mes': mes, 'pasarela': ''}).data['total'], 2)
+        self.assertEqual(self.cliente_admin.get(url, {'mes': '2000-01'}).data['total'], 0)
+
+        for parametros in ({'pasarela': 'abc'}, {'pasarela': '-1'}, {'mes': '2024-13'}, {'mes': 'enero'}):
+            with self.subTest(**parametros):
+                respuesta = self.cliente_admin.get(url, parametros)
+                self.assertEqual(respuesta.status_code, 400)
+                self.assertIn(next(iter(parametros)), respuesta.data)
+
+    def test_rollback_no_suma(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            # Otra cuota ya reclamada por otro cupón: se deshace todo
+            self.generar_cupon(self.cuotas[:1], pasarela=self.macro_click)
+            respuesta = self.generar_cupon(self.cuotas, pasarela=self.macro_click)
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(self.cantidades(), {('Activo', 'Macro Click'): 1})
+
+
+class CambioEstadoMasivoTests(DatosCuponesMixin, TestCase):
+    URL = '/cupones/admin/cupones/estado/'
+
+    def generar(self, cuotas):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.generar_cupon(cuotas)
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        return respuesta.data['id']
+
+    def cambiar(self, cupon_ids, estado, **extra):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.cliente_admin.post(self.URL, {'cupon_ids': cupon_ids, 'estado': estado, **extra}, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        return {r['id']: (r['resultado'], r['detalle']) for r in respuesta.data['resultados']}
+
+    def cantidades(self):
+        return {
+            e.estado_cupon.nombre: e.cantidad
+            for e in EstadisticaCupon.objects.select_related('estado_cupon') if e.cantidad
+        }
+
+    def test_resultado_por_cupon_estadisticas_y_cuotas(self):
+        activo, pagado, anulado = (self.generar([cuota]) for cuota in self.cuotas)
+        self.cambiar([pagado], 'Pagado')
+        self.cambiar([anulado], 'Anulado', motivo='Error de carga')
+        self.assertEqual(self.cantidades(), {'Activo': 1, 'Pagado': 1, 'Anulado': 1})
+
+        resultados = self.cambiar([activo, pagado, anulado, 999999], 'Pagado')
+        self.assertEqual({cupon_id: resultado for cupon_id, (resultado, _) in resultados.items()}, {
+            activo: 'actualizado', pagado: 'sin_cambios', anulado: 'conflicto', 999999: 'no_encontrado',
+        })
+        self.assertEqual(self.cantidades(), {'Pagado': 2, 'Anulado': 1})
+        self.assertEqual(
+            [(c.estado_cuota.nombre, c.saldo_capital, c.cupon_activo_id) for c in Cuota.objects.order_by('id')],
+            [('Pagada', 0, None), ('Pagada', 0, None), ('Pendiente', Decimal('1000.00'), None)]
+        )
+
+    def test_anular_libera_las_cuotas(self):
+        cupon_id = self.generar(self.cuotas)
+        self.assertEqual(self.cambiar([cupon_id], 'Anulado', motivo='Pedido del alumno')[cupon_id][0], 'actualizado')
+        self.assertEqual(CuponPago.objects.get(pk=cupon_id).motivo_anulacion, 'Pedido del alumno')
+        self.assertFalse(Cuota.objects.filter(cupon_activo__isnull=False).exists())
+        self.assertEqual(self.generar_cupon(self.cuotas).status_code, 201)
+
+    def test_pagar_un_expirado_anula_el_cupon_activo_de_sus_cuotas(self):
+        expirado = self.generar(self.cuotas[:2])
+        self.cambiar([expirado], 'Expirado')
+        activo = self.generar(self.cuotas)
+
+        # Como lo haría la pasarela que igual cobró el cupón vencido
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            resultados = cambiar_estado_cupones([expirado], catalogos.estado_cupon('Pagado'))
+        self.assertEqual(resultados[expirado][0], 'actualizado')
+        self.assertIn(str(activo), resultados[expirado][1])
+
+        self.assertEqual(CuponPago.objects.get(pk=activo).estado_cupon.nombre, 'Anulado')
+        self.assertEqual(self.cantidades(), {'Pagado': 1, 'Anulado': 1})
+        self.assertEqual(
+            [(c.estado_cuota.nombre, c.cupon_activo_id) for c in Cuota.objects.order_by('id')],
+            [('Pagada', None), ('Pagada', None), ('Pendiente', None)]
+        )
+
+    def test_consultas_no_crecen_con_la_cantidad_de_cupones(self):
+        # El primer pago crea la fila de 'Pagado' en EstadisticaCupon
+        self.cambiar([self.generar(self.cuotas)], 'Pagado')
+        conteos = []
+        for cantidad in (2, 20):
+            cupon_ids = [self.generar([cuota]) for cuota in self.crear_cuotas(cantidad)]
+            with CaptureQueriesContext(connection) as consultas:
+                resultados = self.cambiar(cupon_ids, 'Pagado')
+            self.assertEqual({resultado for resultado, _ in resultados.values()}, {'actualizado'})
+            conteos.append(len(consultas))
+        self.assertEqual(conteos[0], conteos[1])
+
+
+@override_settings(WEBHOOK_SECRETOS={'Macro Click': 'secreto-de-prueba'})
+class WebhookPasarelaTests(DatosCuponesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cupon = CuponPago.objects.get(pk=self.generar_cupon(self.cuotas, pasarela=self.macro_click).data['id'])
+        self.url = f'/cupones/webhooks/{self.macro_click.id}/'
+
+    def cuerpo(self, evento_id='ev-1', tipo='pago.aprobado'):
+        return json.dumps({'evento_id': evento_id, 'tipo': tipo, 'cupon': self.cupon.id, 'monto': str(self.cupon.monto_total)}).encode()
+
+    def enviar(self, cuerpo, firma=None):
+        if firma is None:
+            firma = hmac.new(b'secreto-de-prueba', cuerpo, hashlib.sha256).hexdigest()
+        return APIClient().post(self.url, data=cuerpo, content_type='application/json', HTTP_X_FIRMA=firma)
+
+    def procesar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return webhooks.procesar_lote()
+
+    def test_reenvio_del_mismo_evento_cambia_el_estado_una_sola_vez(self):
+        cuerpo = self.cuerpo()
+        self.assertEqual(self.enviar(cuerpo).status_code, 202)
+        self.assertEqual(self.enviar(cuerpo).status_code, 202)
+        self.assertEqual(EventoPasarela.objects.count(), 1)
+
+        self.assertEqual(self.procesar(), {EventoPasarela.PROCESADO: 1})
+        self.cupon.refresh_from_db()
+        self.assertEqual(self.cupon.estado_cupon.nombre, 'Pagado')
+        self.assertEqual(Cuota.objects.filter(estado_cuota__nombre='Pagada').count(), 3)
+        pagados = EstadisticaCupon.objects.get(estado_cupon__nombre='Pagado').cantidad
+
+        # Reenvío después de procesado: se descarta al recibirlo
+        self.assertEqual(self.enviar(cuerpo).status_code, 202)
+        self.assertEqual(self.procesar(), {})
+        # Otro evento para el mismo pago: no vuelve a liquidar ni a contar
+        self.enviar(self.cuerpo(evento_id='ev-2'))
+        self.assertEqual(self.procesar(), {EventoPasarela.PROCESADO: 1})
+        self.assertEqual(EstadisticaCupon.objects.get(estado_cupon__nombre='Pagado').cantidad, pagados)
+
+    def test_firma_invalida(self):
+        cuerpo = self.cuerpo()
+        for firma in ('', 'f' * 64, hmac.new(b'otro-secreto', cuerpo, hashlib.sha256).hexdigest()):
+            with self.subTest(firma=firma):
+                self.assertEqual(self.enviar(cuerpo, firma=firma).status_code, 403)
+        # Firma de otro cuerpo (monto alterado)
+        firma = hmac.new(b'secreto-de-prueba', cuerpo, hashlib.sha256).hexdigest()
+        self.assertEqual(self.enviar(cuerpo.replace(b'"monto"', b'"monto" ', 1), firma=firma).status_code, 403)
+        self.assertFalse(EventoPasarela.objects.exists())
+
+    def test_pasarela_sin_secreto_rechaza_todo(self):
+        self.url = f'/cupones/webhooks/{self.pago_facil.id}/'
+        self.assertEqual(self.enviar(self.cuerpo()).status_code, 403)
+
+
+class PasarelaSimulada:
+    """
+    Pasarela de prueba: arma las notificaciones de cada cupón y las entrega
+    al webhook firmadas, en desorden y con reenvíos, como una pasarela real
+    que reintenta.
+    """
+
+    def __init__(self, pasarela, secreto, semilla=0):
+        self.pasarela = pasarela
+        self.secreto = secreto.encode()
+        self.azar = random.Random(semilla)
+        self.cliente = APIClient()
+
+    def notificaciones(self, cupones, tipo, reenvios=4):
+        """ Una notificación por cupón, más hasta 'reenvios' copias del mismo evento. """
+        cuerpos = []
+        for cupon in cupones:
+            cuerpo = json.dumps({
+                'evento_id': f'{tipo}-{cupon.id}', 'tipo': tipo, 'cupon': cupon.id, 'monto': str(cupon.monto_total)
+            }).encode()
+            cuerpos.extend([cuerpo] * (1 + self.azar.randint(0, reenvios)))
+        return cuerpos
+
+    def entregar(self, cuerpos):
+        cuerpos = list(cuerpos)
+        self.azar.shuffle(cuerpos)
+        for cuerpo in cuerpos:
+            firma = hmac.new(self.secreto, cuerpo, hashlib.sha256).hexdigest()
+            respuesta = self.cliente.post(
+                f'/cupones/webhooks/{self.pasarela.id}/', data=cuerpo, content_type='application/json', HTTP_X_FIRMA=firma
+            )
+            assert respuesta.status_code == 202, respuesta.data
+        return len(cuerpos)
+
+
+@override_settings(WEBHOOK_SECRETOS={'Macro Click': 'secreto-de-prueba'})
+class ReenviosPasarelaTests(DatosCuponesMixin, TestCase):
+    """ Miles de notificaciones repetidas y desordenadas terminan en un cambio por cupón. """
+
+    def setUp(self):
+        super().setUp()
+        cuotas = self.crear_cuotas(300)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cupones = [
+                CuponPago.objects.get(pk=self.generar_cupon([cuota], pasarela=self.macro_click).data['id'])
+                for cuota in cuotas
+            ]
+        self.pasarela = PasarelaSimulada(self.macro_click, 'secreto-de-prueba')
+
+    def procesar(self):
+        salida = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('procesar_eventos_pasarela', '--lote', '50', stdout=salida)
+        return salida.getvalue()
+
+    def test_reenvios_desordenados(self):
+        aprobados, anulados = self.cupones[:200], self.cupones[200:]
+        entregas = self.pasarela.notificaciones(aprobados, 'pago.aprobado') + self.pasarela.notificaciones(anulados, 'pago.anulado')
+
+        # Llegan en tandas, con el procesamiento intercalado; al final la
+        # pasarela reintenta todo dos veces más
+        enviados = 0
+        for inicio in range(0, len(entregas), 400):
+            enviados += self.pasarela.entregar(entregas[inicio:inicio + 400])
+            self.procesar()
+        for _ in range(2):
+            enviados += self.pasarela.entregar(entregas)
+        self.procesar()
+        self.assertGreater(enviados, 2000)
+
+        self.assertEqual(EventoPasarela.objects.count(), 300)
+        self.assertEqual(set(EventoPasarela.objects.values_list('estado', flat=True)), {EventoPasarela.PROCESADO})
+        self.assertEqual(CuponPago.objects.filter(estado_cupon__nombre='Pagado').count(), 200)
+        self.assertEqual(CuponPago.objects.filter(estado_cupon__nombre='Anulado').count(), 100)
+        self.assertEqual(Cuota.objects.filter(estado_cuota__nombre='Pagada').count(), 200)
+        self.assertFalse(Cuota.objects.filter(cupon_activo__isnull=False).exists())
+        self.assertEqual(
+            {e.estado_cupon.nombre: e.cantidad for e in EstadisticaCupon.objects.select_related('estado_cupon') if e.cantidad},
+            {'Pagado': 200, 'Anulado': 100}
+        )
+
+    def test_eventos_en_conflicto_se_aplican_en_orden_de_llegada(self):
+        cupon = self.cupones[0]
+        # La anulación llega antes que el pago: el pago queda diferido y falla
+        self.pasarela.entregar(self.pasarela.notificaciones([cupon], 'pago.anulado', reenvios=0))
+        self.pasarela.entregar(self.pasarela.notificaciones([cupon], 'pago.aprobado', reenvios=0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(webhooks.procesar_lote(), {EventoPasarela.PROCESADO: 1, webhooks.DIFERIDO: 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(webhooks.procesar_lote(), {EventoPasarela.ERROR: 1})
+        cupon.refresh_from_db()
+        self.assertEqual(cupon.estado_cupon.nombre, 'Anulado')
+
+    def test_el_comando_sigue_si_todo_el_lote_queda_diferido(self):
+        resumenes = iter([{webhooks.DIFERIDO: 50}, {EventoPasarela.PROCESADO: 50}, {}])
+        with mock.patch('cupones.management.commands.procesar_eventos_pasarela.procesar_lote', side_effect=lambda lote: next(resumenes)) as procesar:
+            salida = self.procesar()
+        self.assertEqual(procesar.call_count, 3)
+        self.assertIn('50 eventos procesados', salida)
+
+
+class ConciliacionTests(DatosCuponesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a, self.b = (
+                CuponPago.objects.get(pk=self.generar_cupon([cuota], pasarela=self.macro_click).data['id'])
+                for cuota in self.cuotas[:2]
+            )
+            self.c = CuponPago.objects.get(pk=self.generar_cupon(self.cuotas[2:]).data['id'])
+
+    def conciliar(self, filas, *argumentos):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as archivo:
+            archivo.write('cupon,monto\n' + ''.join(f'{cupon},{monto}\n' for cupon, monto in filas))
+        self.addCleanup(os.remove, archivo.name)
+        salida, errores = io.StringIO(), io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('conciliar_pagos', archivo.name, *argumentos, stdout=salida, stderr=errores)
+        reporte = list(csv.DictReader(io.StringIO(salida.getvalue())))
+        return [(fila['linea'], fila['resultado']) for fila in reporte], errores.getvalue()
+
+    def test_coincidencias_y_diferencias(self):
+        reporte, resumen = self.conciliar([
+            (self.a.id, '1000.00'),    # 2: conciliado
+            (self.b.id, '999,99'),     # 3: monto distinto
+            (self.a.id, '1000.00'),    # 4: repetido
+            (999999, '1000.00'),       # 5: no existe
+            ('abc', '1000.00'),        # 6: formato inválido
+            (self.c.id, '1000.00'),    # 7: de Pago Fácil
+        ], '--pasarela', 'Macro Click')
+
+        self.assertEqual(sorted(reporte), [
+            ('3', 'monto_distinto'), ('4', 'duplicado'), ('5', 'no_encontrado'),
+            ('6', 'formato_invalido'), ('7', 'pasarela_distinta'),
+        ])
+        # La salida estándar es solo el CSV; el resumen va a stderr
+        self.assertIn('conciliado: 1', resumen)
+        self.assertIn('1 cupones conciliados, 5 diferencias', resumen)
+
+        self.a.refresh_from_db()
+        self.assertEqual(self.a.estado_cupon.nombre, 'Pagado')
+        self.assertEqual(Cuota.objects.get(pk=self.cuotas[0].pk).estado_cuota.nombre, 'Pagada')
+        self.assertEqual(CuponPago.objects.filter(estado_cupon__nombre='Activo').count(), 2)
+
+    def test_repetido_en_otro_lote_figura_como_ya_pagado(self):
+        reporte, _ = self.conciliar([
+            (self.a.id, '1000.00'), (self.b.id, '1000.00'), (self.a.id, '1000.00'), (self.b.id, '1000.00'),
+        ], '--lote', '2')
+        self.assertEqual(reporte, [('4', 'ya_pagado'), ('5', 'ya_pagado')])
+        self.assertEqual(CuponPago.objects.filter(estado_cupon__nombre='Pagado').count(), 2)
+
+
+class ComandosEnLoopTests(DatosCuponesMixin, TestCase):
+
+    def test_expirar_cupones_renueva_la_conexion_en_cada_vuelta(self):
+        vencido = CuponPago.objects.get(pk=self.generar_cupon(self.cuotas, pasarela=self.macro_click).data['id'])
+        CuponPago.objects.filter(pk=vencido.pk).update(fecha_vencimiento=date.today() - timedelta(days=1))
+
+        # La tercera espera corta el loop (como un Ctrl+C)
+        esperas = mock.Mock(side_effect=[None, None, KeyboardInterrupt])
+        with mock.patch('cupones.management.commands.expirar_cupones.time.sleep', esperas), \
+                mock.patch('cupones.management.commands.expirar_cupones.close_old_connections') as cerrar:
+            call_command('expirar_cupones', '--loop', '--interval', '1', stdout=io.StringIO())
+
+        self.assertEqual(cerrar.call_count, 3)
+        vencido.refresh_from_db()
+        self.assertEqual(vencido.estado_cupon.nombre, 'Expirado')
+        self.assertFalse(Cuota.objects.filter(cupon_activo__isnull=False).exists())
+
+
+class RecargosTests(DatosCuponesMixin, TestCase):
+    """ El recargo por mora se cobra una sola vez, antes que el saldo de la cuota. """
+
+    def setUp(self):
+        super().setUp()
+        TasaRecargo.objects.create(dias_desde=1, porcentaje=Decimal('10.00'))
+        self.hoy = date.today()
+        self.cuota = self.crear_cuotas(1, vencimiento=self.hoy - timedelta(days=5))[0]
+        self.aplicar()
+
+    def aplicar(self):
+        list(recargos.aplicar_recargos(self.hoy, forzar=True))
+        self.cuota.refresh_from_db()
+
+    def pagar_cupon(self, **extra):
+        cupon_id = self.generar_cupon([self.cuota], pasarela=self.macro_click, **extra).data['id']
+        pagado = EstadoCupon.objects.get(nombre='Pagado')
+        respuesta = self.cliente_admin.patch(f'/cupones/admin/cupon/{cupon_id}/estado/', {'estado_cupon_id': pagado.id}, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        self.cuota.refresh_from_db()
+        return CuponPago.objects.get(pk=cupon_id)
+
+    def test_cupon_completo_cobra_saldo_y_recargo(self):
+        self.assertEqual(self.cuota.recargo, Decimal('100.00'))
+        cupon = self.pagar_cupon()
+        self.assertEqual(cupon.monto_total, Decimal('1100.00'))
+        self.assertEqual((self.cuota.saldo_pendiente, self.cuota.recargo_pagado), (0, Decimal('100.00')))
+        self.assertEqual(self.cuota.estado_cuota.nombre, 'Pagada')
+
+    def test_cupon_parcial_cancela_primero_el_recargo(self):
+        self.pagar_cupon(monto_parcial='150.00')
+        self.assertEqual((self.cuota.saldo_pendiente, self.cuota.recargo_pagado), (Decimal('950.00'), Decimal('100.00')))
+        self.assertEqual(self.cuota.estado_cuota.nombre, 'Pendiente')
+
+        # Recalcular el recargo no vuelve a cobrar lo ya pagado
+        self.aplicar()
+        self.assertEqual(self.cuota.total_adeudado, Decimal('950.00'))
+        self.assertEqual(self.generar_cupon([self.cuota], pasarela=self.macro_click).data['monto_total'], '950.00')
+
+    def test_pago_parcial_directo(self):
+        url = f'/cupones/cuota/{self.cuota.id}/pagar/'
+        self.assertEqual(self.cliente.post(url, {'monto': '1100.01'}, format='json').status_code, 400)
+
+        self.assertEqual(self.cliente.post(url, {'monto': '60.00'}, format='json').status_code, 201)
+        self.cuota.refresh_from_db()
+        self.assertEqual((self.cuota.saldo_pendiente, self.cuota.recargo_pagado), (Decimal('1000.00'), Decimal('60.00')))
+
+        respuesta = self.cliente.post(url, {'monto': '1040.00'}, format='json')
+        self.assertEqual(respuesta.status_code, 201, respuesta.data)
+        self.cuota.refresh_from_db()
+        self.assertEqual((self.cuota.saldo_pendiente, self.cuota.recargo_pagado), (0, Decimal('100.00')))
+        self.assertEqual(self.cuota.estado_cuota.nombre, 'Pagada')
+
+    def test_recargo_devengado_despues_del_cupon_sigue_adeudado(self):
+        cupon_id = self.generar_cupon([self.cuota], pasarela=self.macro_click).data['id']
+        TasaRecargo.objects.update(porcentaje=Decimal('20.00'))
+        self.aplicar()
+        self.assertEqual(self.cuota.recargo, Decimal('200.00'))
+
+        pagado = EstadoCupon.objects.get(nombre='Pagado')
+        respuesta = self.cliente_admin.patch(f'/cupones/admin/cupon/{cupon_id}/estado/', {'estado_cupon_id': pagado.id}, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        self.cuota.refresh_from_db()
+
+        # El cupón cobró 1100: los 100 de recargo extra siguen pendientes
+        self.assertEqual((self.cuota.saldo_pendiente, self.cuota.recargo_pagado), (0, Decimal('100.00')))
+        self.assertEqual(self.cuota.total_adeudado, Decimal('100.00'))
+        self.assertEqual(self.cuota.estado_cuota.nombre, 'Pendiente')
+        self.assertEqual(self.generar_cupon([self.cuota], pasarela=self.macro_click).data['monto_total'], '100.00')
+
+    def test_bajar_la_tasa_no_deja_el_recargo_por_debajo_de_lo_cobrado(self):
+        self.cliente.post(f'/cupones/cuota/{self.cuota.id}/pagar/', {'monto': '80.00'}, format='json')
+        TasaRecargo.objects.update(porcentaje=Decimal('5.00'))
+        self.aplicar()
+        self.assertEqual((self.cuota.recargo, self.cuota.recargo_pendiente), (Decimal('80.00'), 0))
+
+
+class EmisionCuotasTests(DatosCuponesMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alumnos = [self.alumno]
+        for i in range(4):
+            alumno = User.objects.create_user(f'sistemas{i}')
+            Perfil.objects.filter(user=alumno).update(carrera='Sistemas')
+            self.alumnos.append(alumno)
+        # No reciben cuotas: inactivo, staff y de otra carrera
+        Perfil.objects.filter(user=User.objects.create_user('inactivo', is_active=False)).update(carrera='Sistemas')
+        Perfil.objects.filter(user=self.admin).update(carrera='Sistemas')
+        Perfil.objects.filter(user=User.objects.create_user('contable')).update(carrera='Contabilidad')
+
+    def emitir(self, *extra):
+        salida = io.StringIO()
+        call_command(
+            'emitir_cuotas', '--carrera', 'Sistemas', '--periodo', 'Período 2026-1', '--cuotas', '3',
+            '--monto', '1500.00', '--primer-vencimiento', '2026-01-31', '--batch-size', '2', *extra, stdout=salida
+        )
+        return salida.getvalue()
+
+    def cuotas_del_plan(self):
+        return Cuota.objects.filter(periodo__endswith='Período 2026-1')
+
+    def test_emite_el_plan_por_lotes_sin_duplicar(self):
+        # Un alumno ya tenía la primera cuota del plan
+        Cuota.objects.create(
+            alumno=self.alumnos[1], estado_cuota=EstadoCuota.objects.get(nombre='Pendiente'),
+            periodo='Cuota 1/3 - Período 2026-1', monto=Decimal('1500.00'), fecha_vencimiento=date(2026, 1, 31)
+        )
+        self.assertIn('Se crearon 14 cuotas para 5 alumnos (1 ya existían)', self.emitir())
+
+        cuotas = self.cuotas_del_plan()
+        self.assertEqual(cuotas.count(), 15)
+        self.assertEqual(set(cuotas.values_list('alumno_id', flat=True)), {alumno.id for alumno in self.alumnos})
+        self.assertEqual(
+            sorted(set(cuotas.values_list('periodo', 'fecha_vencimiento'))),
+            [('Cuota 1/3 - Período 2026-1', date(2026, 1, 31)), ('Cuota 2/3 - Período 2026-1', date(2026, 2, 28)),
+             ('Cuota 3/3 - Período 2026-1', date(2026, 3, 31))]
+        )
+        self.assertEqual(set(cuotas.values_list('estado_cuota__nombre', 'monto')), {('Pendiente', Decimal('1500.00'))})
+
+        # Volver a emitir el mismo plan no crea nada
+        self.assertIn('Se crearon 0 cuotas para 5 alumnos (15 ya existían)', self.emitir())
+        self.assertEqual(self.cuotas_del_plan().count(), 15)
+
+    def test_dry_run_no_crea(self):
+        self.assertIn('[dry-run] Se crearían 15 cuotas para 5 alumnos', self.emitir('--dry-run'))
+        self.assertFalse(self.cuotas_del_plan().exists())
+
+
+class ImportacionAlumnosTests(TestCase):
+
+    def importar(self, contenido, tamanio_lote=1000):
+        errores = io.StringIO()
+        importador = ImportadorAlumnos(csv.writer(errores), tamanio_lote=tamanio_lote)
+        list(importador.importar(leer_alumnos(io.StringIO(contenido))))
+        return importador, list(csv.reader(io.StringIO(errores.getvalue())))
+
+    def test_largos_maximos_por_columna(self):
+        importador, errores = self.importar(
+            'username,nombre,apellido,email,dni,legajo,carrera\n'
+            f'ok,Ana,López,ana@example.com,1,L1,{"x" * 100}\n'
+            f'carrera_larga,Ana,López,,2,L2,{"x" * 101}\n'
+            f'nombre_largo,{"n" * 151},López,,3,L3,Sistemas\n'
+        )
+        self.assertEqual(importador.creados, 1)
+        self.assertEqual([(linea, error) for linea, _, error in errores], [
+            ('3', "El campo 'carrera' supera los 100 caracteres."),
+            ('4', "El campo 'nombre' supera los 150 caracteres."),
+        ])
+        self.assertEqual(Perfil.objects.get(user__username='ok').carrera, 'x' * 100)
+
+    def test_username_invalido(self):
+        importador, errores = self.importar(
+            'username,email\n'
+            'ana.lopez+2024@fi,ana@example.com\n'
+            'juan perez,juan@example.com\n'
+            'maria;drop,maria@example.com\n'
+            'josé_núñez,jose@example.com\n'
+        )
+        self.assertEqual(importador.creados, 2)
+        mensaje = 'El username solo puede tener letras, números y los caracteres @/./+/-/_.'
+        self.assertEqual(errores, [['3', 'juan perez', mensaje], ['4', 'maria;drop', mensaje]])
+        self.assertTrue(User.objects.filter(username='josé_núñez').exists())
+
+    def test_repetidos_sin_distinguir_mayusculas(self):
+        importador, errores = self.importar(
+            'username,email,legajo\n'
+            'Juan,juan@example.com,L-1\n'
+            'juan,otro@example.com,L-2\n'
+            'maria,JUAN@example.com,L-3\n'
+            'pedro,pedro@example.com,l-1\n'
+        )
+        self.assertEqual(importador.creados, 1)
+        self.assertEqual([linea for linea, _, _ in errores], ['3', '4', '5'])
+
+    def test_lote_fallido_no_marca_sus_valores_como_vistos(self):
+        original = Perfil.objects.bulk_create
+        llamadas = []
+
+        def falla_la_primera_vez(*args, **kwargs):
+            llamadas.append(1)
+            if len(llamadas) == 1:
+                raise IntegrityError('Duplicate entry')
+            return original(*args, **kwargs)
+
+        with mock.patch.object(Perfil.objects, 'bulk_create', side_effect=falla_la_primera_vez):
+            # El primer lote falla; la fila corregida del segundo lote se importa igual
+            importador, errores = self.importar('username,dni\nana,1\nbeto,2\nana,1\n', tamanio_lote=2)
+
+        self.assertEqual(importador.creados, 1)
+        self.assertEqual([linea for linea, _, _ in errores], ['2', '3'])
+        self.assertEqual(Perfil.objects.get(dni='1').user.username, 'ana')
+
+
+@override_settings(GOOGLE_CLIENT_ID='cliente-de-prueba')
+class AutenticacionTests(TestCase):
+    """ Consultas de las vistas de registro y acceso, y alta del Perfil. """
+
+    def setUp(self):
+        self.cliente = APIClient()
+        self.usuario = User.objects.create_user(
+            username='ana', email='ana@example.com', password='clave-segura-123'
+        )
+
+    def login_google(self, email, **datos):
+        idinfo = {'email': email, 'given_name': 'Ana', 'family_name': 'López', **datos}
+        with mock.patch('cupones.views.id_token.verify_oauth2_token', return_value=idinfo):
+            return self.cliente.post('/google-login/', {'credential': 'token'}, format='json')
+
+    def test_signup(self):
+        # Dos verificaciones de unicidad, el User y su Perfil
+        with self.assertNumQueries(4):
+            respuesta = self.cliente.post('/signup/', {
+                'username': 'beto', 'email': 'beto@example.com', 'password': 'clave-segura-123'
+            }, format='json')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertTrue(Perfil.objects.filter(user__username='beto').exists())
+
+    def test_login_google_usuario_nuevo(self):
+        # get_or_create: búsqueda, savepoint, User, Perfil y liberación del savepoint
+        with self.assertNumQueries(5):
+            respuesta = self.login_google('beto@example.com')
+        self.assertTrue(respuesta.data['require_password'])
+        usuario = User.objects.get(email='beto@example.com')
+        self.assertFalse(usuario.has_usable_password())
+        self.assertTrue(Perfil.objects.filter(user=usuario).exists())
+
+    def test_login_google_usuario_existente(self):
+        # Solo la búsqueda: no se guarda nada
+        with self.assertNumQueries(1):
+            respuesta = self.login_google('ana@example.com')
+        self.assertFalse(respuesta.data['require_password'])
+        self.assertIn('access', respuesta.data)
+
+    def test_confirmar_reseteo_de_contrasenia(self):
+        datos = {
+            'uid': urlsafe_base64_encode(force_bytes(self.usuario.pk)),
+            'token': default_token_generator.make_token(self.usuario),
+            'new_password': 'otra-clave-segura-456',
+        }
+        with self.assertNumQueries(2):
+            respuesta = self.cliente.post('/password-reset/confirm/', datos, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.usuario.refresh_from_db()
+        self.assertTrue(self.usuario.check_password('otra-clave-segura-456'))
+
+    def test_completar_perfil(self):
+        with self.assertNumQueries(3):
+            respuesta = self.cliente.post('/complete-profile/', {
+                'user_id': self.usuario.pk, 'username': 'ana.lopez',
+                'first_name': 'Ana', 'last_name': 'López', 'password': 'otra-clave-segura-456'
+            }, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.usuario.username, 'ana.lopez')
+        self.assertTrue(self.usuario.check_password('otra-clave-segura-456'))
+
+    def test_guardar_usuario_existente_no_toca_el_perfil(self):
+        with self.assertNumQueries(1):
+            self.usuario.save(update_fields=['last_login'])
+        self.assertEqual(Perfil.objects.filter(user=self.usuario).count(), 1)
+
+    def test_carga_de_fixture_no_crea_perfil(self):
+        # loaddata guarda con raw=True: el Perfil viene en la misma fixture
+        fixture = json.dumps([{
+            'model': 'auth.user', 'pk': 999,
+            'fields': {'username': 'fixture', 'password': '!', 'email': 'fixture@example.com'}
+        }])
+        for objeto in serializers.deserialize('json', fixture):
+            objeto.save()
+        self.assertTrue(User.objects.filter(pk=999).exists())
+        self.assertFalse(Perfil.objects.filter(user_id=999).exists())
+
+
+class MigracionPerfilesFaltantesTests(TransactionTestCase):
+    """ La migración 0017 crea el Perfil de los usuarios que no lo tienen. """
+
+    anterior = [('cupones', '0016_indices_emision_cuotas')]
+    migracion = [('cupones', '0017_completar_perfiles')]
+
+    def tearDown(self):
+        # Deja el esquema en la última migración para los demás tests
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def test_crea_perfiles_faltantes(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.anterior)
+        apps = executor.loader.project_state(self.anterior).apps
+        UserHistorico = apps.get_model('auth', 'User')
+        PerfilHistorico = apps.get_model('cupones', 'Perfil')
+        # Los modelos históricos no disparan la señal: usuarios sin Perfil
+        sin_perfil = UserHistorico.objects.create(username='sin_perfil')
+        con_perfil = UserHistorico.objects.create(username='con_perfil')
+        PerfilHistorico.objects.create(user_id=con_perfil.pk, legajo='L-1')
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.migracion)
+
+        apps = executor.loader.project_state(self.migracion).apps
+        PerfilHistorico = apps.get_model('cupones', 'Perfil')
+        self.assertTrue(PerfilHistorico.objects.filter(user_id=sin_perfil.pk).exists())
+        self.assertEqual(PerfilHistorico.objects.get(user_id=con_perfil.pk).legajo, 'L-1')
+        self.assertEqual(PerfilHistorico.objects.count(), 2)
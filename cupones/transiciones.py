@@ -0,0 +1,198 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Count, DateField
+from django.db.models.functions import TruncMonth
+
+from .models import Cuota, CuponPago, CuponPagoCuota, EstadisticaCupon
+from .catalogos import catalogos
+from .cache_utils import invalidar_cuotas_pendientes
+
+# Estados desde los que se puede llegar a cada estado en un cambio masivo
+ESTADOS_ORIGEN_PERMITIDOS = {
+    'Pagado': ('Activo', 'Expirado'),
+    'Anulado': ('Activo', 'Expirado'),
+    'Expirado': ('Activo',),
+}
+
+# --- TRANSICIONES DE ESTADO DE CUPONES ---
+# Lógica compartida entre las vistas y los comandos que cambian el estado
+# de un cupón, para que los datos derivados queden siempre consistentes.
+
+
+def reclamar_cuotas(cupon, cuota_ids):
+    """
+    Marca las cuotas como cubiertas por 'cupon' (recién creado y Activo).
+    El UPDATE solo toca cuotas sin cupón activo, así que si otra request
+    reclamó alguna al mismo tiempo, no se actualizan todas: devuelve False
+    y el llamador debe deshacer la transacción.
+    """
+    cuota_ids = set(cuota_ids)
+    reclamadas = Cuota.objects.filter(
+        id__in=cuota_ids,
+        cupon_activo__isnull=True
+    ).update(cupon_activo=cupon)
+    return reclamadas == len(cuota_ids)
+
+
+def liberar_cuotas(cupon_ids):
+    """
+    Quita la marca de cupón activo de las cuotas de estos cupones.
+    Se llama cuando un cupón deja de estar Activo (anulado, pagado, expirado).
+    """
+    return Cuota.objects.filter(cupon_activo_id__in=list(cupon_ids)).update(cupon_activo=None)
+
+
+def ajustar_estadisticas_por_cambio(cupon_ids, estado_nuevo):
+    """
+    Para los UPDATE masivos de estado (que no disparan señales): mueve en
+    EstadisticaCupon los cupones indicados desde su estado actual a
+    'estado_nuevo'. Se llama ANTES del UPDATE, en la misma transacción y
+    con las filas ya bloqueadas (select_for_update); los contadores se
+    suman al confirmarse (ver EstadisticaCupon.ajustar).
+    """
+    grupos = (
+        CuponPago.objects
+        .filter(id__in=list(cupon_ids))
+        .exclude(estado_cupon=estado_nuevo)
+        .annotate(mes=TruncMonth('fecha_generacion', output_field=DateField()))
+        .values('estado_cupon_id', 'pasarela_id', 'mes')
+        .annotate(cantidad=Count('id'))
+        .order_by()
+    )
+    deltas = {}
+    for grupo in grupos:
+        origen = (grupo['estado_cupon_id'], grupo['pasarela_id'], grupo['mes'])
+        destino = (estado_nuevo.id, grupo['pasarela_id'], grupo['mes'])
+        deltas[origen] = deltas.get(origen, 0) - grupo['cantidad']
+        deltas[destino] = deltas.get(destino, 0) + grupo['cantidad']
+    EstadisticaCupon.ajustar(deltas)
+
+
+def liquidar_cuotas(cupon_ids):
+    """
+    Aplica el pago de los cupones indicados a sus cuotas, en bloque (una
+    lectura y un bulk_update):
+    - Cupón completo: cancela el saldo y el recargo que el cupón cubría
+      (Cuota.liquidar). Si después se devengó más recargo, esa diferencia
+      sigue adeudada y la cuota no pasa a 'Pagada'.
+    - Cupón parcial: el monto del cupón cancela primero el recargo pendiente
+      y el resto se descuenta del saldo (Cuota.imputar_pago).
+    Las cuotas sin deuda pasan a 'Pagada'.
+    Lanza EstadoCuota.DoesNotExist si no existe el estado 'Pagada'.
+    Devuelve los ids de los alumnos afectados.
+    """
+    estado_pagada = catalogos.estado_cuota('Pagada')
+    detalles = CuponPagoCuota.objects.filter(cupon_pago_id__in=list(cupon_ids)).values_list(
+        'cuota_id', 'recargo_cuota', 'cupon_pago__es_pago_parcial', 'cupon_pago__monto_total', 'cupon_pago__alumno_id'
+    )
+
+    recargos_cubiertos = defaultdict(Decimal) # Cuotas de cupones completos
+    descuentos = defaultdict(Decimal)
+    alumnos = set()
+    for cuota_id, recargo_cuota, es_parcial, monto_total, alumno_id in detalles:
+        alumnos.add(alumno_id)
+        if es_parcial:
+            descuentos[cuota_id] += monto_total
+        else:
+            recargos_cubiertos[cuota_id] += recargo_cuota
+
+    cuotas = list(
+        Cuota.objects.filter(id__in=set(descuentos) | set(recargos_cubiertos))
+        .only('id', 'monto', 'saldo_pendiente', 'recargo', 'recargo_pagado', 'estado_cuota')
+    )
+    for cuota in cuotas:
+        if cuota.id in recargos_cubiertos:
+            # Si la cuota también se pagó completa en este lote, el parcial no se aplica
+            cancelada = cuota.liquidar(recargos_cubiertos[cuota.id])
+        else:
+            cancelada = cuota.imputar_pago(descuentos[cuota.id])
+        if cancelada:
+            cuota.estado_cuota = estado_pagada
+    Cuota.objects.bulk_update(cuotas, ['saldo_pendiente', 'recargo_pagado', 'estado_cuota'], batch_size=500)
+
+    invalidar_cuotas_pendientes(*alumnos)
+    return alumnos
+
+
+def anular_cupones_superpuestos(cupon_ids):
+    """
+    Antes de pagar cupones que ya no estaban Activos (p. ej. uno Expirado que
+    la pasarela igual cobró): sus cuotas pueden estar reclamadas por otro
+    cupón Activo del alumno. Ese cupón se anula en la misma transacción para
+    que las mismas cuotas no se cobren dos veces.
+    Devuelve {cupon_id: [ids de los cupones que se anularon por él]}.
+    """
+    cupon_ids = list(cupon_ids)
+    pares = set(
+        CuponPagoCuota.objects
+        .filter(cupon_pago_id__in=cupon_ids, cuota__cupon_activo__isnull=False)
+        .exclude(cuota__cupon_activo_id__in=cupon_ids)
+        .values_list('cupon_pago_id', 'cuota__cupon_activo_id')
+    )
+    if not pares:
+        return {}
+
+    resultados = cambiar_estado_cupones(
+        {activo_id for _, activo_id in pares}, catalogos.estado_cupon('Anulado'),
+        motivo='Sus cuotas se pagaron con otro cupón.'
+    )
+    anulados = defaultdict(list)
+    for cupon_id, activo_id in sorted(pares):
+        if resultados[activo_id][0] == 'actualizado':
+            anulados[cupon_id].append(activo_id)
+    return dict(anulados)
+
+
+def cambiar_estado_cupones(cupon_ids, estado_nuevo, motivo=None):
+    """
+    Cambia varios cupones a 'estado_nuevo' (Pagado, Anulado o Expirado) con
+    operaciones por conjunto. Debe llamarse dentro de transaction.atomic().
+
+    Bloquea los cupones, valida cada uno según ESTADOS_ORIGEN_PERMITIDOS,
+    mueve las estadísticas, actualiza los estados con un solo UPDATE, libera
+    las cuotas y, si el destino es Pagado, anula los otros cupones activos
+    que cubrían esas cuotas (ver anular_cupones_superpuestos) y las liquida.
+
+    Devuelve un dict {id: (resultado, detalle)} con resultado en
+    'actualizado', 'sin_cambios', 'conflicto' o 'no_encontrado'.
+    """
+    cupon_ids = list(dict.fromkeys(cupon_ids))
+    cupones = {
+        c['id']: c for c in CuponPago.objects.select_for_update().filter(id__in=cupon_ids).values('id', 'estado_cupon_id')
+    }
+    permitidos = {
+        e.id for e in catalogos.estados_cupon()
+        if e.nombre in ESTADOS_ORIGEN_PERMITIDOS.get(estado_nuevo.nombre, ())
+    }
+
+    resultados = {}
+    a_cambiar = []
+    for cupon_id in cupon_ids:
+        cupon = cupones.get(cupon_id)
+        if cupon is None:
+            resultados[cupon_id] = ('no_encontrado', 'El cupón no existe.')
+        elif cupon['estado_cupon_id'] == estado_nuevo.id:
+            resultados[cupon_id] = ('sin_cambios', f"El cupón ya está en estado '{estado_nuevo.nombre}'.")
+        elif cupon['estado_cupon_id'] not in permitidos:
+            estado_actual = catalogos.estado_cupon_por_id(cupon['estado_cupon_id']).nombre
+            resultados[cupon_id] = ('conflicto', f"No se puede pasar un cupón '{estado_actual}' a '{estado_nuevo.nombre}'.")
+        else:
+            resultados[cupon_id] = ('actualizado', None)
+            a_cambiar.append(cupon_id)
+
+    if not a_cambiar:
+        return resultados
+
+    ajustar_estadisticas_por_cambio(a_cambiar, estado_nuevo)
+    campos = {'estado_cupon': estado_nuevo}
+    if motivo is not None:
+        campos['motivo_anulacion'] = motivo
+    CuponPago.objects.filter(id__in=a_cambiar).update(**campos)
+    if estado_nuevo.nombre == 'Pagado':
+        for cupon_id, anulados in anular_cupones_superpuestos(a_cambiar).items():
+            resultados[cupon_id] = ('actualizado', f"Se anuló el cupón activo {', '.join(map(str, anulados))}, que cubría las mismas cuotas.")
+    liberar_cuotas(a_cambiar)
+    if estado_nuevo.nombre == 'Pagado':
+        liquidar_cuotas(a_cambiar)
+    return resultados
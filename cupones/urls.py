@@ -6,14 +6,25 @@ from .views import (
     HistorialCuponesAPI,
     AnularCuponAlumnoAPI,
     AdminGestionCuponesAPI,
+    AdminEstadisticasCuponesAPI,
+    AdminOpcionesEstadoCuponAPI,
+    AdminExportarCuponesCSV,
+    AdminExportarCuotasCSV,
+    AdminExportarCuponesPDF,
+    AdminEstadisticasCacheAPI,
     AnularCuponAdminAPI,
     EstadoCuponViewSet,
     PasarelaPagoViewSet,
     PasarelasDisponiblesAPI,
     AdminUpdateCuponEstadoAPI,
+    AdminCambioEstadoMasivoAPI,
+    AdminConciliacionAPI,
+    AdminEmitirCuotasAPI,
+    WebhookPasarelaAPI,
     DescargarCuponPDF,
     RegistrarPagoParcialAPI
 )
+from .ListAPIView import SystemLogListAPI
 
 # --- CONFIGURACIÓN DEL ROUTER ---
 # 1. Crea un router
@@ -35,12 +46,25 @@ urlpatterns = [
     path('pasarelas/', PasarelasDisponiblesAPI.as_view(), name='api_pasarelas_disponibles'),
     path('cuota/<int:pk>/pagar/', RegistrarPagoParcialAPI.as_view(), name='api_pago_parcial'),
 
+    # --- Notificaciones de las pasarelas (webhooks) ---
+    path('webhooks/<int:pasarela_id>/', WebhookPasarelaAPI.as_view(), name='api_webhook_pasarela'),
+
     # --- 2. AÑADE LA NUEVA RUTA DE DESCARGA ---
     path('cupon/<int:pk>/descargar/', DescargarCuponPDF.as_view(), name='api_descargar_cupon'),
 
     # --- Rutas de Administrador (manuales) ---
     path('admin/gestion/', AdminGestionCuponesAPI.as_view(), name='api_admin_gestion_cupones'),
+    path('admin/gestion/estadisticas/', AdminEstadisticasCuponesAPI.as_view(), name='api_admin_estadisticas_cupones'),
+    path('admin/gestion/opciones-estado/', AdminOpcionesEstadoCuponAPI.as_view(), name='api_admin_opciones_estado'),
+    path('admin/exportar/cupones/', AdminExportarCuponesCSV.as_view(), name='api_admin_exportar_cupones'),
+    path('admin/exportar/cuotas/', AdminExportarCuotasCSV.as_view(), name='api_admin_exportar_cuotas'),
+    path('admin/exportar/cupones-pdf/', AdminExportarCuponesPDF.as_view(), name='api_admin_exportar_cupones_pdf'),
+    path('admin/cache/cuotas-pendientes/', AdminEstadisticasCacheAPI.as_view(), name='api_admin_cache_cuotas'),
     path('admin/anular/<int:pk>/', AnularCuponAdminAPI.as_view(), name='api_admin_anular_cupon'),
+    path('admin/cupones/estado/', AdminCambioEstadoMasivoAPI.as_view(), name='api_admin_cambio_estado_masivo'),
+    path('admin/logs/', SystemLogListAPI.as_view(), name='api_admin_logs'),
+    path('admin/conciliacion/', AdminConciliacionAPI.as_view(), name='api_admin_conciliacion'),
+    path('admin/cuotas/emitir/', AdminEmitirCuotasAPI.as_view(), name='api_admin_emitir_cuotas'),
     path('admin/cupon/<int:pk>/estado/', AdminUpdateCuponEstadoAPI.as_view(), name='api_admin_update_estado'
     ),
 ]
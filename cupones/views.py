@@ -1,7 +1,8 @@
-from django.http import HttpResponse # <-- Solo necesitas HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse, HttpResponseNotModified
 from django.shortcuts import redirect, get_object_or_404
 # --- IMPORTA TU NUEVO GENERADOR ---
 from .pdf_generator import generate_pago_facil_pdf
+from . import pdf_cache, pdf_worker
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -9,12 +10,19 @@ from rest_framework import status, viewsets
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from django.contrib.auth.models import User
 from django.db import IntegrityError 
-from django.db.models import Count, Q 
+from django.db.models import Sum
 from rest_framework import generics 
+from rest_framework.pagination import CursorPagination
+from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
+from django.utils.cache import patch_cache_control
 from .serializers import PasarelaPagoSimpleSerializer 
 import traceback
+import time
+import io
 from django.contrib.auth.tokens import default_token_generator
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.contrib.auth.hashers import make_password
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode, parse_etags, quote_etag
 from django.utils.encoding import force_bytes, force_str
 from django.core.mail import send_mail
 from django.conf import settings
@@ -22,7 +30,7 @@ from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
 
 # Importaciones de tus modelos y serializers
-from .models import Cuota, EstadoCuota, CuponPago, EstadoCupon, PasarelaPago, CuponPagoCuota, Perfil, PagoParcial
+from .models import Cuota, EstadoCuota, CuponPago, EstadoCupon, PasarelaPago, CuponPagoCuota, Perfil, PagoParcial, EstadisticaCupon
 from .serializers import (
     CuotaSerializer,
     GenerarCuponSerializer,
@@ -32,7 +40,28 @@ from .serializers import (
     EstadoCuponSerializer,       
     PasarelaPagoSerializer,
     EstadoCuponSimpleSerializer,
-    PagoParcialSerializer
+    PagoParcialSerializer,
+    CambioEstadoMasivoSerializer,
+    ConciliacionSerializer,
+    EmisionCuotasSerializer,
+    EstadisticasCuponesSerializer
+)
+from .catalogos import catalogos
+from . import idempotencia
+from .filters import CuponPagoAdminFilter, CuotaAdminFilter
+from .exportaciones import generar_csv, COLUMNAS_CUPONES, COLUMNAS_CUOTAS
+from . import exportacion_pdf
+from .conciliacion import ReporteEnMemoria, conciliar, leer_archivo
+from .webhooks import EventoInvalido, firma_valida, registrar_evento
+from .emision import armar_plan, emitir_cuotas
+from .bloqueos import bloqueo_tarea, TareaEnCurso
+from .logging_utils import create_log
+from .transiciones import reclamar_cuotas, liquidar_cuotas, cambiar_estado_cupones, anular_cupones_superpuestos
+from .cache_utils import (
+    obtener_cuotas_pendientes,
+    guardar_cuotas_pendientes,
+    invalidar_cuotas_pendientes,
+    estadisticas_cache_cuotas_pendientes
 )
 
 # Otras importaciones de Python/Django
@@ -48,11 +77,14 @@ class ListaCuotasPendientesAPI(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
+        # Si el payload del alumno ya está en caché, se evita todo el trabajo
+        data_cacheada = obtener_cuotas_pendientes(request.user.id)
+        if data_cacheada is not None:
+            return Response(data_cacheada, status=status.HTTP_200_OK)
+
         try:
-            estados_pendientes = EstadoCuota.objects.filter(
-                nombre__in=['Pendiente', 'Vencida']
-            )
-            if not estados_pendientes.exists():
+            estados_pendientes = catalogos.estados_cuota('Pendiente', 'Vencida')
+            if not estados_pendientes:
                 return Response({"error": "Estados 'Pendiente' o 'Vencida' no encontrados."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Exception as e:
             return Response({"error": f"Error al buscar estados: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -61,7 +93,7 @@ class ListaCuotasPendientesAPI(APIView):
             cuotas = Cuota.objects.filter(
                 alumno=request.user,
                 estado_cuota__in=estados_pendientes
-            ).order_by('fecha_vencimiento')
+            ).select_related('estado_cuota').order_by('fecha_vencimiento')
         except Exception as e:
             return Response({"error": f"Error al buscar cuotas: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -70,6 +102,7 @@ class ListaCuotasPendientesAPI(APIView):
         except Exception as e:
             return Response({"error": f"Error al serializar cuotas: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        guardar_cuotas_pendientes(request.user.id, serializer.data)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
@@ -77,24 +110,67 @@ class GenerarCuponAPI(APIView):
     """ API para generar un nuevo cupón de pago. """
     permission_classes = [IsAuthenticated]
 
-    @transaction.atomic
     def post(self, request):
         serializer_in = GenerarCuponSerializer(data=request.data)
         if not serializer_in.is_valid():
             return Response(serializer_in.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        cuotas_ids = serializer_in.validated_data['cuotas_ids']
         idempotency_key = serializer_in.validated_data['idempotency_key']
-        pasarela_id = serializer_in.validated_data['pasarela_id']
-        monto_parcial = serializer_in.validated_data.get('monto_parcial', None)
+
+        # 1. Lógica de Idempotencia
+        # 1.a. La misma clave ya se procesó: se devuelve el cupón original
+        respuesta_previa = self._respuesta_previa(idempotency_key)
+        if respuesta_previa:
+            return respuesta_previa
+
+        # 1.b. Reserva de la clave: si otra request igual está en curso,
+        # se espera a que termine y se reutiliza su respuesta.
+        limite = time.monotonic() + getattr(settings, 'IDEMPOTENCIA_ESPERA_MAXIMA', 5)
+        while not idempotencia.reservar(idempotency_key):
+            guardada = idempotencia.esperar_respuesta(idempotency_key, timeout=max(limite - time.monotonic(), 0))
+            if guardada is not None:
+                return Response(guardada[1], status=status.HTTP_200_OK)
+            respuesta_previa = self._respuesta_previa(idempotency_key)
+            if respuesta_previa:
+                return respuesta_previa
+            if time.monotonic() >= limite:
+                return Response(
+                    {"error": "Ya hay una solicitud en curso con esta idempotency_key. Intenta nuevamente."},
+                    status=status.HTTP_409_CONFLICT
+                )
 
         try:
-            # 1. Lógica de Idempotencia (sin cambios)
-            cupon_existente = CuponPago.objects.filter(idempotency_key=idempotency_key).first()
-            if cupon_existente:
-                serializer_out = CuponPagoGeneradoSerializer(cupon_existente)
-                return Response(serializer_out.data, status=status.HTTP_200_OK)
+            respuesta = self._generar(request, serializer_in.validated_data)
+            if respuesta.status_code == status.HTTP_201_CREATED:
+                # Se guarda antes de liberar la reserva, así quien espera la encuentra
+                idempotencia.guardar_respuesta(idempotency_key, respuesta.status_code, respuesta.data)
+        except IntegrityError:
+            # Otro worker (sin caché compartida) creó el cupón con la misma
+            # clave entre nuestra verificación y el INSERT.
+            respuesta = self._respuesta_previa(idempotency_key)
+            if respuesta is None:
+                print(traceback.format_exc())
+                respuesta = Response({"error": "Error de integridad al generar el cupón."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        finally:
+            idempotencia.liberar(idempotency_key)
+        return respuesta
+
+    def _respuesta_previa(self, idempotency_key):
+        """ Si ya existe un cupón con esta clave, devuelve la respuesta para repetirla. """
+        cupon_existente = CuponPago.objects.select_related('pasarela').filter(idempotency_key=idempotency_key).first()
+        if cupon_existente:
+            serializer_out = CuponPagoGeneradoSerializer(cupon_existente)
+            return Response(serializer_out.data, status=status.HTTP_200_OK)
+        return None
+
+    @transaction.atomic
+    def _generar(self, request, datos):
+        cuotas_ids = datos['cuotas_ids']
+        idempotency_key = datos['idempotency_key']
+        pasarela_id = datos['pasarela_id']
+        monto_parcial = datos.get('monto_parcial', None)
 
+        try:
             cuotas_a_pagar = Cuota.objects.filter(
                 id__in=cuotas_ids,
                 alumno=request.user
@@ -103,16 +179,15 @@ class GenerarCuponAPI(APIView):
             if len(cuotas_a_pagar) != len(cuotas_ids):
                 return Response({"error": "Una o más cuotas no se encontraron o no pertenecen a este usuario."}, status=status.HTTP_404_NOT_FOUND)
 
-            estado_activo = EstadoCupon.objects.get(nombre="Activo")
-            pasarela_obj = get_object_or_404(PasarelaPago, id=pasarela_id)
+            estado_activo = catalogos.estado_cupon("Activo")
+            pasarela_obj = catalogos.pasarela_por_id(pasarela_id)
 
-            # 2. Lógica de Cupón Activo Existente (sin cambios)
-            cupon_existente_activo = CuponPago.objects.filter(
-                estado_cupon=estado_activo,
-                cuotas_incluidas__in=cuotas_a_pagar
-            ).distinct().first()
+            # 2. Lógica de Cupón Activo Existente
+            # Cada cuota ya trae el id de su cupón activo (Cuota.cupon_activo)
+            cuota_ocupada = next((c for c in cuotas_a_pagar if c.cupon_activo_id), None)
 
-            if cupon_existente_activo:
+            if cuota_ocupada:
+                cupon_existente_activo = CuponPago.objects.select_related('pasarela').get(pk=cuota_ocupada.cupon_activo_id)
                 serializer_out = CuponPagoGeneradoSerializer(cupon_existente_activo)
                 return Response(
                     {
@@ -123,11 +198,9 @@ class GenerarCuponAPI(APIView):
                 )
 
             # 3. Creación del Cupón - Ahora con soporte para pago parcial
-            # Usar saldo_pendiente si existe, sino usar monto original
-            saldo_total_cuotas = sum(
-                cuota.saldo_pendiente if cuota.saldo_pendiente is not None else cuota.monto 
-                for cuota in cuotas_a_pagar
-            )
+            # Usar saldo_pendiente si existe, sino usar monto original,
+            # más el recargo por mora todavía no cobrado (Cuota.total_adeudado)
+            saldo_total_cuotas = sum(cuota.total_adeudado for cuota in cuotas_a_pagar)
             
             # Determinar el monto final del cupón
             es_parcial = False
@@ -152,16 +225,34 @@ class GenerarCuponAPI(APIView):
                 idempotency_key=idempotency_key,
                 es_pago_parcial=es_parcial
             )
-            
-            nuevo_cupon.url_pdf = f'/cupones/cupon/{nuevo_cupon.id}/descargar/'
-            nuevo_cupon.save(update_fields=['url_pdf'])
+            # url_pdf no se guarda: los serializers la derivan del id (ver CuponPago.get_url_pdf)
 
-            for cuota in cuotas_a_pagar:
-                CuponPagoCuota.objects.create(
+            # Un solo INSERT para todos los detalles, sin importar cuántas cuotas sean.
+            # bulk_create no dispara señales, así que la caché se invalida a mano.
+            CuponPagoCuota.objects.bulk_create([
+                CuponPagoCuota(
                     cupon_pago=nuevo_cupon,
                     cuota=cuota,
-                    monto_cuota=cuota.monto
+                    monto_cuota=cuota.monto,
+                    recargo_cuota=cuota.recargo_pendiente
                 )
+                for cuota in cuotas_a_pagar
+            ])
+            invalidar_cuotas_pendientes(request.user.id)
+
+            # Reclama las cuotas para este cupón. Si otra request se adelantó
+            # con alguna, se deshace todo.
+            if not reclamar_cuotas(nuevo_cupon, cuotas_ids):
+                transaction.set_rollback(True)
+                return Response(
+                    {"error": "Ya existe un cupón activo para una o más de estas cuotas."},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+            # El PDF se dibuja en segundo plano apenas se confirma la
+            # transacción, así la primera descarga ya lo encuentra hecho.
+            if pasarela_obj.nombre.lower() == 'pago fácil':
+                transaction.on_commit(lambda: pdf_worker.encolar(nuevo_cupon.id))
 
             serializer_out = CuponPagoGeneradoSerializer(nuevo_cupon)
             return Response(serializer_out.data, status=status.HTTP_201_CREATED)
@@ -170,22 +261,40 @@ class GenerarCuponAPI(APIView):
             return Response({"error": "Estado 'Activo' no configurado en BD."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except PasarelaPago.DoesNotExist:
              return Response({"error": "La pasarela seleccionada no existe."}, status=status.HTTP_404_NOT_FOUND)
+        except IntegrityError:
+            # Lo resuelve post(): probablemente la idempotency_key ya se usó
+            raise
         except Exception as e:
             print(traceback.format_exc())
             return Response({"error": f"Error inesperado en el servidor: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class HistorialCuponesAPI(APIView):
-    """ API para el historial de cupones del alumno. """
+class HistorialCursorPagination(CursorPagination):
+    """
+    Paginación por cursor sobre (fecha_generacion, id): cada página es una
+    búsqueda por índice desde la última fila vista, sin OFFSET ni COUNT(*).
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-fecha_generacion', '-id')
+
+
+class HistorialCuponesAPI(generics.ListAPIView):
+    """ API para el historial de cupones del alumno (paginado por cursor). """
     permission_classes = [IsAuthenticated]
+    serializer_class = CuponPagoListSerializer
+    pagination_class = HistorialCursorPagination
 
-    def get(self, request):
+    def get_queryset(self):
+        # Trae todas las relaciones que usa el serializer en la misma consulta
+        return CuponPago.objects.filter(
+            alumno=self.request.user
+        ).select_related('estado_cupon', 'pasarela', 'alumno__perfil')
+
+    def list(self, request, *args, **kwargs):
         try:
-            cupones = CuponPago.objects.filter(
-                alumno=request.user
-            ).order_by('-fecha_generacion')
-            serializer = CuponPagoListSerializer(cupones, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return super().list(request, *args, **kwargs)
         except Exception as e:
             print(traceback.format_exc())
             return Response({"error": f"Error inesperado al buscar historial: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -200,8 +309,8 @@ class AnularCuponAlumnoAPI(APIView):
     def patch(self, request, pk): # 'pk' es el ID del cupón a anular
         try:
             # 1. Obtenemos todos los objetos necesarios primero
-            estado_anulado = EstadoCupon.objects.get(nombre='Anulado')
-            estado_activo = EstadoCupon.objects.get(nombre='Activo')
+            estado_anulado = catalogos.estado_cupon('Anulado')
+            estado_activo = catalogos.estado_cupon('Activo')
             
             # Usamos .get(pk=pk) para poder capturar el error si no existe
             cupon = CuponPago.objects.select_related('estado_cupon').get(pk=pk)
@@ -233,7 +342,7 @@ class AnularCuponAlumnoAPI(APIView):
             # 5. Ejecutar la anulación
             cupon.estado_cupon = estado_anulado
             cupon.motivo_anulacion = "Anulado por el alumno." # Motivo automático
-            cupon.save()
+            cupon.save() # Libera sus cuotas (ver señales de CuponPago)
             
             # 6. Devolver éxito
             # 204 No Content es la respuesta estándar para un PATCH/DELETE exitoso
@@ -251,46 +360,187 @@ class MyTokenObtainPairView(TokenObtainPairView):
 
 # --- VISTAS DE ADMINISTRADOR ---
 
-class AdminGestionCuponesAPI(APIView):
-    """ API para la gestión de cobranzas (Admin) """
+class AdminCuponesCursorPagination(CursorPagination):
+    """ Paginación por cursor para la gestión de cupones (Admin). """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('-fecha_generacion', '-id')
+
+
+class AdminGestionCuponesAPI(generics.ListAPIView):
+    """
+    API para la gestión de cobranzas (Admin).
+    Lista paginada y filtrable de cupones (ver CuponPagoAdminFilter).
+    Las estadísticas y las opciones de estado tienen sus propias APIs.
+    """
+    permission_classes = [IsAdminUser]
+    serializer_class = CuponPagoListSerializer
+    pagination_class = AdminCuponesCursorPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = CuponPagoAdminFilter
+
+    def get_queryset(self):
+        return CuponPago.objects.select_related(
+            'alumno__perfil', 'pasarela', 'estado_cupon'
+        )
+
+    def list(self, request, *args, **kwargs):
+        try:
+            return super().list(request, *args, **kwargs)
+        except Exception as e:
+            print(traceback.format_exc())
+            return Response({"error": f"Error inesperado al buscar cupones: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AdminEstadisticasCuponesAPI(APIView):
+    """
+    API con las estadísticas de cupones por estado (Admin).
+    Lee los contadores de EstadisticaCupon (unas pocas filas), no la tabla de cupones.
+    Acepta ?pasarela=<id> y ?mes=AAAA-MM para acotar.
+    """
     permission_classes = [IsAdminUser]
 
     def get(self, request):
-            try:
-                # Cálculo de estadísticas (como antes)
-                estadisticas = CuponPago.objects.aggregate(
-                    total=Count('id'),
-                    activos=Count('id', filter=Q(estado_cupon__nombre='Activo')),
-                    pagados=Count('id', filter=Q(estado_cupon__nombre='Pagado')),
-                    vencidos=Count('id', filter=Q(estado_cupon__nombre='Vencido')),
-                    anulados=Count('id', filter=Q(estado_cupon__nombre='Anulado'))
-                )
-                
-                # Búsqueda de cupones (como antes)
-                cupones = CuponPago.objects.select_related(
-                    'alumno__perfil', 'pasarela', 'estado_cupon'
-                ).order_by('-fecha_generacion')
-                
-                # --- NUEVO: Obtener todas las opciones de estado ---
-                opciones_estado_objs = EstadoCupon.objects.all()
-                opciones_estado_serializer = EstadoCuponSimpleSerializer(opciones_estado_objs, many=True)
-                # --- FIN NUEVO ---
+        # Los parámetros vacíos se ignoran, como en los filtros del listado
+        filtros = EstadisticasCuponesSerializer(data={k: v for k, v in request.query_params.items() if v})
+        if not filtros.is_valid():
+            return Response(filtros.errors, status=status.HTTP_400_BAD_REQUEST)
 
-                # Prepara la respuesta de la lista
-                cupones_serializer = CuponPagoListSerializer(cupones, many=True)
-                
-                # Combina todo en la respuesta
-                respuesta_data = {
-                    'estadisticas': estadisticas,
-                    'cupones': cupones_serializer.data,
-                    'opciones_estado': opciones_estado_serializer.data # <-- AÑADIDO
-                }
-                
-                return Response(respuesta_data, status=status.HTTP_200_OK)
+        try:
+            contadores = EstadisticaCupon.objects.all()
+            if 'pasarela' in filtros.validated_data:
+                contadores = contadores.filter(pasarela_id=filtros.validated_data['pasarela'])
+            if 'mes' in filtros.validated_data:
+                contadores = contadores.filter(mes=filtros.validated_data['mes'])
+
+            por_estado = {}
+            for fila in contadores.values('estado_cupon_id').annotate(cantidad=Sum('cantidad')).order_by():
+                nombre = catalogos.estado_cupon_por_id(fila['estado_cupon_id']).nombre
+                por_estado[nombre] = fila['cantidad']
+
+            estadisticas = {
+                'total': sum(por_estado.values()),
+                'activos': por_estado.get('Activo', 0),
+                'pagados': por_estado.get('Pagado', 0),
+                'vencidos': por_estado.get('Vencido', 0) + por_estado.get('Expirado', 0),
+                'anulados': por_estado.get('Anulado', 0),
+                'por_estado': por_estado,
+            }
+            response = Response(estadisticas, status=status.HTTP_200_OK)
+            patch_cache_control(response, private=True, max_age=60)
+            return response
+        except Exception as e:
+            print(traceback.format_exc())
+            return Response({"error": f"Error inesperado al calcular estadísticas: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            except Exception as e:
-                print(traceback.format_exc())
-                return Response({"error": f"Error inesperado al buscar cupones: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class AdminOpcionesEstadoCuponAPI(APIView):
+    """ API con las opciones de estado de cupón para los filtros y selects (Admin). """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        serializer = EstadoCuponSimpleSerializer(catalogos.estados_cupon(), many=True)
+        response = Response(serializer.data, status=status.HTTP_200_OK)
+        patch_cache_control(response, private=True, max_age=300)
+        return response
+
+
+class AdminExportarCuponesCSV(APIView):
+    """
+    Exporta los cupones a CSV para la oficina de finanzas (Admin).
+    Acepta los mismos filtros que AdminGestionCuponesAPI y devuelve el
+    archivo en streaming, leyendo la tabla por lotes (memoria constante).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        filtro = CuponPagoAdminFilter(request.query_params, queryset=CuponPago.objects.all())
+        if not filtro.is_valid():
+            return Response(translate_validation(filtro.errors).detail, status=status.HTTP_400_BAD_REQUEST)
+
+        filename = f"cupones_{timezone.now():%Y%m%d_%H%M}.csv"
+        return StreamingHttpResponse(
+            generar_csv(filtro.qs, COLUMNAS_CUPONES),
+            content_type='text/csv; charset=utf-8',
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+
+
+class AdminExportarCuotasCSV(APIView):
+    """
+    Exporta las cuotas a CSV (Admin), con los filtros de CuotaAdminFilter.
+    Igual que la exportación de cupones: streaming y lectura por lotes.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        filtro = CuotaAdminFilter(request.query_params, queryset=Cuota.objects.all())
+        if not filtro.is_valid():
+            return Response(translate_validation(filtro.errors).detail, status=status.HTTP_400_BAD_REQUEST)
+
+        filename = f"cuotas_{timezone.now():%Y%m%d_%H%M}.csv"
+        return StreamingHttpResponse(
+            generar_csv(filtro.qs, COLUMNAS_CUOTAS),
+            content_type='text/csv; charset=utf-8',
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+
+
+class AdminExportarCuponesPDF(APIView):
+    """
+    Exporta de una vez los PDF de muchos cupones de Pago Fácil (Admin), por
+    ejemplo todos los activos de una carrera (?estado=<id>&carrera=...).
+    Acepta los filtros de CuponPagoAdminFilter y ?formato=zip (por defecto,
+    un PDF por cupón) o ?formato=pdf (un único PDF, una página por cupón).
+    Los PDF se dibujan en paralelo en el pool de procesos compartido y la
+    respuesta sale en streaming (ver exportacion_pdf.py).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        filtro = CuponPagoAdminFilter(request.query_params, queryset=CuponPago.objects.all())
+        if not filtro.is_valid():
+            return Response(translate_validation(filtro.errors).detail, status=status.HTTP_400_BAD_REQUEST)
+
+        formato = request.query_params.get('formato', 'zip')
+        if formato not in exportacion_pdf.FORMATOS:
+            return Response({"error": "El formato debe ser 'zip' o 'pdf'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            cupones = exportacion_pdf.cupones_pago_facil(filtro.qs)
+            if not cupones.exists():
+                return Response({"error": "No hay cupones de Pago Fácil con esos filtros."}, status=status.HTTP_404_NOT_FOUND)
+            if formato == 'pdf':
+                cantidad = cupones.count()
+                if cantidad > settings.PDF_LOTE_MAX_PAGINAS:
+                    return Response(
+                        {"error": f"Son {cantidad} cupones y el PDF único admite hasta {settings.PDF_LOTE_MAX_PAGINAS}. Usa formato=zip."},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+            # El primer lote se dibuja antes de responder: si falla, todavía
+            # se puede devolver un error en lugar de un archivo cortado
+            contenido = exportacion_pdf.iniciar(cupones, formato)
+        except exportacion_pdf.ExportacionFallida as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except Exception as e:
+            print(traceback.format_exc())
+            return Response({"error": f"Error inesperado en el servidor: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        filename = f"cupones_{timezone.now():%Y%m%d_%H%M}.{formato}"
+        return StreamingHttpResponse(
+            contenido,
+            content_type='application/zip' if formato == 'zip' else 'application/pdf',
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+
+
+class AdminEstadisticasCacheAPI(APIView):
+    """ API para consultar los hits/misses de la caché de cuotas pendientes (Admin) """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(estadisticas_cache_cuotas_pendientes(), status=status.HTTP_200_OK)
 
 
 class AnularCuponAdminAPI(APIView):
@@ -311,21 +561,43 @@ class AnularCuponAdminAPI(APIView):
             return Response({"mensaje": "Este cupón ya se encuentra anulado."}, status=status.HTTP_200_OK)
         
         try:
-            estado_anulado = EstadoCupon.objects.get(nombre='Anulado')
+            estado_anulado = catalogos.estado_cupon('Anulado')
             cupon.estado_cupon = estado_anulado
             cupon.motivo_anulacion = motivo
-            cupon.save()
+            cupon.save() # Libera sus cuotas (ver señales de CuponPago)
+            # El registro se escribe solo si la anulación se confirma
+            detalle = f"Cupón {cupon.id}: {motivo}"
+            transaction.on_commit(lambda: create_log(request.user, 'cupon_anulado', detalle))
             serializer = CuponPagoListSerializer(cupon)
             return Response(serializer.data, status=status.HTTP_200_OK)
         except EstadoCupon.DoesNotExist:
             return Response({"error": "El estado 'Anulado' no está configurado en la base de datos."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Exception as e:
             print(traceback.format_exc())
+            transaction.set_rollback(True)
             return Response({"error": f"Error inesperado al anular el cupón: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class CatalogoVersionadoMixin:
+    """
+    Para los ViewSets de catálogos: después de cada escritura incrementa la
+    versión de los catálogos, así todos los workers recargan su copia.
+    """
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        catalogos.invalidar()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        catalogos.invalidar()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        catalogos.invalidar()
+
+
 # --- VIEWSET PARA CRUD DE ESTADO CUPÓN (CON MANEJO DE ERROR DE BORRADO) ---
-class EstadoCuponViewSet(viewsets.ModelViewSet):
+class EstadoCuponViewSet(CatalogoVersionadoMixin, viewsets.ModelViewSet):
     """
     ViewSet para CRUD de EstadoCupon.
     Maneja IntegrityError al eliminar.
@@ -338,7 +610,7 @@ class EstadoCuponViewSet(viewsets.ModelViewSet):
         instance = self.get_object() # Obtiene el objeto a eliminar
         try:
             # Intenta eliminar
-            instance.delete()
+            self.perform_destroy(instance)
             return Response(status=status.HTTP_204_NO_CONTENT)
         except IntegrityError:
             # ¡Atrapa el error si está en uso!
@@ -354,7 +626,7 @@ class EstadoCuponViewSet(viewsets.ModelViewSet):
             )
 # --- FIN VIEWSET ---
 
-class PasarelaPagoViewSet(viewsets.ModelViewSet):
+class PasarelaPagoViewSet(CatalogoVersionadoMixin, viewsets.ModelViewSet):
     """
     ViewSet para CRUD de PasarelaPago.
     Maneja IntegrityError al eliminar.
@@ -367,7 +639,7 @@ class PasarelaPagoViewSet(viewsets.ModelViewSet):
         instance = self.get_object() # Obtiene el objeto a eliminar
         try:
             # Intenta eliminar
-            instance.delete()
+            self.perform_destroy(instance)
             return Response(status=status.HTTP_204_NO_CONTENT)
         except IntegrityError:
             # ¡Atrapa el error si está en uso!
@@ -397,51 +669,205 @@ class AdminUpdateCuponEstadoAPI(APIView):
             if not nuevo_estado_id:
                 return Response({"error": "Falta 'estado_cupon_id'."}, status=status.HTTP_400_BAD_REQUEST)
 
-            nuevo_estado_cupon = get_object_or_404(EstadoCupon, id=nuevo_estado_id)
+            nuevo_estado_cupon = catalogos.estado_cupon_por_id(nuevo_estado_id)
             cupon = get_object_or_404(CuponPago.objects.prefetch_related('cuotas_incluidas'), pk=pk)
+            estado_anterior_id = cupon.estado_cupon_id
             
             cupon.estado_cupon = nuevo_estado_cupon
             cupon.save()
+
+            # Si deja de estar Activo, save() ya liberó sus cuotas (ver señales
+            # de CuponPago). Reactivación: solo si ninguna cuota tiene otro cupón activo
+            if nuevo_estado_cupon.nombre == 'Activo' and estado_anterior_id != nuevo_estado_cupon.id:
+                if not reclamar_cuotas(cupon, [c.id for c in cupon.cuotas_incluidas.all()]):
+                    transaction.set_rollback(True)
+                    return Response({"error": "Una o más cuotas de este cupón ya tienen otro cupón activo."}, status=status.HTTP_409_CONFLICT)
             
-            # Si el cupón se marca como "Pagado", actualizar las cuotas
+            # Si el cupón se marca como "Pagado", anular otro cupón activo sobre
+            # las mismas cuotas y actualizarlas (saldo y estado, en bloque: ver
+            # transiciones.anular_cupones_superpuestos y liquidar_cuotas)
             if nuevo_estado_cupon.nombre == 'Pagado':
                 try:
-                    estado_cuota_pagada = EstadoCuota.objects.get(nombre='Pagada')
-                    
-                    # Procesar cada cuota incluida en el cupón
-                    for cuota in cupon.cuotas_incluidas.all():
-                        # Inicializar saldo_pendiente si es None
-                        if cuota.saldo_pendiente is None:
-                            cuota.saldo_pendiente = cuota.monto
-                        
-                        if cupon.es_pago_parcial:
-                            # Es pago parcial: descontar monto del cupón del saldo
-                            cuota.saldo_pendiente = cuota.saldo_pendiente - cupon.monto_total
-                            
-                            # Si el saldo llega a 0 o menos, marcar como Pagada
-                            if cuota.saldo_pendiente <= 0:
-                                cuota.saldo_pendiente = 0
-                                cuota.estado_cuota = estado_cuota_pagada
-                            # Si aún queda saldo, no cambiar el estado (sigue Pendiente)
-                        else:
-                            # Pago completo: saldo = 0 y estado = Pagada
-                            cuota.saldo_pendiente = 0
-                            cuota.estado_cuota = estado_cuota_pagada
-                        
-                        cuota.save()
-
+                    anular_cupones_superpuestos([cupon.id])
+                    liquidar_cuotas([cupon.id])
                 except EstadoCuota.DoesNotExist:
+                    transaction.set_rollback(True)
                     return Response({"error": "El estado 'Pagada' no existe en la tabla EstadoCuota. No se pudo completar la operación."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
+            detalle = f"Cupón {cupon.id}: estado {estado_anterior_id} -> {nuevo_estado_cupon.nombre}"
+            transaction.on_commit(lambda: create_log(request.user, 'cupon_cambio_estado', detalle))
             serializer = CuponPagoListSerializer(cupon)
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         except (EstadoCupon.DoesNotExist, CuponPago.DoesNotExist):
+            transaction.set_rollback(True)
             return Response({"error": "El cupón o el estado no existen."}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            print(traceback.format_exc())
+            transaction.set_rollback(True)
+            return Response({"error": f"Error inesperado: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AdminCambioEstadoMasivoAPI(APIView):
+    """
+    API para que un admin cambie el estado de muchos cupones a la vez.
+    Recibe: {"cupon_ids": [1, 2, ...], "estado": "Pagado" | "Anulado" | "Expirado", "motivo": "..."}
+    Todo se aplica en una transacción, con UPDATEs por conjunto.
+    Devuelve el resultado de cada ID.
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer_in = CambioEstadoMasivoSerializer(data=request.data)
+        if not serializer_in.is_valid():
+            return Response(serializer_in.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        cupon_ids = serializer_in.validated_data['cupon_ids']
+        motivo = serializer_in.validated_data.get('motivo') or None
+
+        try:
+            estado_nuevo = catalogos.estado_cupon(serializer_in.validated_data['estado'])
+            with transaction.atomic():
+                resultados = cambiar_estado_cupones(cupon_ids, estado_nuevo, motivo=motivo)
+        except EstadoCupon.DoesNotExist:
+            return Response({"error": f"El estado '{serializer_in.validated_data['estado']}' no está configurado en la base de datos."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except EstadoCuota.DoesNotExist:
+            return Response({"error": "El estado 'Pagada' no existe en la tabla EstadoCuota. No se pudo completar la operación."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except Exception as e:
+            print(traceback.format_exc())
+            return Response({"error": f"Error inesperado: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        actualizados = [cupon_id for cupon_id, (resultado, _) in resultados.items() if resultado == 'actualizado']
+        if actualizados:
+            create_log(request.user, 'cupones_cambio_estado_masivo', f"{estado_nuevo.nombre}: {len(actualizados)} cupones ({', '.join(map(str, actualizados[:50]))})")
+        return Response({
+            "actualizados": len(actualizados),
+            "resultados": [
+                {"id": cupon_id, "resultado": resultado, "detalle": detalle}
+                for cupon_id, (resultado, detalle) in resultados.items()
+            ]
+        }, status=status.HTTP_200_OK)
+
+
+class AdminConciliacionAPI(APIView):
+    """
+    API para subir el archivo de rendición diario de una pasarela (Admin).
+    Recibe (multipart): archivo, formato ('csv' | 'ancho-fijo'), pasarela (ID, opcional)
+    y delimitador. El archivo se lee en streaming y se concilia por lotes:
+    los cupones cobrados pasan a 'Pagado' y sus cuotas se liquidan.
+    Devuelve el resumen por resultado y las diferencias encontradas.
+    Para archivos muy grandes conviene el comando 'conciliar_pagos'.
+    """
+    permission_classes = [IsAdminUser]
+    MAX_DIFERENCIAS = 1000
+
+    def post(self, request):
+        serializer_in = ConciliacionSerializer(data=request.data)
+        if not serializer_in.is_valid():
+            return Response(serializer_in.errors, status=status.HTTP_400_BAD_REQUEST)
+        datos = serializer_in.validated_data
+
+        try:
+            pasarela = catalogos.pasarela_por_id(datos['pasarela']) if datos.get('pasarela') else None
+            reporte = ReporteEnMemoria(self.MAX_DIFERENCIAS)
+            lineas = io.TextIOWrapper(datos['archivo'].file, encoding='utf-8-sig', newline='')
+            filas = leer_archivo(lineas, datos['formato'], delimitador=datos['delimitador'])
+            resumen = conciliar(filas, pasarela=pasarela, escritor_reporte=reporte)
+        except PasarelaPago.DoesNotExist:
+            return Response({"error": "Pasarela no encontrada."}, status=status.HTTP_404_NOT_FOUND)
+        except EstadoCupon.DoesNotExist:
+            return Response({"error": "El estado 'Pagado' no está configurado en la base de datos."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except EstadoCuota.DoesNotExist:
+            return Response({"error": "El estado 'Pagada' no existe en la tabla EstadoCuota. No se pudo completar la operación."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except UnicodeDecodeError:
+            return Response({"error": "El archivo no está codificado en UTF-8."}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             print(traceback.format_exc())
             return Response({"error": f"Error inesperado: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        create_log(request.user, 'conciliacion', f"{datos['archivo'].name}: {resumen['conciliado']} conciliados de {sum(resumen.values())} filas")
+        return Response({
+            "filas": sum(resumen.values()),
+            "conciliados": resumen['conciliado'],
+            "resumen": dict(resumen),
+            "diferencias": reporte.filas,
+            "diferencias_omitidas": reporte.omitidas
+        }, status=status.HTTP_200_OK)
+
+
+class AdminEmitirCuotasAPI(APIView):
+    """
+    API para emitir las cuotas de un plan a todos los alumnos de una carrera (Admin).
+    Recibe: {"carrera": "...", "periodo": "Período 2026-1", "cantidad_cuotas": 5,
+             "monto": 150000, "primer_vencimiento": "2026-03-10", "dry_run": false}
+    Las cuotas vencen mes a mes. Es idempotente: las que ya existen para
+    el mismo alumno y período no se vuelven a crear.
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer_in = EmisionCuotasSerializer(data=request.data)
+        if not serializer_in.is_valid():
+            return Response(serializer_in.errors, status=status.HTTP_400_BAD_REQUEST)
+        datos = serializer_in.validated_data
+
+        plan = armar_plan(datos['cantidad_cuotas'], datos['monto'], datos['primer_vencimiento'], datos['periodo'])
+        totales = {'alumnos': 0, 'creadas': 0, 'existentes': 0}
+        try:
+            with bloqueo_tarea('emitir_cuotas') as bloqueo:
+                for resumen in emitir_cuotas(plan, datos['carrera'], dry_run=datos['dry_run']):
+                    for clave, cantidad in resumen.items():
+                        totales[clave] += cantidad
+                    bloqueo.renovar()
+        except TareaEnCurso as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except EstadoCuota.DoesNotExist:
+            return Response({"error": "El estado 'Pendiente' no existe en la tabla EstadoCuota."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        except Exception as e:
+            print(traceback.format_exc())
+            return Response({"error": f"Error inesperado: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({
+            **totales,
+            "dry_run": datos['dry_run'],
+            "cuotas": [
+                {"periodo": periodo, "monto": monto, "fecha_vencimiento": vencimiento}
+                for periodo, monto, vencimiento in plan
+            ]
+        }, status=status.HTTP_200_OK if datos['dry_run'] else status.HTTP_201_CREATED)
+
+
+class WebhookPasarelaAPI(APIView):
+    """
+    Endpoint donde las pasarelas notifican los pagos (webhook).
+    Solo valida la firma HMAC (header X-Firma) y guarda el evento crudo en
+    la bandeja EventoPasarela; responde 202 enseguida. Los eventos repetidos
+    se descartan por (pasarela, evento_id). El comando
+    'procesar_eventos_pasarela' los aplica después.
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    def post(self, request, pasarela_id):
+        try:
+            pasarela = catalogos.pasarela_por_id(pasarela_id)
+        except PasarelaPago.DoesNotExist:
+            return Response({"error": "Pasarela no encontrada."}, status=status.HTTP_404_NOT_FOUND)
+
+        cuerpo = request.body
+        if not firma_valida(pasarela, cuerpo, request.headers.get('X-Firma')):
+            return Response({"error": "Firma inválida."}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            registrar_evento(pasarela, cuerpo)
+        except EventoInvalido as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            print(traceback.format_exc())
+            return Response({"error": f"Error inesperado: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({"recibido": True}, status=status.HTTP_202_ACCEPTED)
+
 
 class PasarelasDisponiblesAPI(generics.ListAPIView):
     """
@@ -481,14 +907,40 @@ class DescargarCuponPDF(APIView):
 
         # --- LÓGICA CONDICIONAL (MUCHO MÁS LIMPIA) ---
         if cupon.pasarela.nombre.lower() == 'pago fácil':
-            # 1. Es Pago Fácil: Llamar al generador
+            # 1. Es Pago Fácil: se sirve desde la caché en disco (ver pdf_cache.py)
+            # y solo se llama al generador si esta versión del cupón no está.
             try:
-                buffer = generate_pago_facil_pdf(cupon)
-                
-                filename = f"cupon_pago_{cupon.id}.pdf"
-                # 'inline' abre el PDF en el navegador
-                return HttpResponse(buffer, content_type='application/pdf', headers={'Content-Disposition': f'inline; filename="{filename}"'})
-            
+                version = pdf_cache.version_contenido(cupon)
+                etag = quote_etag(f"{cupon.id}-{version}")
+
+                # El navegador ya tiene esta misma versión. If-None-Match se
+                # compara en forma débil: un proxy puede devolver el ETag como W/"..."
+                etags = [e.removeprefix('W/') for e in parse_etags(request.headers.get('If-None-Match', ''))]
+                if etag in etags or '*' in etags:
+                    response = HttpResponseNotModified()
+                else:
+                    archivo = pdf_cache.abrir(cupon.id, version)
+                    # Si el worker lo está dibujando, se lo espera en vez de repetirlo
+                    if archivo is None and pdf_worker.esperar(cupon.id):
+                        archivo = pdf_cache.abrir(cupon.id, version)
+                    if archivo is None:
+                        buffer = generate_pago_facil_pdf(cupon)
+                        try:
+                            archivo = open(pdf_cache.guardar(cupon.id, version, buffer.getvalue()), 'rb')
+                        except OSError:
+                            # Caché no disponible (disco lleno, sin permisos): se entrega el PDF igual
+                            print(traceback.format_exc())
+                            buffer.seek(0)
+                            archivo = buffer
+
+                    filename = f"cupon_pago_{cupon.id}.pdf"
+                    # 'inline' abre el PDF en el navegador
+                    response = FileResponse(archivo, content_type='application/pdf', headers={'Content-Disposition': f'inline; filename="{filename}"'})
+
+                response['ETag'] = etag
+                patch_cache_control(response, private=True, max_age=settings.PDF_CACHE_MAX_AGE)
+                return response
+
             except Exception as e:
                 print(f"Error al generar PDF: {e}")
                 return HttpResponse(f"Error al generar el PDF: {e}", status=500)
@@ -523,14 +975,10 @@ class RegistrarPagoParcialAPI(APIView):
             
             monto_pago = serializer.validated_data['monto']
             
-            # 4. Inicializar saldo si es None
-            if cuota.saldo_pendiente is None:
-                cuota.saldo_pendiente = cuota.monto
-            
-            # 5. Validar monto
-            if monto_pago > cuota.saldo_pendiente:
+            # 4. Validar monto (la deuda incluye el recargo por mora no cobrado)
+            if monto_pago > cuota.total_adeudado:
                 return Response(
-                    {"error": f"El monto ({monto_pago}) excede el saldo pendiente ({cuota.saldo_pendiente})."},
+                    {"error": f"El monto ({monto_pago}) excede el saldo pendiente ({cuota.total_adeudado})."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
@@ -541,18 +989,18 @@ class RegistrarPagoParcialAPI(APIView):
                 medio_pago="Macro Click"
             )
             
-            # 7. Actualizar saldo
-            cuota.saldo_pendiente = cuota.saldo_pendiente - monto_pago
+            # 7. Actualizar saldo: el pago cancela primero el recargo pendiente
+            cancelada = cuota.imputar_pago(monto_pago)
             
-            # 8. Si saldo = 0, cambiar estado a Pagada
-            if cuota.saldo_pendiente <= 0:
+            # 8. Si no queda deuda, cambiar estado a Pagada
+            if cancelada:
                 try:
-                    estado_pagada = EstadoCuota.objects.get(nombre='Pagada')
+                    estado_pagada = catalogos.estado_cuota('Pagada')
                     cuota.estado_cuota = estado_pagada
                 except EstadoCuota.DoesNotExist:
                     pass  # Si no existe el estado, solo actualizamos el saldo
             
-            cuota.save()
+            cuota.save(update_fields=['saldo_pendiente', 'recargo_pagado', 'estado_cuota'])
             
             # 9. Retornar cuota actualizada
             cuota_serializer = CuotaSerializer(cuota)
@@ -716,7 +1164,7 @@ class PasswordResetConfirmView(APIView):
             )
 
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=['password'])
 
         return Response({
             "message": "Contraseña actualizada correctamente. Ya podés iniciar sesión."
@@ -765,19 +1213,19 @@ class GoogleLoginView(APIView):
                 )
 
             # Buscar o crear usuario
+            # El usuario nuevo se crea ya con contraseña inutilizable (un solo INSERT)
             user, created = User.objects.get_or_create(
                 email=email,
                 defaults={
                     'username': email.split('@')[0],
                     'first_name': first_name,
-                    'last_name': last_name
+                    'last_name': last_name,
+                    'password': make_password(None)
                 }
             )
 
             if created:
                 # Usuario nuevo: necesita completar perfil (crear contraseña)
-                user.set_unusable_password()
-                user.save()
                 return Response({
                     "require_password": True,
                     "user": {
@@ -857,7 +1305,7 @@ class CompleteProfileView(APIView):
         user.first_name = first_name
         user.last_name = last_name
         user.set_password(password)
-        user.save()
+        user.save(update_fields=['username', 'first_name', 'last_name', 'password'])
 
         return Response({
             "detail": "Perfil completado exitosamente.",
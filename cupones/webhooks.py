@@ -0,0 +1,167 @@
+import hashlib
+import hmac
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EventoPasarela
+from .catalogos import catalogos
+from .conciliacion import buscar_cupones
+from .transiciones import cambiar_estado_cupones
+
+# --- WEBHOOKS DE LAS PASARELAS ---
+# La recepción hace lo mínimo (validar la firma y un INSERT) para aguantar
+# ráfagas; el trabajo pesado lo hace procesar_lote() desde un comando.
+#
+# Cuerpo esperado (JSON):
+#   {"evento_id": "...", "tipo": "pago.aprobado", "id_externo": "...",
+#    "cupon": 123, "monto": "1500.00"}
+# Firma: HMAC-SHA256 del cuerpo con el secreto de la pasarela, en hexadecimal,
+# en el header X-Firma.
+
+TAMANIO_LOTE_EVENTOS = 500
+
+# Clave del resumen de procesar_lote() para los eventos que quedaron
+# pendientes para el lote siguiente
+DIFERIDO = 'diferido'
+
+# Tipo de evento -> estado de cupón al que lleva
+TIPOS_EVENTO = {
+    'pago.aprobado': 'Pagado',
+    'pago.anulado': 'Anulado',
+}
+
+
+class EventoInvalido(Exception):
+    pass
+
+
+def firma_valida(pasarela, cuerpo, firma):
+    """ Compara la firma recibida con el HMAC del cuerpo (en tiempo constante). """
+    secreto = settings.WEBHOOK_SECRETOS.get(pasarela.nombre)
+    if not secreto or not firma:
+        return False
+    esperada = hmac.new(secreto.encode(), cuerpo, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(esperada, firma.strip().lower())
+
+
+def registrar_evento(pasarela, cuerpo):
+    """
+    Guarda la notificación en la bandeja de entrada. Un reenvío del mismo
+    evento_id se descarta en la base (INSERT que ignora el duplicado), sin
+    consultar antes. Lanza EventoInvalido si el cuerpo no es un evento.
+    """
+    try:
+        datos = json.loads(cuerpo)
+    except ValueError:
+        raise EventoInvalido('El cuerpo no es un JSON válido.')
+    if not isinstance(datos, dict) or not datos.get('evento_id'):
+        raise EventoInvalido("Falta el campo 'evento_id'.")
+    if datos.get('tipo') not in TIPOS_EVENTO:
+        raise EventoInvalido(f"Tipo de evento desconocido: '{datos.get('tipo')}'.")
+
+    EventoPasarela.objects.bulk_create([
+        EventoPasarela(
+            pasarela=pasarela,
+            evento_id=str(datos['evento_id'])[:255],
+            tipo=datos['tipo'],
+            payload=cuerpo.decode('utf-8')
+        )
+    ], ignore_conflicts=True)
+
+
+def _leer_evento(evento):
+    """ Devuelve (id_externo, cupon_id, monto) del payload, o lanza EventoInvalido. """
+    datos = json.loads(evento.payload)
+    id_externo = str(datos.get('id_externo') or '').strip() or None
+    try:
+        cupon_id = int(datos['cupon']) if datos.get('cupon') not in (None, '') else None
+        monto = Decimal(str(datos['monto'])) if datos.get('monto') not in (None, '') else None
+    except (TypeError, ValueError, InvalidOperation):
+        raise EventoInvalido('Número de cupón o monto inválido.')
+    if not id_externo and cupon_id is None:
+        raise EventoInvalido("El evento no trae 'id_externo' ni 'cupon'.")
+    return id_externo, cupon_id, monto
+
+
+def procesar_lote(tamanio_lote=TAMANIO_LOTE_EVENTOS):
+    """
+    Toma hasta 'tamanio_lote' eventos pendientes y los aplica, todo en una
+    transacción. Los eventos se bloquean con SKIP LOCKED, así varios workers
+    pueden correr a la vez sin pisarse. Los cambios de estado se hacen por
+    conjunto con transiciones.cambiar_estado_cupones().
+
+    Si un cupón recibe en el mismo lote eventos de distinto tipo, los
+    posteriores quedan pendientes para el lote siguiente (se respeta el orden).
+    Devuelve un dict {estado del evento: cantidad}; los que quedaron
+    pendientes se cuentan en DIFERIDO. Un dict vacío indica que no había
+    eventos pendientes.
+    """
+    ahora = timezone.now()
+    with transaction.atomic():
+        eventos = list(
+            EventoPasarela.objects
+            .select_for_update(skip_locked=True)
+            .filter(estado=EventoPasarela.PENDIENTE)
+            .order_by('id')[:tamanio_lote]
+        )
+        if not eventos:
+            return {}
+
+        leidos = []
+        for evento in eventos:
+            try:
+                leidos.append((evento, _leer_evento(evento)))
+            except (EventoInvalido, ValueError) as e:
+                evento.estado, evento.error = EventoPasarela.ERROR, str(e)
+
+        por_externo, por_id = buscar_cupones(
+            {id_externo for _, (id_externo, _, _) in leidos if id_externo},
+            {cupon_id for _, (_, cupon_id, _) in leidos if cupon_id is not None}
+        )
+
+        tipo_por_cupon = {}
+        grupos = {} # tipo -> {cupon_id: [eventos]}
+        for evento, (id_externo, cupon_id, monto) in leidos:
+            cupon = por_externo.get(id_externo) if id_externo else None
+            if cupon is None and cupon_id is not None:
+                cupon = por_id.get(cupon_id)
+
+            if cupon is None:
+                evento.estado, evento.error = EventoPasarela.ERROR, 'No hay un cupón con ese id externo o número.'
+            elif cupon['pasarela_id'] != evento.pasarela_id:
+                evento.estado, evento.error = EventoPasarela.ERROR, 'El cupón es de otra pasarela.'
+            elif evento.tipo == 'pago.aprobado' and monto is not None and monto != cupon['monto_total']:
+                evento.estado, evento.error = EventoPasarela.ERROR, 'El monto cobrado no coincide con el del cupón.'
+            elif tipo_por_cupon.setdefault(cupon['id'], evento.tipo) != evento.tipo:
+                evento.estado = None # Queda pendiente para el próximo lote
+            else:
+                grupos.setdefault(evento.tipo, {}).setdefault(cupon['id'], []).append(evento)
+
+        for tipo, eventos_por_cupon in grupos.items():
+            estado_nuevo = catalogos.estado_cupon(TIPOS_EVENTO[tipo])
+            motivo = 'Anulado por la pasarela.' if estado_nuevo.nombre == 'Anulado' else None
+            resultados = cambiar_estado_cupones(list(eventos_por_cupon), estado_nuevo, motivo=motivo)
+            for cupon_id, (resultado, detalle) in resultados.items():
+                for evento in eventos_por_cupon[cupon_id]:
+                    if resultado in ('actualizado', 'sin_cambios'):
+                        evento.estado, evento.error = EventoPasarela.PROCESADO, None
+                    else:
+                        evento.estado, evento.error = EventoPasarela.ERROR, detalle
+
+        terminados = [evento for evento in eventos if evento.estado is not None]
+        for evento in terminados:
+            evento.fecha_procesado = ahora
+        EventoPasarela.objects.bulk_update(terminados, ['estado', 'error', 'fecha_procesado'], batch_size=tamanio_lote)
+        EventoPasarela.objects.filter(id__in=[evento.id for evento in eventos]).update(intentos=F('intentos') + 1)
+
+    resumen = {}
+    for evento in terminados:
+        resumen[evento.estado] = resumen.get(evento.estado, 0) + 1
+    if len(terminados) < len(eventos):
+        resumen[DIFERIDO] = len(eventos) - len(terminados)
+    return resumen